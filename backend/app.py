@@ -1,182 +1,70 @@
-from flask import Flask, render_template, jsonify, session, request
-from flask.json.provider import DefaultJSONProvider
+from flask import Flask, Blueprint, render_template, jsonify, session, request
+import importlib
+import logging
 import os
+import time
+from datetime import datetime, timezone
 from bson.objectid import ObjectId
-from db import recipes_collection, chef_collection, user_collection, ingredients_collection, comments_collection, DEFAULT_AVATAR
+from db import configure as configure_db, ensure_indexes, recipes_collection, chef_collection, user_collection, ingredients_collection, comments_collection, DEFAULT_AVATAR, new_revision_fields, insert_document, touch
 from login import login_bp
 from register import register_bp
-from chefBot import chef_bot_bp
-
-# json encoder to handle objectid serialization for mongodb documents
-class MongoJSONProvider(DefaultJSONProvider):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        return super().default(o)
-
-app = Flask(
-    __name__,
-    template_folder="../frontend/pages/html", # Path to HTML it's different from default
-    static_folder="../frontend", # Path to static files (assets, css, js)
-    static_url_path='' # Serve static files at the root URL to semplify access
-)
-
-# configure json serialization provider for mongodb objectid support
-app.json = MongoJSONProvider(app)
-
-# set secure session key
-app.secret_key = os.getenv("SECRET_KEY", "supersecretkey")
-
-# register flask blueprints for modular routes
-app.register_blueprint(register_bp)
-app.register_blueprint(login_bp)
-app.register_blueprint(chef_bot_bp)
+from chefBot import chef_bot_bp, get_client as get_chef_bot_client
+from serialization import FastJSONProvider
+from caching import doc_version, collection_version, make_etag, not_modified, cacheable
+from assets import init_assets
+from logs import setup_logging
+from metrics import init_metrics
+from profiling import init_profiling
+from health import init_health
+from routing import init_routing
+from negotiation import init_negotiation
+from jobs import handler, enqueue
+from validation import ValidationError, safe_objectid, validate_recipe, build_recipe_doc
+from recommendations import similar_recipes
+from facets import search as facet_search
+from leaderboards import ranking, parse_page
+from models import Chef, CARD_FIELDS, VIEW_PROJECTIONS, load_recipes, render_recipes
+from recipe_pages import recipe_detail, recipe_version, session_info, recipe_page as render_recipe_page
+import retrieval
+import snapshot
+from sync import record_tombstone, server_time, to_checkpoint, from_checkpoint, checkpoint_expired, changed_since, deleted_since, encode_checkpoint, decode_checkpoint
+
+logger = logging.getLogger("app")
+
+# every route of this module, registered on the app by create_app()
+main_bp = Blueprint("main_bp", __name__)
 
 # HELPER FUNCTIONS SECTION
 def get_user_avatar(user_avatar):
     return user_avatar if user_avatar else DEFAULT_AVATAR
 
-def safe_objectid(id_val):
-    try:
-        return ObjectId(id_val) if isinstance(id_val, str) else id_val
-    except:
-        return None
-
-def is_item_in_list(item_id, items_list):
-    for item in items_list:
-        check_id = item.get('recipeId') or item.get('chefId') if isinstance(item, dict) else item
-        if str(check_id) == str(item_id):
-            return True
-    return False
-
-# Data Enrichment Functions
-def enrich_recipe(recipe):
-    recipe["_id"] = str(recipe["_id"])
-
-    # fetch and attach chef metadata
-    if "chef_id" in recipe and recipe["chef_id"]:
-        chef = chef_collection.find_one({"_id": ObjectId(recipe["chef_id"])})
+def attach_chefs(cards):
+    # chef names and avatars for the explore cards (built by facets.py) in one query
+    chef_ids = {card["chef_id"] for card in cards if card.get("chef_id")}
+    if not chef_ids:
+        return cards
+    chefs = snapshot.chefs(chef_ids)
+    missing = [chef_id for chef_id in chef_ids if str(chef_id) not in chefs]
+    if missing:
+        chefs.update(
+            (str(chef["_id"]), chef)
+            for chef in chef_collection.find({"_id": {"$in": missing}}, {"user_name": 1, "user_avatar": 1})
+        )
+    for card in cards:
+        chef = chefs.get(str(card.get("chef_id")))
         if chef:
-            recipe["user_name"] = chef.get("user_name", "Unknown")
-            recipe["user_avatar"] = chef.get("user_avatar", "")
-        recipe["chef_id"] = str(recipe["chef_id"])
-
-    # batch load ingredient details from database
-    if "ingredients" in recipe and isinstance(recipe["ingredients"], list):
-        # collect valid ingredient objectids for batch query
-        ingredient_obj_ids = []
-        for ingredient_data in recipe["ingredients"]:
-            iid = ingredient_data.get("ingredientId")
-            if iid:
-                try:
-                    oid = iid if isinstance(iid, ObjectId) else ObjectId(iid)
-                    ingredient_obj_ids.append(oid)
-                except Exception:
-                    # if id conversion fails, skip this ingredient
-                    pass
-
-        # fetch all ingredient documents in single query
-        docs_by_id = {}
-        if ingredient_obj_ids:
-            docs = list(ingredients_collection.find({"_id": {"$in": ingredient_obj_ids}}))
-            # create index map for efficient ingredient lookup by string id
-            docs_by_id = {str(doc["_id"]): doc for doc in docs}
-
-        # map retrieved ingredient data onto recipe ingredients
-        for ingredient_data in recipe["ingredients"]:
-            iid = ingredient_data.get("ingredientId")
-            ingredient_doc = None
-            if iid:
-                key = str(iid)
-                ingredient_doc = docs_by_id.get(key)
-
-            if ingredient_doc:
-                # use ingredientname from db, fallback to name field
-                ing_name = ingredient_doc.get("ingredientName", ingredient_doc.get("name", "Unknown Ingredient"))
-                ingredient_data["name"] = ing_name
-                # also set ingredient field for frontend compatibility
-                ingredient_data["ingredient"] = ing_name
-                ingredient_data["unit"] = ingredient_doc.get("unit", "")
-                # attach nutritional values (defaults to 0 if missing)
-                ingredient_data["protein"] = ingredient_doc.get("protein", 0)
-                ingredient_data["carbs"] = ingredient_doc.get("carbs", 0)
-                ingredient_data["fats"] = ingredient_doc.get("fats", 0)
-                ingredient_data["calories"] = ingredient_doc.get("calories", 0)
-                # include scientific description if available
-                ingredient_data["scientificDescription"] = ingredient_doc.get("scientificDescription", "")
-
-            # normalize ingredient id to string for json output
-            ingredient_data["ingredientId"] = str(iid) if iid is not None else iid
-            # ensure description field exists (safe fallback)
-            ingredient_data["scientificDescription"] = ingredient_data.get("scientificDescription", "")
-        
-        # Calculate total nutritional values for entire recipe
-        total_calories = total_protein = total_carbs = total_fats = 0.0
-        
-        # make a safe float conversion function
-        def _safe_float(value):
-            try:
-                if isinstance(value, str):
-                    return float(value.replace(",", ".").strip())
-                return float(value)
-            except Exception:
-                return 0.0
-
-        for ingredient_data in recipe["ingredients"]:
-            # Convert ingredient quantity to float (defaults to 0 if invalid)
-            qty_val = _safe_float(ingredient_data.get("quantity", 0))
-
-            # Get nutritional values from database (per 100g units)
-            protein_db = _safe_float(ingredient_data.get("protein", 0))
-            carbs_db = _safe_float(ingredient_data.get("carbs", 0))
-            fats_db = _safe_float(ingredient_data.get("fats", 0))
-            calories_db = _safe_float(ingredient_data.get("calories", 0))
-
-            # Calculate actual nutrition for this recipe's quantity
-            # Using proportion math: (nutrient per 100g) * (qty in grams) / 100
-            protein_calc = (protein_db * qty_val) / 100.0
-            carbs_calc = (carbs_db * qty_val) / 100.0
-            fats_calc = (fats_db * qty_val) / 100.0
-            calories_calc = (calories_db * qty_val) / 100.0
-
-            # Accumulate totals for recipe summary
-            total_protein += protein_calc
-            total_carbs += carbs_calc
-            total_fats += fats_calc
-            total_calories += calories_calc
-
-            # Attach calculated values to ingredient for frontend display
-            ingredient_data["calculated_nutrition"] = {
-                "protein": round(protein_calc, 2),
-                "carbs": round(carbs_calc, 2),
-                "fats": round(fats_calc, 2),
-                "calories": round(calories_calc, 2),
-                "quantity": qty_val
-            }
-
-        recipe["calories"] = int(round(total_calories))
-        recipe["protein"] = int(round(total_protein))
-        recipe["carbs"] = int(round(total_carbs))
-        recipe["fats"] = int(round(total_fats))
-    return recipe
-
-# define function to get all recipes with enrichment
-def get_recipes_from_db():
-    recipes = list(recipes_collection.find({}))
-
-    for recipe in recipes:
-        enrich_recipe(recipe)
-        # Remove data not needed in list view for optimization
-        recipe.pop("commentsList", None)
-        recipe.pop("ingredients", None)
-        recipe.pop("calories", None)
-        recipe.pop("protein", None)
-        recipe.pop("carbs", None)
-        recipe.pop("fats", None)
+            card["user_name"] = chef.get("user_name", "Unknown")
+            card["user_avatar"] = get_user_avatar(chef.get("user_avatar"))
+    return cards
 
-    return recipes
+def recipe_cards(recipe_ids):
+    # card views for the given ids, in the same order
+    by_id = {card["_id"]: card for card in load_recipes({"_id": {"$in": list(recipe_ids)}}, "card")}
+    return [by_id[rid] for rid in recipe_ids if rid in by_id]
 
 # Rating and Calculation Functions
+# derived data is updated by background jobs (see jobs.py), handlers must stay idempotent
+@handler("update_recipe_rating")
 def update_recipe_average_rating(recipe_id):
     try:
         # convert recipe_id to objectid if needed
@@ -189,7 +77,7 @@ def update_recipe_average_rating(recipe_id):
         recipe = recipes_collection.find_one({"_id": recipe_id_obj})
         
         if not recipe:
-            print(f"recipe with id {recipe_id} not found")
+            logger.warning("recipe with id %s not found", recipe_id)
             return
         
         # get the comments list (ids)
@@ -199,32 +87,21 @@ def update_recipe_average_rating(recipe_id):
         if not comments_list or len(comments_list) == 0:
             recipes_collection.update_one(
                 {"_id": recipe_id_obj},
-                {"$set": {"rating": 0}}
+                touch({"$set": {"rating": 0}})
             )
-            print(f"no comments found. rating set to 0 for recipe {recipe_id}")
+            logger.debug("no comments found. rating set to 0 for recipe %s", recipe_id)
             return
         
-        # convert comment ids to objectid
-        comment_obj_ids = []
-        for comment_id in comments_list:
-            try:
-                if isinstance(comment_id, str):
-                    comment_obj_ids.append(ObjectId(comment_id))
-                else:
-                    comment_obj_ids.append(comment_id)
-            except Exception as e:
-                print(f"error converting comment id {comment_id}: {e}")
-        
-        # fetch all comment documents using $in
+        # fetch all comment documents using $in (ids are ObjectIds, see migrate_ids.py)
         comments = list(comments_collection.find({
-            "_id": {"$in": comment_obj_ids}
+            "_id": {"$in": comments_list}
         }))
         
         if not comments or len(comments) == 0:
-            print(f"no comment documents found for recipe {recipe_id}")
+            logger.debug("no comment documents found for recipe %s", recipe_id)
             recipes_collection.update_one(
                 {"_id": recipe_id_obj},
-                {"$set": {"rating": 0}}
+                touch({"$set": {"rating": 0}})
             )
             return
         
@@ -241,7 +118,7 @@ def update_recipe_average_rating(recipe_id):
                     total_rate += rate_value
                     valid_comments_count += 1
                 except (ValueError, TypeError) as e:
-                    print(f"error converting rate {rate}: {e}")
+                    logger.warning("error converting rate %s: %s", rate, e)
         
         # calculate average and round to 1 decimal place
         if valid_comments_count > 0:
@@ -252,30 +129,45 @@ def update_recipe_average_rating(recipe_id):
         # update the recipe rating field
         recipes_collection.update_one(
             {"_id": recipe_id_obj},
-            {"$set": {"rating": average_rating}}
+            touch({"$set": {"rating": average_rating}})
         )
         
-        print(f"rating updated for recipe {recipe_id}: {average_rating} (based on {valid_comments_count} comments)")
+        logger.debug("rating updated for recipe %s: %s (based on %s comments)", recipe_id, average_rating, valid_comments_count)
     
     except Exception as e:
-        print(f"error updating rating for recipe {recipe_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error("error updating rating for recipe %s: %s", recipe_id, e)
+        # let the job queue retry
+        raise
+
+@handler("add_recipe_to_chef")
+def add_recipe_to_chef(chef_id, recipe_id):
+    recipe_obj = ObjectId(recipe_id)
+    # the recipe may have been deleted before the job ran
+    if not recipes_collection.count_documents({"_id": recipe_obj}, limit=1):
+        return
+    # the filter makes a repeated run a no-op (no duplicate, no revision bump)
+    chef_collection.update_one(
+        {"_id": ObjectId(chef_id), "recipeList": {"$ne": recipe_obj}},
+        touch({"$push": {"recipeList": recipe_obj}})
+    )
 
 # API ROUTES SECTION
 # Recipe Management Routes
-@app.route("/api/recipes", methods=["GET"])
+@main_bp.route("/api/recipes", methods=["GET"])
 def api_recipes():
     try:
-        recipes = get_recipes_from_db()
-        return jsonify(recipes)
+        # the list depends on every recipe and on chef names/avatars
+        etag = make_etag("recipes", collection_version(recipes_collection), collection_version(chef_collection))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        return cacheable(jsonify(load_recipes({}, "card")), etag)
     except Exception as e:
-        print(f"Error fetching recipes: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error fetching recipes: %s", e)
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-@app.route("/api/recipes", methods=["POST"])
+@main_bp.route("/api/recipes", methods=["POST"])
 def api_create_recipe():
     # Check if user is logged in
     if 'user_id' not in session:
@@ -284,68 +176,28 @@ def api_create_recipe():
     try:
         data = request.get_json()
         
-        # validate required fields
-        if not data.get('title'):
-            return jsonify({'error': 'Title is required'}), 400
-        if not data.get('image'):
-            return jsonify({'error': 'Cover image is required'}), 400
-        if not data.get('ingredients') or len(data['ingredients']) == 0:
-            return jsonify({'error': 'At least one ingredient is required'}), 400
-        if not data.get('preparationSteps') or len(data['preparationSteps']) == 0:
-            return jsonify({'error': 'At least one preparation step is required'}), 400
-        
-        # validate difficulty is between 1 and 5
+        # validate required fields and difficulty (rules shared with the bulk importer)
         try:
-            difficulty_val = int(data.get('difficulty', 3))
-            if difficulty_val < 1 or difficulty_val > 5:
-                return jsonify({'error': 'Difficulty must be between 1 and 5'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid difficulty value'}), 400
+            difficulty_val = validate_recipe(data)
+        except ValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         # get chef_id from session
         chef_id = session.get('user_id')
         
         # build recipe document
-        recipe_doc = {
-            'title': data.get('title', ''),
-            'description': data.get('description', ''),
-            'image': data.get('image', ''),
-            'time': data.get('time', ''),
-            'difficulty': difficulty_val,
-            'tags': data.get('tags', []),
-            'ingredients': [],
-            'preparationSteps': data.get('preparationSteps', []),
-            'chef_id': ObjectId(chef_id),
-            'ratings': []
-        }
-        
-        # convert ingredient-id to objectid
-        for ing in data.get('ingredients', []):
-            ing_id = safe_objectid(ing.get('ingredient-id'))
-            recipe_doc['ingredients'].append({
-                'quantity': ing.get('quantity', ''),
-                'ingredientId': ing_id
-            })
+        recipe_doc = build_recipe_doc(data, chef_id, difficulty_val)
         
         # insert recipe into database
-        result = recipes_collection.insert_one(recipe_doc)
-        inserted_id = result.inserted_id
+        inserted_id = insert_document(recipes_collection, recipe_doc)
         
-        # add recipe id to chef's recipe list
-        chef_collection.update_one(
-            {"_id": ObjectId(chef_id)},
-            {"$push": {"recipeList": inserted_id}}
-        )
+        # add recipe id to chef's recipe list (in background)
+        enqueue("add_recipe_to_chef", str(chef_id), str(inserted_id))
+        enqueue("update_recipe_similarity", str(inserted_id))
         
-        # prepare response
+        # prepare response (ids are serialized by the json provider)
         response_recipe = recipe_doc.copy()
-        response_recipe['_id'] = str(inserted_id)
-        response_recipe['chef_id'] = str(response_recipe['chef_id'])
-        
-        # convert ingredient objectids to strings
-        for ing in response_recipe.get('ingredients', []):
-            if ing.get('ingredientId'):
-                ing['ingredientId'] = str(ing['ingredientId'])
+        response_recipe['_id'] = inserted_id
         
         return jsonify({
             'status': 'success',
@@ -354,10 +206,41 @@ def api_create_recipe():
         }), 201
         
     except Exception as e:
-        print(f'Error creating recipe: {e}')
+        logger.error("Error creating recipe: %s", e)
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-@app.route("/api/recipes/<recipe_id>", methods=["GET"])
+@main_bp.route("/api/recipes/trending", methods=["GET"])
+def api_recipes_trending():
+    return _leaderboard_response("trending")
+
+@main_bp.route("/api/recipes/top", methods=["GET"])
+def api_recipes_top():
+    by = request.args.get("by", "rating")
+    if by not in ("rating", "favorites"):
+        return jsonify({"error": "by must be rating or favorites"}), 400
+    return _leaderboard_response(by)
+
+def _leaderboard_response(name):
+    # one indexed range read on the leaderboard plus one query per collection
+    # for the cards (see leaderboards.py)
+    try:
+        page, page_size = parse_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        rows, has_more = ranking(name, page, page_size)
+        cards = recipe_cards([recipe_id for recipe_id, _ in rows])
+        stats = dict(rows)
+        results = []
+        for card in cards:
+            row = stats[card["_id"]]
+            results.append(dict(card, favorites=row.get("favorites", 0), rating_count=row.get("rating_count", 0)))
+        return jsonify({"page": page, "page_size": page_size, "has_more": has_more, "results": results})
+    except Exception as e:
+        logger.error("Error fetching %s leaderboard: %s", name, e)
+        return jsonify({'error': 'server error'}), 500
+
+@main_bp.route("/api/recipes/<recipe_id>", methods=["GET"])
 def api_recipe_detail(recipe_id):
     recipe_obj = safe_objectid(recipe_id)
     if not recipe_obj:
@@ -366,31 +249,59 @@ def api_recipe_detail(recipe_id):
     recipe = recipes_collection.find_one({"_id": recipe_obj})
     if not recipe:
         return jsonify({"error": "Recipe not found"}), 404
-    
-    enrich_recipe(recipe)
-    
-    # fetch comments for this recipe
-    comments_list = recipe.get("commentsList", [])
-    recipe["comments"] = []
-    
-    if comments_list:
-        comment_ids = [safe_objectid(cid) for cid in comments_list if safe_objectid(cid)]
-        if comment_ids:
-            comments = list(comments_collection.find(
-                {"_id": {"$in": comment_ids}},
-                sort=[("created_at", -1)]
-            ))
-            for comment in comments:
-                comment["_id"] = str(comment["_id"])
-                comment["user_id"] = str(comment["user_id"])
-                comment["recipe_id"] = str(comment["recipe_id"])
-                comment.pop("created_at", None)
-            recipe["comments"] = comments
-    
-    return jsonify(recipe)
+
+    # validate the client copy before doing any enrichment work
+    version, chefs = recipe_version(recipe)
+    etag = make_etag("recipe", recipe_obj, *version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # detail view with the comments (see recipe_pages.py)
+    return cacheable(jsonify(recipe_detail(recipe, chefs)), etag)
+
+
+@main_bp.route("/api/recipes/<recipe_id>/similar", methods=["GET"])
+def api_similar_recipes(recipe_id):
+    recipe_obj = safe_objectid(recipe_id)
+    if not recipe_obj:
+        return jsonify({"error": "Invalid recipe ID"}), 400
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    # neighbours are precomputed (see recommendations.py)
+    table_row = similar_recipes(recipe_obj)
+    if table_row is None:
+        if not recipes_collection.count_documents({"_id": recipe_obj}, limit=1):
+            return jsonify({"error": "Recipe not found"}), 404
+        # not indexed yet (created before the last rebuild), fill it in
+        # background; identical pending jobs are coalesced
+        enqueue("fill_recipe_similarity", str(recipe_obj))
+        return jsonify([])
+
+    neighbours = table_row.get("neighbours", [])[:limit]
+    etag = make_etag("similar", recipe_obj, limit, doc_version(table_row), collection_version(recipes_collection))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # one query for the cards, in ranking order
+    scores = {str(n["recipe_id"]): n["score"] for n in neighbours}
+    cards = recipes_collection.find(
+        {"_id": {"$in": [n["recipe_id"] for n in neighbours]}},
+        {"title": 1, "image": 1, "time": 1, "difficulty": 1, "tags": 1, "rating": 1, "chef_id": 1}
+    )
+    results = []
+    for card in cards:
+        card["score"] = scores[str(card["_id"])]
+        results.append(card)
+    results.sort(key=lambda card: -card["score"])
+    return cacheable(jsonify(results), etag)
 
 
-@app.route("/api/recipes/<recipe_id>", methods=["DELETE"])
+@main_bp.route("/api/recipes/<recipe_id>", methods=["DELETE"])
 def api_delete_recipe(recipe_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized. Please log in.'}), 401
@@ -408,15 +319,18 @@ def api_delete_recipe(recipe_id):
         return jsonify({'error': 'You can only delete your own recipes'}), 403
     
     recipes_collection.delete_one({"_id": recipe_obj})
+    record_tombstone("recipes", recipe_obj)
     chef_collection.update_one(
         {"_id": chef_id_session},
-        {"$pull": {"recipeList": recipe_obj}}
+        touch({"$pull": {"recipeList": recipe_obj}})
     )
+    enqueue("remove_recipe_similarity", str(recipe_obj))
+    enqueue("refresh_recipe_scores", str(recipe_obj))
     
     return jsonify({'status': 'success', 'message': 'Recipe deleted successfully'})
 
 
-@app.route("/api/recipes/<recipe_id>/comments", methods=["POST"])
+@main_bp.route("/api/recipes/<recipe_id>/comments", methods=["POST"])
 def api_add_comment(recipe_id):
     # Require authentication
     if 'user_id' not in session:
@@ -463,42 +377,41 @@ def api_add_comment(recipe_id):
             'user_name': user_name or 'User',
             'user_avatar': user_avatar or '',
             'description': description,
-            'rate': rate_val
+            'rate': rate_val,
+            **new_revision_fields()
         }
     except Exception:
         return jsonify({'error': 'Invalid recipe id or user id'}), 400
 
     # insert and return created object (with safe serialization)
     try:
-        res = comments_collection.insert_one(comment_doc)
-        inserted_id = getattr(res, 'inserted_id', None)
+        inserted_id = insert_document(comments_collection, comment_doc)
         
         # Update recipe to add comment ID to commentsList array
         if inserted_id:
             try:
                 recipes_collection.update_one(
                     {"_id": ObjectId(recipe_id)},
-                    {"$push": {"commentsList": inserted_id}}
+                    touch({"$push": {"commentsList": inserted_id}})
                 )
             except Exception as e:
-                print(f'Error updating recipe commentsList: {e}')
+                logger.error("Error updating recipe commentsList: %s", e)
                 # Continue anyway because the comment was created successfully
             
-            # update the recipe's rating average in real time
-            update_recipe_average_rating(recipe_id)
+            # update the recipe's rating average and leaderboard scores in background
+            enqueue("update_recipe_rating", str(recipe_id))
+            enqueue("refresh_recipe_scores", str(recipe_id))
         
         out = comment_doc.copy()
-        out['_id'] = str(inserted_id) if inserted_id is not None else ''
-        out['recipe_id'] = str(out['recipe_id'])
-        out['user_id'] = str(out['user_id'])
+        out['_id'] = inserted_id if inserted_id is not None else ''
 
         return jsonify({'status': 'success', 'comment': out}), 201
     except Exception as e:
-        print('Error inserting comment:', e)
+        logger.error("Error inserting comment: %s", e)
         return jsonify({'error': 'Database error'}), 500
 
 
-@app.route("/api/recipes/<recipe_id>/comments/<comment_id>", methods=["DELETE"])
+@main_bp.route("/api/recipes/<recipe_id>/comments/<comment_id>", methods=["DELETE"])
 def api_delete_comment(recipe_id, comment_id):
     # Require authentication
     if 'user_id' not in session:
@@ -523,42 +436,28 @@ def api_delete_comment(recipe_id, comment_id):
         # Remove comment ID from recipe's commentsList
         recipes_collection.update_one(
             {"_id": ObjectId(recipe_id)},
-            {"$pull": {"commentsList": ObjectId(comment_id)}}
+            touch({"$pull": {"commentsList": ObjectId(comment_id)}})
         )
         
-        # Update recipe's average rating
-        update_recipe_average_rating(recipe_id)
+        # Update recipe's average rating and leaderboard scores in background
+        enqueue("update_recipe_rating", str(recipe_id))
+        enqueue("refresh_recipe_scores", str(recipe_id))
         
         return jsonify({'status': 'success'}), 200
         
     except Exception as e:
-        print('Error deleting comment:', e)
+        logger.error("Error deleting comment: %s", e)
         return jsonify({'error': 'Database error'}), 500
 
 
 # Session And Profile Routes
-@app.route('/api/session')
+@main_bp.route('/api/session')
 def api_session():
-    if 'user_id' not in session:
-        return jsonify({'logged_in': False})
-
-    user_id = session.get('user_id')
-    role = session.get('role')
-    collection = user_collection if role == 'user' else chef_collection
-    
-    user = collection.find_one({"_id": ObjectId(user_id)})
-    
-    return jsonify({
-        'logged_in': True,
-        'user_id': user_id,
-        'user_name': (user.get("nickname") or user.get("user_name") or user.get("email", "")) if user else session.get('user_name', 'User'),
-        'user_avatar': get_user_avatar(user.get("user_avatar", "") if user else session.get('user_avatar', '')),
-        'role': role,
-        'followed_chefs_count': len(user.get('followedChefs', [])) if user and isinstance(user.get('followedChefs'), list) else 0
-    })
+    # shared with the prerendered recipe pages (see recipe_pages.py)
+    return jsonify(session_info()[0])
 
 # Route to update user profile
-@app.route('/api/update_profile', methods=['POST'])
+@main_bp.route('/api/update_profile', methods=['POST'])
 def api_update_profile():
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
@@ -580,7 +479,7 @@ def api_update_profile():
     if user_avatar:
         update_data['user_avatar'] = user_avatar
 
-    result = collection.update_one({"_id": user_obj_id}, {"$set": update_data})
+    result = collection.update_one({"_id": user_obj_id}, touch({"$set": update_data}))
     
     if result.matched_count == 0:
         return jsonify({'error': 'User not found'}), 404
@@ -597,12 +496,17 @@ def api_update_profile():
     })
 
 # Search Routes
-@app.route('/api/ingredients/search')
+@main_bp.route('/api/ingredients/search')
 def api_ingredients_search():
     q = request.args.get('q', '')
     if not q:
         return jsonify([])
 
+    # answered from the catalog snapshot unless ingredients changed since
+    results = snapshot.search_ingredients(q)
+    if results is not None:
+        return jsonify(results)
+
     # non case sensitive regex search on possible name fields
     regex = {"$regex": q, "$options": "i"}
     query = {"$or": [{"name": regex}, {"ingredientName": regex}]}
@@ -613,16 +517,16 @@ def api_ingredients_search():
         for doc in cursor:
             name = doc.get('ingredientName') or doc.get('name') or ''
             results.append({
-                '_id': str(doc.get('_id')),
+                '_id': doc.get('_id'),
                 'name': name,
                 'unit': doc.get('unit', '')
             })
         return jsonify(results)
     except Exception as e:
-        print(f"Error in /api/ingredients/search: {e}")
+        logger.error("Error in /api/ingredients/search: %s", e)
         return jsonify({'error': 'server error'}), 500
 
-@app.route('/api/search')
+@main_bp.route('/api/search')
 def api_search():
     q = request.args.get('q', '') or ''
     q = q.strip()
@@ -631,18 +535,138 @@ def api_search():
 
     try:
         regex = {"$regex": q, "$options": "i"}
-        cursor = recipes_collection.find({"title": regex})
-        results = []
-        for recipe in cursor:
-            enrich_recipe(recipe)
-            results.append(recipe)
-        return jsonify(results)
+        return jsonify(load_recipes({"title": regex}, "card"))
+    except Exception as e:
+        logger.error("Error in /api/search: %s", e)
+        return jsonify({'error': 'server error'}), 500
+
+@main_bp.route('/api/explore')
+def api_explore():
+    # filtered, sorted and paginated recipes plus facet counts (see facets.py)
+    try:
+        result = facet_search(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error in /api/search: {e}")
+        logger.error("Error in /api/explore: %s", e)
+        return jsonify({'error': 'server error'}), 500
+
+    attach_chefs(result["results"])
+    return jsonify(result)
+
+# Batch Routes
+# max ids per collection in one /api/batch call, and max recipes resolved
+# once the recipes of the requested chefs (chef_recipes=true) are added
+BATCH_MAX_IDS = 100
+BATCH_MAX_RECIPES = 500
+CHEF_PUBLIC_FIELDS = ("user_name", "nickname", "user_avatar", "bio", "info", "followers", "recipes_count")
+
+def _batch_list(value, limit=BATCH_MAX_IDS):
+    # list or comma separated string, duplicates dropped, request order kept;
+    # ValueError above limit items, checked before anything else is done
+    if isinstance(value, str):
+        value = value.split(",", limit)
+    value = value or []
+    if len(value) > limit:
+        raise ValueError(f"more than {limit} items")
+    return list(dict.fromkeys(item for item in (str(item).strip() for item in value) if item))
+
+def _batch_chefs(tokens, fields, include_recipes):
+    # returns ({token: chef or None}, [recipe ids of the found chefs], versions)
+    ids_by_token = {token: safe_objectid(session.get('user_id') if token == 'me' else token) for token in tokens}
+    wanted = [oid for oid in ids_by_token.values() if isinstance(oid, ObjectId)]
+    docs = {}
+    if wanted:
+        projection = {field: 1 for field in CHEF_PUBLIC_FIELDS if field != "recipes_count"}
+        projection.update({"recipeList": 1, "revision": 1, "updated_at": 1})
+        docs = {doc["_id"]: doc for doc in chef_collection.find({"_id": {"$in": wanted}}, projection)}
+
+    chefs, recipe_ids, versions = {}, [], []
+    for token, oid in ids_by_token.items():
+        doc = docs.get(oid)
+        if not doc:
+            chefs[token] = None
+            continue
+        chef_model = Chef.from_doc(doc)
+        versions.append(f"{oid}:{chef_model.version}")
+        chef = chef_model.profile()
+        if fields:
+            chef = {key: value for key, value in chef.items() if key == "_id" or key in fields}
+        if include_recipes:
+            chef["recipes"] = chef_model.recipe_ids
+            recipe_ids.extend(str(rid) for rid in chef_model.recipe_ids)
+        chefs[token] = chef
+    return chefs, recipe_ids, versions
+
+def _batch_recipes(tokens, fields):
+    # returns ({token: recipe document or None}, versions, view); the card view
+    # is enough when every requested field is part of it
+    ids_by_token = {token: safe_objectid(token) for token in tokens}
+    wanted = [oid for oid in ids_by_token.values() if isinstance(oid, ObjectId)]
+    view = "card" if fields and set(fields) <= set(CARD_FIELDS) else "detail"
+    docs = {doc["_id"]: doc for doc in recipes_collection.find({"_id": {"$in": wanted}}, VIEW_PROJECTIONS[view])} if wanted else {}
+
+    recipes = {token: docs.get(oid) for token, oid in ids_by_token.items()}
+    versions = [f"{oid}:{doc_version(doc)}" for oid, doc in docs.items()]
+    return recipes, versions, view
+
+def _finish_recipes(recipes, fields, view):
+    # views are rendered once the client copy is known to be stale
+    tokens = [token for token, doc in recipes.items() if doc is not None]
+    views = render_recipes([recipes[token] for token in tokens], view)
+    for token, rendered in zip(tokens, views):
+        if fields:
+            rendered = {key: value for key, value in rendered.items() if key == "_id" or key in fields}
+        recipes[token] = rendered
+    return recipes
+
+@main_bp.route('/api/batch', methods=['GET', 'POST'])
+def api_batch():
+    # resolve many recipes and chefs in one round trip, with one query per
+    # collection. Parameters (query string or JSON body):
+    #   recipes=id,id  chefs=id,me  recipe_fields=title,image  chef_fields=user_name
+    #   chef_recipes=true also returns the recipes of the requested chefs
+    #   at most BATCH_MAX_RECIPES recipes are resolved, chef recipes included
+    payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        recipe_tokens = _batch_list(payload.get('recipes'))
+        chef_tokens = _batch_list(payload.get('chefs'))
+        recipe_fields = _batch_list(payload.get('recipe_fields'))
+        chef_fields = _batch_list(payload.get('chef_fields'))
+    except (TypeError, ValueError):
+        return jsonify({'error': f'At most {BATCH_MAX_IDS} ids per collection'}), 400
+    chef_recipes = str(payload.get('chef_recipes', 'false')).lower() == 'true'
+    # "me" depends on the session, the response must not be shared
+    public = 'me' not in chef_tokens
+
+    try:
+        chefs, chef_recipe_ids, chef_versions = _batch_chefs(chef_tokens, chef_fields, chef_recipes)
+        # chef recipe ids past the limit are listed but not resolved
+        recipe_tokens = list(dict.fromkeys(recipe_tokens + chef_recipe_ids))[:BATCH_MAX_RECIPES]
+        recipes, recipe_versions, view = _batch_recipes(recipe_tokens, recipe_fields)
+
+        # GET responses can be revalidated before enrichment and serialization
+        etag = None
+        if request.method == 'GET':
+            etag_parts = ["batch", sorted(payload.items()), None if public else session.get('user_id')]
+            etag_parts += chef_versions + recipe_versions
+            if recipe_versions:
+                etag_parts.append(collection_version(chef_collection))
+                if view == "detail":
+                    etag_parts.append(collection_version(ingredients_collection))
+            etag = make_etag(*etag_parts)
+            cached = not_modified(etag, public=public)
+            if cached:
+                return cached
+
+        result = jsonify({'recipes': _finish_recipes(recipes, recipe_fields, view), 'chefs': chefs})
+        return cacheable(result, etag, public=public) if etag else result
+    except Exception as e:
+        logger.error("Error in /api/batch: %s", e)
         return jsonify({'error': 'server error'}), 500
 
 # Favorites Routes
-@app.route('/api/user/favorites')
+@main_bp.route('/api/user/favorites')
 def api_user_favorites():
     # verify that the user is logged in
     if 'user_id' not in session:
@@ -659,47 +683,20 @@ def api_user_favorites():
         if not user_doc:
             return jsonify({'error': 'User not found'}), 404
 
-        # Extract the favorites array
-        favorites = user_doc.get('favorites', [])
-        
-        if not favorites:
-            return jsonify([])
-
-        # convert the ids in the array to objectid
-        favorite_obj_ids = []
-        for fav_item in favorites:
-            try:
-                if isinstance(fav_item, dict):
-                    fav_id = fav_item.get('recipeId')
-                else:
-                    fav_id = fav_item
-                
-                if fav_id:
-                    oid = fav_id if isinstance(fav_id, ObjectId) else ObjectId(fav_id)
-                    favorite_obj_ids.append(oid)
-            except Exception as e:
-                # skip ids that cannot be converted
-                print(f"Skipping invalid favorite item {fav_item}: {e}")
-                continue
+        # favorites are {recipeId: ObjectId, added_at} (see migrate_ids.py)
+        favorite_obj_ids = [fav['recipeId'] for fav in user_doc.get('favorites') or []]
 
         if not favorite_obj_ids:
             return jsonify([])
 
-        # Execute query to fetch recipes
-        recipes_cursor = recipes_collection.find({"_id": {"$in": favorite_obj_ids}})
-        favorite_recipes = list(recipes_cursor)
-
-        # Pass each recipe through the enrich_recipe function
-        for recipe in favorite_recipes:
-            enrich_recipe(recipe)
-
-        return jsonify(favorite_recipes), 200
+        # card views, built only for recipes not rendered yet (see models.py)
+        return jsonify(load_recipes({"_id": {"$in": favorite_obj_ids}}, "card")), 200
 
     except Exception as e:
-        print(f"Error in /api/user/favorites: {e}")
+        logger.error("Error in /api/user/favorites: %s", e)
         return jsonify({'error': 'Server error'}), 500
 
-@app.route('/api/user/favorites/toggle', methods=['POST'])
+@main_bp.route('/api/user/favorites/toggle', methods=['POST'])
 def api_toggle_favorite():
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
@@ -722,21 +719,22 @@ def api_toggle_favorite():
     if not user_doc:
         return jsonify({'error': 'User not found'}), 404
 
-    favorites = user_doc.get('favorites', [])
-    is_in_favorites = is_item_in_list(recipe_obj_id, favorites)
+    is_in_favorites = any(fav['recipeId'] == recipe_obj_id for fav in user_doc.get('favorites') or [])
 
     if is_in_favorites:
-        new_favorites = [f for f in favorites if str(f.get('recipeId') if isinstance(f, dict) else f) != str(recipe_obj_id)]
-        collection.update_one({"_id": user_obj_id}, {"$set": {"favorites": new_favorites}})
+        collection.update_one({"_id": user_obj_id}, touch({"$pull": {"favorites": {"recipeId": recipe_obj_id}}}))
         is_favorited = False
     else:
-        collection.update_one({"_id": user_obj_id}, {"$push": {"favorites": {"recipeId": recipe_obj_id}}})
+        # added_at feeds the trending leaderboard
+        collection.update_one({"_id": user_obj_id}, touch({"$push": {"favorites": {"recipeId": recipe_obj_id, "added_at": datetime.now(timezone.utc)}}}))
         is_favorited = True
 
+    enqueue("refresh_recipe_scores", str(recipe_obj_id))
+
     return jsonify({'is_favorited': is_favorited})
 
 # Followed Chefs Routes
-@app.route('/api/recipes/followed')
+@main_bp.route('/api/recipes/followed')
 def api_recipes_followed():
     # verify that the user is logged in
     if 'user_id' not in session:
@@ -753,49 +751,21 @@ def api_recipes_followed():
         if not user_doc:
             return jsonify({'error': 'User not found'}), 404
 
-        # Extract the followedChefs array
-        followed_chefs = user_doc.get('followedChefs', [])
+        # followedChefs holds chef ObjectIds (see migrate_ids.py)
+        followed_chefs = user_doc.get('followedChefs') or []
         
         if not followed_chefs:
             return jsonify([])
 
-        # Extract chef IDs from followedChefs array
-        chef_ids_search = []
-        for chef_item in followed_chefs:
-            try:
-                chef_id = chef_item.get('chefId') if isinstance(chef_item, dict) else chef_item
-                if chef_id:
-                    # Try as ObjectId first then as string
-                    if isinstance(chef_id, ObjectId):
-                        chef_ids_search.append(chef_id)
-                    else:
-                        try:
-                            chef_ids_search.append(ObjectId(chef_id))
-                        except Exception:
-                            chef_ids_search.append(str(chef_id))
-            except Exception as e:
-                print(f"Skipping invalid chef item {chef_item}: {e}")
-                continue
-
-        if not chef_ids_search:
-            return jsonify([])
-
-        # fetch recipes from followed chefs
-        recipes_cursor = recipes_collection.find({"chef_id": {"$in": chef_ids_search}})
-        followed_recipes = list(recipes_cursor)
-
-        # pass each recipe through the enrich_recipe function
-        for recipe in followed_recipes:
-            enrich_recipe(recipe)
-
-        return jsonify(followed_recipes), 200
+        # card views of the recipes from followed chefs (chef_id index)
+        return jsonify(load_recipes({"chef_id": {"$in": followed_chefs}}, "card")), 200
 
     except Exception as e:
-        print(f"Error in /api/recipes/followed: {e}")
+        logger.error("Error in /api/recipes/followed: %s", e)
         return jsonify({'error': 'Server error'}), 500
 
 # Chef Routes
-@app.route('/api/chefs/<chef_id>')
+@main_bp.route('/api/chefs/<chef_id>')
 def api_chef_profile(chef_id):
     try:
         # recover user_id from session (user viewing the profile)
@@ -814,64 +784,39 @@ def api_chef_profile(chef_id):
         if not chef:
             return jsonify({"error": "Chef not found"}), 404
         
-        # recover recipes_count from recipe list
-        recipe_list = chef.get("recipeList", [])
-        recipes_count = len(recipe_list) if isinstance(recipe_list, list) else 0
+        chef_model = Chef.from_doc(chef)
+
+        # recover the viewer document (needed for is_followed and for the etag)
+        user_doc = None
+        if user_id:
+            try:
+                collection = user_collection if role == 'user' else chef_collection
+                user_doc = collection.find_one({"_id": ObjectId(user_id)})
+            except Exception as e:
+                logger.error("Error fetching viewer %s: %s", user_id, e)
+
+        recipe_ids = chef_model.recipe_ids if include_recipes else []
+
+        # the response depends on the chef, the viewer and (optionally) the
+        # chef's recipes, validate the client copy before building it
+        etag_parts = ["chef", chef["_id"], doc_version(chef), include_recipes, user_id, doc_version(user_doc)]
+        if recipe_ids:
+            versions = recipes_collection.find({"_id": {"$in": recipe_ids}}, {"revision": 1, "updated_at": 1})
+            etag_parts += sorted(f"{v['_id']}:{doc_version(v)}" for v in versions)
+        etag = make_etag(*etag_parts)
+        cached = not_modified(etag, public=False)
+        if cached:
+            return cached
         
         # build json object with chef's public data
-        chef_data = {
-            "_id": str(chef["_id"]),
-            "user_name": chef.get("user_name", "Unknown Chef"),
-            "nickname": chef.get("nickname", ""),
-            "user_avatar": chef.get("user_avatar", ""),
-            "bio": chef.get("bio", ""),
-            "info": chef.get("info", ""),
-            "followers": chef.get("followers", 0),
-            "recipes_count": recipes_count,
-            "is_me": False,
-            "is_followed": False
-        }
+        chef_data = dict(chef_model.profile(), is_me=False, is_followed=False)
         
-        # if include_recipes=true, recover full recipe details
-        if include_recipes and recipe_list:
+        # if include_recipes=true, add the recipe cards
+        if include_recipes:
             try:
-                # convert the ids from recipelist to objectid for the query
-                recipe_ids = []
-                for recipe_id_item in recipe_list:
-                    try:
-                        if isinstance(recipe_id_item, dict):
-                            item_id = recipe_id_item.get("recipeId")
-                            if item_id:
-                                if isinstance(item_id, ObjectId):
-                                    recipe_ids.append(item_id)
-                                else:
-                                    recipe_ids.append(ObjectId(str(item_id)))
-                        elif isinstance(recipe_id_item, ObjectId):
-                            recipe_ids.append(recipe_id_item)
-                        else:
-                            recipe_ids.append(ObjectId(str(recipe_id_item)))
-                    except Exception as e:
-                        print(f"Skipping invalid recipe ID {recipe_id_item}: {e}")
-                        pass
-                
-                # recover recipes from collection using $in
-                if recipe_ids:
-                    print(f"Fetching {len(recipe_ids)} recipes for chef {chef_id}")
-                    recipes = list(recipes_collection.find({"_id": {"$in": recipe_ids}}))
-                    print(f"Found {len(recipes)} recipes")
-                    
-                    # enrich each recipe
-                    enriched_recipes = []
-                    for recipe in recipes:
-                        enrich_recipe(recipe)
-                        enriched_recipes.append(recipe)
-                    
-                    chef_data["recipes"] = enriched_recipes
-                else:
-                    print(f"No recipe IDs extracted from recipeList for chef {chef_id}")
-                    chef_data["recipes"] = []
+                chef_data["recipes"] = load_recipes({"_id": {"$in": recipe_ids}}, "card") if recipe_ids else []
             except Exception as e:
-                print(f"Error fetching recipes for chef {chef_id}: {e}")
+                logger.error("Error fetching recipes for chef %s: %s", chef_id, e)
                 chef_data["recipes"] = []
         
         # if the user is logged in, check if is the chef and if has been followed
@@ -879,23 +824,17 @@ def api_chef_profile(chef_id):
             chef_data["is_me"] = (str(chef["_id"]) == str(user_id))
             
             # Check if user follows this chef
-            try:
-                collection = user_collection if role == 'user' else chef_collection
-                user_doc = collection.find_one({"_id": ObjectId(user_id)})
-                if user_doc:
-                    followed_chefs = user_doc.get('followedChefs', [])
-                    chef_data["is_followed"] = is_item_in_list(chef_id, followed_chefs)
-            except Exception as e:
-                print(f"Error checking followed status: {e}")
+            if user_doc:
+                chef_data["is_followed"] = chef["_id"] in (user_doc.get('followedChefs') or [])
         
-        return jsonify(chef_data), 200
+        return cacheable(jsonify(chef_data), etag, public=False)
     
     except Exception as e:
-        print(f"Error in /api/chefs/<chef_id>: {e}")
+        logger.error("Error in /api/chefs/<chef_id>: %s", e)
         return jsonify({'error': 'Server error'}), 500
 
 
-@app.route('/api/chefs/<chef_id>/follow', methods=['POST'])
+@main_bp.route('/api/chefs/<chef_id>/follow', methods=['POST'])
 def api_follow_chef(chef_id):
     # verify that the user is logged in
     if 'user_id' not in session:
@@ -921,85 +860,206 @@ def api_follow_chef(chef_id):
         if not user_doc:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get current followedChefs list
-        followed_chefs = user_doc.get('followedChefs', [])
-        if not isinstance(followed_chefs, list):
-            followed_chefs = []
-        
-        # Check if currently followed
-        is_currently_followed = is_item_in_list(chef_id, followed_chefs)
+        # Check if currently followed (followedChefs holds chef ObjectIds)
+        is_currently_followed = chef["_id"] in (user_doc.get('followedChefs') or [])
         
         # Toggle: if followed, remove; if not, add
         if is_currently_followed:
-            # Remove from followedChefs
-            new_followed = []
-            for item in followed_chefs:
-                check_id = item.get('chefId') if isinstance(item, dict) else item
-                if str(check_id) != str(chef_id):
-                    new_followed.append(item)
             collection.update_one(
                 {"_id": ObjectId(user_id)},
-                {"$set": {"followedChefs": new_followed}}
+                touch({"$pull": {"followedChefs": chef["_id"]}})
             )
             is_followed = False
         else:
-            # Add to followedChefs (as string for simplicity)
             collection.update_one(
                 {"_id": ObjectId(user_id)},
-                {"$push": {"followedChefs": str(chef_id)}}
+                touch({"$addToSet": {"followedChefs": chef["_id"]}})
             )
             is_followed = True
         
         return jsonify({'is_followed': is_followed}), 200
     
     except Exception as e:
-        print(f"Error in /api/chefs/<chef_id>/follow: {e}")
+        logger.error("Error in /api/chefs/<chef_id>/follow: %s", e)
+        return jsonify({'error': 'Server error'}), 500
+
+# Offline Sync Routes
+# public projections of the synced collections
+SYNC_CHEF_FIELDS = {"user_name": 1, "nickname": 1, "user_avatar": 1, "bio": 1, "info": 1, "followers": 1, "recipeList": 1, "updated_at": 1}
+SYNC_INGREDIENT_FIELDS = {"ingredientName": 1, "name": 1, "unit": 1, "protein": 1, "carbs": 1, "fats": 1, "calories": 1, "scientificDescription": 1, "updated_at": 1}
+
+@main_bp.route('/api/sync')
+def api_sync():
+    # returns recipes, chefs and ingredients changed or deleted since the
+    # client checkpoint (see sync.py), without one it starts a full sync.
+    # Pages are bounded, the client asks again while has_more is true.
+    synced = (
+        ("recipes", recipes_collection, None),
+        ("chefs", chef_collection, SYNC_CHEF_FIELDS),
+        ("ingredients", ingredients_collection, SYNC_INGREDIENT_FIELDS),
+    )
+    try:
+        positions = decode_checkpoint(request.args.get('since'), len(synced))
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'Invalid checkpoint'}), 400
+
+    try:
+        now = server_time()
+        now_ms = to_checkpoint(now)
+        oldest = min((from_checkpoint(ms) for ms, _, full in positions or () if not full), default=None)
+        # full: the client must replace its store (first page of a full sync)
+        full = positions is None or checkpoint_expired(oldest, now)
+        if full:
+            positions = [(now_ms, None, True)] * len(synced)
+
+        result = {}
+        next_positions = []
+        has_more = False
+        for (name, collection, projection), position in zip(synced, positions):
+            docs, next_position, more = changed_since(collection, position, now_ms, projection)
+            next_positions.append(next_position)
+            has_more = has_more or more
+            # no tombstones while paging through a full sync
+            ms, _, paging_full = position
+            deleted = [] if paging_full else deleted_since(name, from_checkpoint(ms))
+            result[name] = {'updated': docs, 'deleted': deleted}
+
+        # detail views are shared, the checkpoint conversion below needs copies
+        result['recipes']['updated'] = [dict(view) for view in render_recipes(result['recipes']['updated'], "detail")]
+        for chef in result['chefs']['updated']:
+            chef["recipes_count"] = len(chef.pop("recipeList", None) or [])
+
+        for name, _, _ in synced:
+            for doc in result[name]['updated']:
+                if doc.get("updated_at"):
+                    doc["updated_at"] = to_checkpoint(doc["updated_at"])
+
+        return jsonify(dict(
+            result,
+            full=full,
+            checkpoint=encode_checkpoint(next_positions),
+            has_more=has_more,
+        ))
+    except Exception as e:
+        logger.error("Error in /api/sync: %s", e)
         return jsonify({'error': 'Server error'}), 500
 
 # Logout Route
-@app.route('/api/logout', methods=['POST'])
+@main_bp.route('/api/logout', methods=['POST'])
 def logout():
     session.clear()
     return jsonify({'status': 'success'})
 
 # HTML ROUTES SECTION
-@app.route("/")
+@main_bp.route("/")
 def home():
     return render_template("home.html")
 
-@app.route("/explore")
+@main_bp.route("/explore")
 def explore():
     return render_template("explore.html")
 
-@app.route("/profile")
+@main_bp.route("/profile")
 def profile():
     return render_template("profile.html")
 
-@app.route("/login")
+@main_bp.route("/login")
 def login_page():
     return render_template("login.html")
 
-@app.route("/register")
+@main_bp.route("/register")
 def register_page():
     return render_template("register.html")
 
-@app.route("/recipe/<recipe_id>")
+@main_bp.route("/recipe/<recipe_id>")
 def recipe_page(recipe_id):
-    # the page is static and client-side will fetch /api/recipes/<id> if needed
-    return render_template("recipePage.html", recipe_id=recipe_id)
+    # recipe, comments and viewer state inlined unless RECIPE_PRERENDER=0,
+    # the page script fetches /api/recipes/<id> otherwise
+    return render_recipe_page(recipe_id)
 
-@app.route("/addRecipe")
+@main_bp.route("/addRecipe")
 def addRecipe():
     return render_template("addRecipe.html")
 
-@app.route("/chefProfile")
+@main_bp.route("/chefProfile")
 def chefProfile():
     return render_template("chefProfile.html")
 
-@app.route("/offline")
+@main_bp.route("/offline")
 def offline():
     return render_template("offline.html")
 
+# Application factory
+def create_app(config=None):
+    # builds the app without touching MongoDB or the chef bot client, both are
+    # created on first use or by warm_up(); config overrides app.config and
+    # MONGODB_URI points db.py at another server
+    config = dict(config or {})
+    if config.get("MONGODB_URI"):
+        configure_db(config["MONGODB_URI"])
+
+    # structured json logs written by a background thread (see logs.py)
+    setup_logging()
+
+    app = Flask(
+        __name__,
+        template_folder="../frontend/pages/html", # Path to HTML it's different from default
+        static_folder="../frontend", # Path to static files (assets, css, js)
+        static_url_path='' # Serve static files at the root URL to semplify access
+    )
+
+    # configure json serialization provider for mongodb types (ObjectId, datetime, Decimal128)
+    app.json = FastJSONProvider(app)
+
+    # per-request latency and mongodb command metrics (/metrics)
+    init_metrics(app)
+
+    # opt-in request profiling (X-Profile header or sampling, see profiling.py)
+    init_profiling(app)
+
+    # gzip/br/zstd response compression, registered after the metrics and
+    # profiling hooks so that they include its cost (see negotiation.py)
+    init_negotiation(app)
+
+    # catalog reads from secondaries in causally consistent sessions (see routing.py)
+    init_routing(app)
+
+    # serve built, fingerprinted assets (python assets.py build) when available
+    init_assets(app)
+
+    # liveness and readiness probes (/healthz, /readyz)
+    init_health(app)
+
+    # set secure session key
+    app.secret_key = os.getenv("SECRET_KEY", "supersecretkey")
+    app.config.update(config)
+
+    # register flask blueprints for modular routes
+    app.register_blueprint(register_bp)
+    app.register_blueprint(login_bp)
+    app.register_blueprint(chef_bot_bp)
+    app.register_blueprint(main_bp)
+    return app
+
+def warm_up(connect=True):
+    # does ahead of time what the first requests would do otherwise.
+    # connect=False: slow imports only, safe in a master process before fork
+    # (gunicorn --preload), the workers then share those pages.
+    # connect=True, once per worker: MongoDB connection and indexes, the
+    # catalog snapshot and retrieval index maps and their change subscriptions
+    started = time.perf_counter()
+    get_chef_bot_client()
+    # used by the similar recipes rebuild only
+    importlib.import_module("scipy.sparse")
+    if connect:
+        ensure_indexes()
+        snapshot.current()
+        retrieval.current_index()
+    logger.info("warm-up done", extra={"connect": connect, "warm_up_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+# module level app for python app.py, flask run and gunicorn app:app
+app = create_app()
+
 # This is for testing purposes
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,187 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from flask import abort, request, send_file
+from jinja2 import ChoiceLoader, FileSystemLoader
+
+try:
+    import brotli
+except ImportError:
+    # brotli is optional at runtime, without it only gzip variants are built
+    brotli = None
+
+# Build-time asset pipeline: minifies and content-hashes the JS/CSS in
+# frontend/pages, precompresses them and generates the service worker
+# precache manifest. Run from the backend folder before deploying:
+#   python assets.py build
+
+FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "asset-manifest.json")
+PRECACHE_PATH = os.path.join(DIST_DIR, "precache-manifest.js")
+
+# pages and assets precached by the service worker besides the built JS/CSS
+CORE_URLS = [
+    "/",
+    "/manifest.json",
+    "/pages/html/home.html",
+    "/pages/html/navBar.html",
+    "/pages/html/offline.html",
+    "/pages/css/offline.css",
+    "/pages/js/sw-register.js",
+    "/assets/icon-192x192.png",
+    "/assets/icon-512x512.png",
+    "/assets/logo.svg",
+    "/assets/logo2.svg",
+]
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+# matches src="..." / href="..." references to local page assets
+ASSET_REF = re.compile(r'(src|href)="/?(pages/(?:js|css)/[^"]+)"')
+
+
+def _minify(path, source):
+    if path.endswith(".js"):
+        import rjsmin
+        return rjsmin.jsmin(source, keep_bang_comments=True)
+    import rcssmin
+    return rcssmin.cssmin(source, keep_bang_comments=True)
+
+def _write_compressed(path, data):
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+def build(verbose=True):
+    # rebuild dist/ from scratch so stale hashed files never linger
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+
+    for kind in ("js", "css"):
+        source_dir = os.path.join(FRONTEND_DIR, "pages", kind)
+        target_dir = os.path.join(DIST_DIR, "pages", kind)
+        os.makedirs(target_dir, exist_ok=True)
+
+        for name in sorted(os.listdir(source_dir)):
+            if not name.endswith("." + kind):
+                continue
+            with open(os.path.join(source_dir, name), encoding="utf-8") as f:
+                source = f.read()
+            data = _minify(name, source).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed_name = f"{name[:-len(kind) - 1]}.{digest}.{kind}"
+            hashed_path = os.path.join(target_dir, hashed_name)
+            with open(hashed_path, "wb") as f:
+                f.write(data)
+            _write_compressed(hashed_path, data)
+
+            manifest[f"/pages/{kind}/{name}"] = f"/dist/pages/{kind}/{hashed_name}"
+            if verbose:
+                print(f"{kind}/{name}: {len(source.encode('utf-8'))} -> {len(data)} bytes  {hashed_name}")
+
+    # rewrite the page templates so they reference the hashed files
+    html_source = os.path.join(FRONTEND_DIR, "pages", "html")
+    html_target = os.path.join(DIST_DIR, "pages", "html")
+    os.makedirs(html_target, exist_ok=True)
+    for name in sorted(os.listdir(html_source)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(html_source, name), encoding="utf-8") as f:
+            html = f.read()
+        html = ASSET_REF.sub(lambda m: f'{m.group(1)}="{manifest.get("/" + m.group(2), "/" + m.group(2))}"', html)
+        with open(os.path.join(html_target, name), "w", encoding="utf-8") as f:
+            f.write(html)
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    # the version changes whenever any built asset changes, which gives the
+    # service worker a new cache name on every deploy that touches assets
+    urls = CORE_URLS + sorted(manifest.values())
+    version = hashlib.sha256("\n".join(urls).encode("utf-8")).hexdigest()[:12]
+    with open(PRECACHE_PATH, "w", encoding="utf-8") as f:
+        f.write("// Generated by backend/assets.py, do not edit\n")
+        f.write(f"self.__PRECACHE_MANIFEST = {json.dumps({'version': version, 'urls': urls}, indent=2)};\n")
+
+    if verbose:
+        print(f"{len(manifest)} assets built, precache version {version}")
+    return manifest
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def init_assets(app):
+    # serve the built assets when dist/ exists, the plain files otherwise
+    manifest = load_manifest()
+    hashed_files = {url[len("/dist/"):] for url in manifest.values()}
+
+    if manifest:
+        # render the rewritten page templates first
+        app.jinja_loader = ChoiceLoader([
+            FileSystemLoader(os.path.join(DIST_DIR, "pages", "html")),
+            app.jinja_loader,
+        ])
+
+    @app.route("/dist/<path:filename>")
+    def dist_asset(filename):
+        path = os.path.abspath(os.path.join(DIST_DIR, filename))
+        if not path.startswith(DIST_DIR + os.sep) or not os.path.isfile(path):
+            abort(404)
+
+        # pick a precompressed variant the client accepts
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if accepted[candidate] and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        mimetype = "text/javascript" if filename.endswith(".js") else "text/css" if filename.endswith(".css") else None
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers.pop("Content-Disposition", None)
+        response.vary.add("Accept-Encoding")
+
+        # hashed names never change content, everything else must be revalidated
+        if filename in hashed_files:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    app.jinja_env.globals["asset_url"] = lambda path: manifest.get(path, path)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TasteKnowledge asset pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="minify, hash and precompress frontend assets")
+    sub.add_parser("clean", help="remove the built assets")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build()
+    elif args.command == "clean":
+        shutil.rmtree(DIST_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+import argparse
+import random
+import time
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from bson.objectid import ObjectId
+from serialization import FastJSONProvider
+
+# Micro-benchmarks for hot paths, run from the backend folder:
+#   python benchmarks.py json --recipes 5000
+#   python benchmarks.py similar --recipes 20000
+#   python benchmarks.py facets --recipes 20000
+#   python benchmarks.py retrieval --ingredients 5000
+#   python benchmarks.py models --recipes 5000
+#   python benchmarks.py snapshot --recipes 20000
+#   python benchmarks.py startup --runs 5
+#   python benchmarks.py encoding --recipes 1000
+
+
+# build fake recipes with the same shape as the /api/recipes payload
+def make_recipes(count, ingredients_per_recipe=8, seed=42):
+    rng = random.Random(seed)
+    tags = ["vegan", "vegetarian", "dessert", "drink", "snack", "healthy"]
+    recipes = []
+    for i in range(count):
+        recipes.append({
+            "_id": ObjectId(),
+            "title": f"Recipe {i}",
+            "description": "A tasty recipe " * 5,
+            "image": f"https://example.com/images/{i}.jpg",
+            "time": f"{rng.randint(5, 120)} min",
+            "difficulty": rng.randint(1, 5),
+            "tags": rng.sample(tags, 2),
+            "rating": round(rng.uniform(0, 5), 1),
+            "chef_id": ObjectId(),
+            "user_name": "Chef",
+            "user_avatar": "https://example.com/avatar.jpg",
+            "commentsList": [ObjectId() for _ in range(rng.randint(0, 5))],
+            "ingredients": [
+                {
+                    "ingredientId": ObjectId(),
+                    "quantity": rng.randint(1, 500),
+                    "name": "Ingredient",
+                    "unit": "g",
+                    "calories": rng.randint(0, 900),
+                }
+                for _ in range(ingredients_per_recipe)
+            ],
+        })
+    return recipes
+
+
+def _timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_json(args):
+    app = Flask("bench")
+    recipes = make_recipes(args.recipes)
+
+    # previous path: stringify ids by hand, then the stdlib json provider
+    class MongoJSONProvider(DefaultJSONProvider):
+        def default(self, o):
+            if isinstance(o, ObjectId):
+                return str(o)
+            return super().default(o)
+
+    stdlib = MongoJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    def manual_then_stdlib():
+        docs = []
+        for recipe in recipes:
+            doc = dict(recipe)
+            doc["_id"] = str(doc["_id"])
+            doc["chef_id"] = str(doc["chef_id"])
+            doc["ingredients"] = [dict(ing, ingredientId=str(ing["ingredientId"])) for ing in doc["ingredients"]]
+            docs.append(doc)
+        return stdlib.dumps(docs, separators=(",", ":")).encode("utf-8")
+
+    def single_pass():
+        return fast.dumps_bytes(recipes)
+
+    size = len(single_pass())
+    old = _timeit(manual_then_stdlib, args.repeat)
+    new = _timeit(single_pass, args.repeat)
+    print(f"recipes: {args.recipes}  payload: {size / 1024:.1f} KiB")
+    print(f"manual str() + stdlib json : {old * 1000:8.2f} ms")
+    print(f"FastJSONProvider           : {new * 1000:8.2f} ms  ({old / new:.1f}x)")
+
+
+def bench_similar(args):
+    from recommendations import build_matrix, top_k_neighbours, recipe_features, similarity
+
+    # recipes drawing ingredients from a shared pool so they overlap
+    rng = random.Random(7)
+    pool = [ObjectId() for _ in range(args.ingredients)]
+    recipes = make_recipes(args.recipes)
+    for recipe in recipes:
+        for ing in recipe["ingredients"]:
+            ing["ingredientId"] = rng.choice(pool)
+
+    start = time.perf_counter()
+    ids, matrix = build_matrix(recipes)
+    for _ in top_k_neighbours(matrix, args.top_k):
+        pass
+    vectorized = time.perf_counter() - start
+
+    # pairwise python scoring of a sample of rows, extrapolated to the catalog
+    sample = recipes[:args.sample]
+    features = [recipe_features(r) for r in recipes]
+    start = time.perf_counter()
+    for i in range(len(sample)):
+        sorted(((similarity(features[i], other), j) for j, other in enumerate(features) if j != i), reverse=True)[:args.top_k]
+    pairwise = (time.perf_counter() - start) / len(sample) * len(recipes)
+
+    print(f"recipes: {len(ids)}  features: {matrix.shape[1]}  top-k: {args.top_k}")
+    print(f"pairwise python (estimated) : {pairwise:8.2f} s")
+    print(f"sparse matrix rebuild       : {vectorized:8.2f} s  ({pairwise / vectorized:.1f}x)")
+
+
+def bench_facets(args):
+    from werkzeug.datastructures import MultiDict
+    from facets import FacetSnapshot, parse_query
+
+    recipes = make_recipes(args.recipes)
+    ingredients = {str(ing["ingredientId"]): {"calories": ing["calories"]} for r in recipes for ing in r["ingredients"]}
+
+    start = time.perf_counter()
+    snapshot = FacetSnapshot(recipes, ingredients)
+    build = time.perf_counter() - start
+    print(f"recipes: {args.recipes}  index build: {build * 1000:.1f} ms")
+
+    queries = [
+        {},
+        {"tags": "vegan", "max_time": "30", "sort": "time"},
+        {"q": "recipe 1", "difficulty": "2,3", "min_rating": "3", "sort": "rating"},
+        {"tags": "dessert,snack", "min_calories": "100", "max_calories": "900", "page": "3"},
+    ]
+    for args_dict in queries:
+        query = parse_query(MultiDict(args_dict))
+        elapsed = _timeit(lambda: snapshot.search(query), args.repeat)
+        label = "&".join(f"{k}={v}" for k, v in args_dict.items()) or "(no filters)"
+        print(f"{label:60s} {elapsed * 1000:8.2f} ms")
+
+
+def bench_retrieval(args):
+    import tempfile
+    from retrieval import RetrievalIndex, build, tokenize
+
+    # descriptions drawn from a zipf-like vocabulary, like natural text
+    rng = random.Random(11)
+    words = [f"term{i}" for i in range(args.vocabulary)]
+    weights = [1.0 / (rank + 1) for rank in range(args.vocabulary)]
+    docs = []
+    for i in range(args.ingredients):
+        sentences = [" ".join(rng.choices(words, weights, k=rng.randint(8, 20))) + "." for _ in range(rng.randint(3, 15))]
+        docs.append({"_id": ObjectId(), "ingredientName": f"Ingredient {i}", "scientificDescription": " ".join(sentences)})
+    queries = [" ".join(rng.choices(words, weights, k=rng.randint(3, 8))) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.perf_counter()
+        passages = build(docs, index_dir)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        index = RetrievalIndex(f"{index_dir}/{open(f'{index_dir}/CURRENT').read().strip()}")
+        opened = time.perf_counter() - start
+        print(f"ingredients: {args.ingredients}  passages: {passages}  terms: {len(index.vocabulary)}")
+        print(f"index build : {built * 1000:8.1f} ms")
+        print(f"index open  : {opened * 1000:8.1f} ms")
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, args.top_k, min_score=0)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        for label, q in (("p50", 0.5), ("p95", 0.95), ("max", 1.0)):
+            print(f"query {label}   : {latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000:8.3f} ms")
+
+        # scanning every passage in python, what a prompt-time search without an index costs
+        texts = [index.passage(row) for row in range(index.size)]
+        start = time.perf_counter()
+        for query in queries[:args.sample]:
+            terms = set(tokenize(query))
+            sorted((sum(tokenize(text).count(t) for t in terms), row) for row, text in enumerate(texts))
+        scan = (time.perf_counter() - start) / min(args.sample, len(queries))
+        print(f"python scan : {scan * 1000:8.1f} ms per query")
+
+
+def _legacy_enrich(recipe, chefs_by_id, docs_by_id):
+    # the in-place dict enrichment used before models.py, kept as the baseline
+    def _safe_float(value):
+        try:
+            if isinstance(value, str):
+                return float(value.replace(",", ".").strip())
+            return float(value)
+        except Exception:
+            return 0.0
+
+    chef = chefs_by_id.get(str(recipe.get("chef_id")))
+    if chef:
+        recipe["user_name"] = chef.get("user_name", "Unknown")
+        recipe["user_avatar"] = chef.get("user_avatar", "")
+    totals = {"calories": 0.0, "protein": 0.0, "carbs": 0.0, "fats": 0.0}
+    for ingredient_data in recipe["ingredients"]:
+        doc = docs_by_id.get(str(ingredient_data.get("ingredientId")))
+        if doc:
+            ingredient_data["name"] = doc.get("ingredientName", doc.get("name", "Unknown Ingredient"))
+            ingredient_data["ingredient"] = ingredient_data["name"]
+            ingredient_data["unit"] = doc.get("unit", "")
+            for nutrient in totals:
+                ingredient_data[nutrient] = doc.get(nutrient, 0)
+            ingredient_data["scientificDescription"] = doc.get("scientificDescription", "")
+        ingredient_data["scientificDescription"] = ingredient_data.get("scientificDescription", "")
+        quantity = _safe_float(ingredient_data.get("quantity", 0))
+        calculated = {}
+        for nutrient in totals:
+            calculated[nutrient] = round(_safe_float(ingredient_data.get(nutrient, 0)) * quantity / 100.0, 2)
+            totals[nutrient] += _safe_float(ingredient_data.get(nutrient, 0)) * quantity / 100.0
+        calculated["quantity"] = quantity
+        ingredient_data["calculated_nutrition"] = calculated
+    for nutrient, value in totals.items():
+        recipe[nutrient] = int(round(value))
+    recipe.pop("commentsList", None)
+    return recipe
+
+
+def bench_models(args):
+    import copy
+    import tracemalloc
+    from caching import LRUCache, doc_version
+    from models import Chef, Ingredient, Recipe
+    from serialization import dumps_bytes
+
+    rng = random.Random(5)
+    catalog = [
+        {"_id": ObjectId(), "ingredientName": f"Ingredient {i}", "unit": "g", "protein": rng.randint(0, 30),
+         "carbs": rng.randint(0, 80), "fats": rng.randint(0, 50), "calories": rng.randint(0, 900),
+         "scientificDescription": "Starch gelatinizes when heated with water. " * 6}
+        for i in range(args.ingredients)
+    ]
+    authors = [{"_id": ObjectId(), "user_name": f"Chef {i}", "user_avatar": "https://example.com/a.jpg", "revision": 1} for i in range(200)]
+    docs = make_recipes(args.recipes)
+    for doc in docs:
+        doc["chef_id"] = rng.choice(authors)["_id"]
+        doc["preparationSteps"] = [f"Step {n}" for n in range(6)]
+        doc["revision"] = 1
+        for name in ("user_name", "user_avatar"):
+            doc.pop(name)
+        doc["ingredients"] = [{"ingredientId": rng.choice(catalog)["_id"], "quantity": rng.randint(1, 500)} for _ in range(8)]
+    raw_catalog = {str(d["_id"]): d for d in catalog}
+    raw_authors = {str(d["_id"]): d for d in authors}
+    ingredients = {key: Ingredient.from_doc(d) for key, d in raw_catalog.items()}
+    chefs = {key: Chef.from_doc(d) for key, d in raw_authors.items()}
+
+    # every run gets fresh documents, as read from mongodb: the size probe,
+    # the timed runs and the memory pass
+    copies = [copy.deepcopy(docs) for _ in range(args.repeat + 2)]
+
+    def legacy():
+        batch = copies.pop()
+        return dumps_bytes([_legacy_enrich(doc, raw_authors, raw_catalog) for doc in batch])
+
+    def models_cold():
+        return dumps_bytes([Recipe.from_doc(doc, chefs, ingredients).detail() for doc in docs])
+
+    cache = LRUCache(len(docs))
+    for doc in docs:
+        cache.put((doc["_id"], "detail"), Recipe.from_doc(doc, chefs, ingredients).detail(), (doc_version(doc), 1))
+
+    def models_cached():
+        return dumps_bytes([cache.get((doc["_id"], "detail"), (doc_version(doc), 1)) for doc in docs])
+
+    size = len(legacy())
+    print(f"recipes: {args.recipes}  ingredients per recipe: 8  payload: {size / 1024:.0f} KiB (legacy), {len(models_cold()) / 1024:.0f} KiB (detail view)")
+    baseline = _timeit(legacy, args.repeat)
+    for label, fn in (("dict enrichment (before)", legacy), ("models, views built", models_cold), ("models, memoized views", models_cached)):
+        elapsed = baseline if fn is legacy else _timeit(fn, args.repeat)
+        print(f"{label:28s} {elapsed * 1000:8.1f} ms  {args.recipes / elapsed:10.0f} recipes/s  ({baseline / elapsed:.1f}x)")
+
+    # memory added on top of the raw documents
+    tracemalloc.start()
+    batch = copies.pop()
+    before = tracemalloc.get_traced_memory()[0]
+    enriched = [_legacy_enrich(doc, raw_authors, raw_catalog) for doc in batch]
+    legacy_bytes = tracemalloc.get_traced_memory()[0] - before
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [Recipe.from_doc(doc, chefs, ingredients) for doc in docs]
+    object_bytes = tracemalloc.get_traced_memory()[0] - before
+    before = tracemalloc.get_traced_memory()[0]
+    views = [recipe.detail() for recipe in objects]
+    view_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"memory per recipe: dict enrichment {legacy_bytes / len(docs):6.0f} B, "
+          f"Recipe objects {object_bytes / len(docs):6.0f} B, detail views {view_bytes / len(docs):6.0f} B")
+    del enriched, views
+
+
+def bench_snapshot(args):
+    import copy
+    import os
+    import tempfile
+    import tracemalloc
+    from caching import doc_version
+    from snapshot import Snapshot, build
+
+    rng = random.Random(9)
+    ingredients = [
+        {"_id": ObjectId(), "ingredientName": f"Ingredient {i} {rng.choice(['flour', 'sugar', 'basil', 'salt'])}", "unit": "g",
+         "protein": rng.randint(0, 30), "carbs": rng.randint(0, 80), "fats": rng.randint(0, 50), "calories": rng.randint(0, 900),
+         "scientificDescription": "Starch gelatinizes when heated with water. " * 6}
+        for i in range(args.ingredients)
+    ]
+    chefs = [{"_id": ObjectId(), "user_name": f"Chef {i}", "user_avatar": "https://example.com/a.jpg", "revision": 1} for i in range(args.chefs)]
+    recipes = make_recipes(args.recipes)
+    for doc in recipes:
+        doc["chef_id"] = rng.choice(chefs)["_id"]
+        doc["revision"] = 1
+    sources = {"ingredients": ingredients, "chefs": chefs, "recipes": recipes, "versions": {}}
+
+    # what each worker holds when it warms its own copy from mongodb
+    tracemalloc.start()
+    warm = copy.deepcopy((
+        {str(d["_id"]): d for d in ingredients},
+        {str(d["_id"]): {"user_name": d["user_name"], "user_avatar": d["user_avatar"], "version": doc_version(d)} for d in chefs},
+        {d["_id"]: {f: d[f] for f in ("title", "description", "image", "time", "difficulty", "tags", "rating", "chef_id")} for d in recipes},
+    ))
+    warm_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del warm
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        start = time.perf_counter()
+        path = build(sources, snapshot_dir)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot = Snapshot(path)
+        opened = time.perf_counter() - start
+        print(f"ingredients: {args.ingredients}  chefs: {args.chefs}  recipes: {args.recipes}")
+        print(f"snapshot build : {built * 1000:8.1f} ms  file {os.path.getsize(path) / 1024:8.0f} KiB (mapped once, shared by every worker)")
+        print(f"per-worker copy: {warm_bytes / 1024:8.0f} KiB of python objects")
+        print(f"snapshot open  : {opened * 1000:8.3f} ms")
+
+        page = rng.sample(recipes, 24)
+        versions = {doc["_id"]: doc_version(doc) for doc in page}
+        chef_ids = [doc["chef_id"] for doc in page]
+        ingredient_ids = [doc["_id"] for doc in rng.sample(ingredients, 8)]
+        for label, fn in (
+            ("24 recipe cards", lambda: snapshot.recipes(versions)),
+            ("24 authors", lambda: snapshot.chefs(chef_ids)),
+            ("8 ingredients", lambda: snapshot.ingredients(ingredient_ids)),
+        ):
+            elapsed = _timeit(lambda: [fn() for _ in range(100)], args.repeat) / 100
+            print(f"{label:15s}: {elapsed * 1000:8.3f} ms")
+
+        queries = ["sal", "ingredient 12", "basil", "zzz"]
+        names = [d["ingredientName"] for d in ingredients]
+        mapped = _timeit(lambda: [snapshot.search_ingredients(q) for q in queries], args.repeat) / len(queries)
+        scan = _timeit(lambda: [[n for n in names if q in n.lower()][:10] for q in queries], args.repeat) / len(queries)
+        print(f"autocomplete   : {mapped * 1000:8.3f} ms (mmap find)  {scan * 1000:8.3f} ms (python scan)")
+
+
+# runs in a fresh interpreter per measurement, prints the phase timings as json
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+application.test_client().get("/healthz")
+served = time.perf_counter()
+app.warm_up(connect=False)
+warmed = time.perf_counter()
+print(json.dumps({"import app": imported - started, "create_app()": created - imported,
+                  "first /healthz": served - created, "warm_up(connect=False)": warmed - served}))
+"""
+
+def bench_startup(args):
+    import json
+    import os
+    import statistics
+    import subprocess
+    import sys
+
+    # no database: startup must not need one
+    env = dict(os.environ, MONGODB_URI="mongodb://127.0.0.1:1", LOG_LEVEL="WARNING")
+    runs = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout
+        phases = json.loads(output.strip().splitlines()[-1])
+        phases["process total"] = time.perf_counter() - start
+        runs.append(phases)
+    print(f"median of {args.runs} fresh processes, no database reachable")
+    for phase in runs[0]:
+        print(f"{phase:24s} {statistics.median(run[phase] for run in runs) * 1000:8.1f} ms")
+
+
+def _chunks(body, size):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def bench_encoding(args):
+    from negotiation import COMPRESSORS, compress, compress_stream
+    from serialization import dumps_bytes, dumps_msgpack, msgpack
+
+    recipes = make_recipes(args.recipes)
+    representations = {"json": lambda: dumps_bytes(recipes)}
+    if msgpack is not None:
+        representations["msgpack"] = lambda: dumps_msgpack(recipes)
+
+    print(f"{args.recipes} recipes, server cpu per response (serialize + compress), mean of {args.repeat}")
+    print(f"{'representation':15s} {'encoding':18s} {'bytes':>10s} {'cpu ms':>8s}")
+    for name, serialize in representations.items():
+        variants = [("identity", lambda body: body)]
+        variants += [(encoding, lambda body, encoding=encoding: compress(body, encoding)) for encoding in COMPRESSORS]
+        variants += [
+            (f"{encoding} streamed", lambda body, encoding=encoding: b"".join(compress_stream(_chunks(body, args.chunk), encoding)))
+            for encoding in COMPRESSORS
+        ]
+        for encoding, encode in variants:
+            size = len(encode(serialize()))
+            started = time.process_time()
+            for _ in range(args.repeat):
+                encode(serialize())
+            cpu = (time.process_time() - started) / args.repeat
+            print(f"{name:15s} {encoding:18s} {size:10d} {cpu * 1000:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TasteKnowledge micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    json_parser = sub.add_parser("json", help="serialize a large /api/recipes payload")
+    json_parser.add_argument("--recipes", type=int, default=5000)
+    json_parser.add_argument("--repeat", type=int, default=5)
+    json_parser.set_defaults(func=bench_json)
+
+    similar_parser = sub.add_parser("similar", help="rebuild the recipe similarity table")
+    similar_parser.add_argument("--recipes", type=int, default=20000)
+    similar_parser.add_argument("--ingredients", type=int, default=500)
+    similar_parser.add_argument("--top-k", type=int, default=20)
+    similar_parser.add_argument("--sample", type=int, default=50)
+    similar_parser.set_defaults(func=bench_similar)
+
+    facets_parser = sub.add_parser("facets", help="faceted explore queries on the in-memory index")
+    facets_parser.add_argument("--recipes", type=int, default=20000)
+    facets_parser.add_argument("--repeat", type=int, default=20)
+    facets_parser.set_defaults(func=bench_facets)
+
+    retrieval_parser = sub.add_parser("retrieval", help="chef bot knowledge retrieval latency")
+    retrieval_parser.add_argument("--ingredients", type=int, default=5000)
+    retrieval_parser.add_argument("--vocabulary", type=int, default=20000)
+    retrieval_parser.add_argument("--queries", type=int, default=500)
+    retrieval_parser.add_argument("--top-k", type=int, default=3)
+    retrieval_parser.add_argument("--sample", type=int, default=5)
+    retrieval_parser.set_defaults(func=bench_retrieval)
+
+    models_parser = sub.add_parser("models", help="recipe model views against the dict enrichment")
+    models_parser.add_argument("--recipes", type=int, default=5000)
+    models_parser.add_argument("--ingredients", type=int, default=500)
+    models_parser.add_argument("--repeat", type=int, default=5)
+    models_parser.set_defaults(func=bench_models)
+
+    snapshot_parser = sub.add_parser("snapshot", help="shared catalog snapshot size and lookups")
+    snapshot_parser.add_argument("--recipes", type=int, default=20000)
+    snapshot_parser.add_argument("--ingredients", type=int, default=2000)
+    snapshot_parser.add_argument("--chefs", type=int, default=500)
+    snapshot_parser.add_argument("--repeat", type=int, default=5)
+    snapshot_parser.set_defaults(func=bench_snapshot)
+
+    startup_parser = sub.add_parser("startup", help="app import, factory and first request in a fresh process")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+
+    encoding_parser = sub.add_parser("encoding", help="bytes on the wire and cpu per response for json/msgpack and each compression")
+    encoding_parser.add_argument("--recipes", type=int, default=1000)
+    encoding_parser.add_argument("--repeat", type=int, default=20)
+    encoding_parser.add_argument("--chunk", type=int, default=16384, help="chunk size of the streamed variants")
+    encoding_parser.set_defaults(func=bench_encoding)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import time
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from db import recipes_collection, chef_collection, ingredients_collection, DEFAULT_AVATAR, insert_update, touch
+from serialization import dumps_bytes
+from validation import ValidationError, validate_recipe, build_recipe_doc
+
+# Bulk import/export of ingredients, chefs and recipes.
+# Input is streamed (NDJSON, one document per line, or CSV) and written with
+# unordered bulk_write batches; recipes are validated with the same rules as
+# POST /api/recipes. Run from the backend folder:
+#   python bulk.py import ingredients ingredients.ndjson
+#   python bulk.py import recipes recipes.csv --format csv --batch-size 500
+#   python bulk.py export recipes recipes.ndjson
+#
+# Recipes reference their chef with "chef_id" or "chef_email" and their
+# ingredients with "ingredient-id"/"ingredientId" or the ingredient "name".
+# In CSV files list columns (tags, preparationSteps) are "|" separated or
+# JSON and "ingredients" holds JSON or "name:quantity|name:quantity".
+# Lines that cannot be parsed are rejected like invalid documents.
+
+DEFAULT_BATCH_SIZE = 1000
+NUTRITION_FIELDS = ("protein", "carbs", "fats", "calories")
+# CSV columns that may hold JSON, other cells are plain text
+JSON_COLUMNS = ("tags", "preparationSteps", "ingredients")
+
+
+# Readers
+def _parse_csv_cell(column, value):
+    value = value.strip()
+    if column in JSON_COLUMNS and value[:1] in ("[", "{"):
+        return json.loads(value)
+    if column in ("tags", "preparationSteps"):
+        return [part.strip() for part in value.split("|") if part.strip()]
+    if column == "ingredients":
+        items = []
+        for part in value.split("|"):
+            name, _, quantity = part.partition(":")
+            if name.strip():
+                items.append({"name": name.strip(), "quantity": quantity.strip()})
+        return items
+    return value
+
+def read_records(stream, fmt, progress):
+    # yields (line number, document) without loading the whole file,
+    # malformed lines are rejected and skipped
+    if fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            try:
+                yield line_no, {k: _parse_csv_cell(k, v or "") for k, v in row.items() if k}
+            except json.JSONDecodeError as e:
+                _reject(progress, line_no, f"invalid JSON: {e}")
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            doc = json.loads(line)
+        except json.JSONDecodeError as e:
+            _reject(progress, line_no, f"invalid JSON: {e}")
+            continue
+        if not isinstance(doc, dict):
+            _reject(progress, line_no, "expected a JSON object")
+            continue
+        yield line_no, doc
+
+
+# Throughput reporting
+class Progress:
+    def __init__(self, label, out=sys.stderr):
+        self.label = label
+        self.out = out
+        self.started = time.perf_counter()
+        self.written = 0
+        self.rejected = 0
+
+    def report(self, final=False):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        prefix = "done" if final else "progress"
+        print(
+            f"{prefix} {self.label}: {self.written} written, {self.rejected} rejected, "
+            f"{elapsed:.1f}s, {self.written / elapsed:.0f} docs/s",
+            file=self.out
+        )
+
+
+class BulkWriter:
+    # accumulates operations and flushes them as unordered bulk_write batches
+    def __init__(self, collection, progress, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.collection = collection
+        self.progress = progress
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.ops = []
+        # indexes of the operations of the last batch that failed
+        self.failed = set()
+
+    def add(self, op):
+        self.ops.append(op)
+        if len(self.ops) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.ops:
+            return
+        ops, self.ops = self.ops, []
+        self.failed = set()
+        if self.dry_run:
+            self.progress.written += len(ops)
+        else:
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                self.progress.written += result.inserted_count + result.upserted_count + result.modified_count
+            except BulkWriteError as e:
+                details = e.details
+                self.progress.written += details.get("nInserted", 0) + details.get("nUpserted", 0) + details.get("nModified", 0)
+                self.progress.rejected += len(details.get("writeErrors", []))
+                self.failed = {error["index"] for error in details.get("writeErrors", [])}
+                for error in details.get("writeErrors", [])[:5]:
+                    print(f"write error: {error.get('errmsg')}", file=sys.stderr)
+        self.progress.report()
+
+
+# Importers
+def _reject(progress, line_no, message):
+    progress.rejected += 1
+    print(f"line {line_no}: {message}", file=sys.stderr)
+
+def _float(value):
+    if isinstance(value, str):
+        value = value.replace(",", ".").strip() or 0
+    return float(value)
+
+def import_ingredients(records, writer):
+    # upsert by name so a catalog can be re-imported safely
+    for line_no, doc in records:
+        name = (doc.get("ingredientName") or doc.get("name") or "").strip()
+        if not name:
+            _reject(writer.progress, line_no, "ingredientName is required")
+            continue
+        try:
+            fields = {field: _float(doc.get(field, 0)) for field in NUTRITION_FIELDS}
+        except (TypeError, ValueError):
+            _reject(writer.progress, line_no, "nutrition values must be numbers")
+            continue
+        fields.update({
+            "ingredientName": name,
+            "unit": doc.get("unit", "g"),
+            "scientificDescription": doc.get("scientificDescription", ""),
+        })
+        writer.add(UpdateOne({"ingredientName": name}, touch({"$set": fields}), upsert=True))
+
+def import_chefs(records, writer):
+    from credentials import hash_password
+
+    # passwords are only hashed for new chefs, $setOnInsert drops the others
+    existing = {doc["email"] for doc in chef_collection.find({}, {"email": 1}) if doc.get("email")}
+    for line_no, doc in records:
+        email = doc.get("email")
+        email = email.strip() if isinstance(email, str) else ""
+        if not email:
+            _reject(writer.progress, line_no, "email is required")
+            continue
+        fields = {
+            "user_name": doc.get("user_name") or doc.get("nickname") or email,
+            "nickname": doc.get("nickname") or doc.get("user_name") or "",
+            "user_avatar": doc.get("user_avatar") or DEFAULT_AVATAR,
+            "bio": doc.get("bio", ""),
+            "info": doc.get("info", ""),
+        }
+        update = touch({"$set": fields, "$setOnInsert": {"recipeList": [], "followers": 0}})
+        if doc.get("password") and email not in existing:
+            update["$setOnInsert"]["password"] = hash_password(str(doc["password"]))
+        existing.add(email)
+        writer.add(UpdateOne({"email": email}, update, upsert=True))
+
+def _lookup_tables():
+    # resolve names and emails to ids in memory, one query per collection;
+    # returns (ingredient ids by name, chef ids by email, every chef id)
+    ingredients = {}
+    for doc in ingredients_collection.find({}, {"ingredientName": 1, "name": 1}):
+        name = doc.get("ingredientName") or doc.get("name")
+        if name:
+            ingredients[name.strip().lower()] = doc["_id"]
+    chefs, chef_ids = {}, set()
+    for doc in chef_collection.find({}, {"email": 1}):
+        chef_ids.add(doc["_id"])
+        if doc.get("email"):
+            chefs[doc["email"].lower()] = doc["_id"]
+    return ingredients, chefs, chef_ids
+
+def _resolve_ingredients(items, ingredient_ids):
+    if not isinstance(items, list):
+        raise ValidationError("ingredients must be a list")
+    resolved = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"name": item}
+        if not isinstance(item, dict):
+            raise ValidationError(f"Invalid ingredient {item!r}")
+        name = item.get("name")
+        if name is not None and not isinstance(name, str):
+            raise ValidationError(f"Invalid ingredient name {name!r}")
+        ing_id = item.get("ingredient-id") or item.get("ingredientId")
+        if not ing_id and name:
+            ing_id = ingredient_ids.get(name.strip().lower())
+            if ing_id is None:
+                raise ValidationError(f"Unknown ingredient '{item['name']}'")
+        resolved.append({"ingredient-id": str(ing_id) if ing_id else None, "quantity": item.get("quantity", "")})
+    return resolved
+
+def import_recipes(records, writer):
+    ingredient_ids, chefs_by_email, chef_ids = _lookup_tables()
+    # (chef id, recipe id) in the order of the writer batch, appended to the
+    # chef recipeList once the batch is written
+    pending = []
+
+    def flush_recipe_lists():
+        # only recipes actually inserted, failed writes are left out
+        recipe_lists = {}
+        for index, (chef_id, recipe_id) in enumerate(pending):
+            if index not in writer.failed:
+                recipe_lists.setdefault(chef_id, []).append(recipe_id)
+        pending.clear()
+        ops = [
+            UpdateOne({"_id": chef_id}, touch({"$push": {"recipeList": {"$each": ids}}}))
+            for chef_id, ids in recipe_lists.items()
+        ]
+        if ops and not writer.dry_run:
+            chef_collection.bulk_write(ops, ordered=False)
+
+    for line_no, doc in records:
+        try:
+            chef_email = doc.get("chef_email")
+            chef_id = doc.get("chef_id") or chefs_by_email.get(chef_email.lower() if isinstance(chef_email, str) else "")
+            if not chef_id or not ObjectId.is_valid(str(chef_id)) or ObjectId(str(chef_id)) not in chef_ids:
+                raise ValidationError("Unknown chef (chef_id or chef_email)")
+            data = dict(doc, ingredients=_resolve_ingredients(doc.get("ingredients") or [], ingredient_ids))
+            difficulty_val = validate_recipe(data)
+        except ValidationError as e:
+            _reject(writer.progress, line_no, str(e))
+            continue
+
+        recipe_doc = build_recipe_doc(data, str(chef_id), difficulty_val)
+        # assign the id client side so the chef recipeList can be updated in bulk
+        recipe_doc["_id"] = ObjectId()
+        pending.append((recipe_doc["chef_id"], recipe_doc["_id"]))
+        writer.add(UpdateOne({"_id": recipe_doc["_id"]}, insert_update(recipe_doc), upsert=True))
+        if not writer.ops:
+            # the writer just flushed a batch
+            flush_recipe_lists()
+
+    writer.flush()
+    flush_recipe_lists()
+
+IMPORTERS = {
+    "ingredients": (ingredients_collection, import_ingredients),
+    "chefs": (chef_collection, import_chefs),
+    "recipes": (recipes_collection, import_recipes),
+}
+
+def run_import(kind, path, fmt, batch_size, dry_run=False):
+    collection, importer = IMPORTERS[kind]
+    progress = Progress(kind)
+    writer = BulkWriter(collection, progress, batch_size, dry_run)
+    with _open_input(path) as stream:
+        importer(read_records(stream, fmt, progress), writer)
+    writer.flush()
+    progress.report(final=True)
+    return progress
+
+
+# Exporter
+EXPORT_COLLECTIONS = {
+    "ingredients": (ingredients_collection, None),
+    # never export password hashes
+    "chefs": (chef_collection, {"password": 0}),
+    "recipes": (recipes_collection, None),
+}
+CSV_COLUMNS = {
+    "ingredients": ["_id", "ingredientName", "unit", "protein", "carbs", "fats", "calories", "scientificDescription"],
+    "chefs": ["_id", "email", "user_name", "nickname", "user_avatar", "bio", "info"],
+    "recipes": ["_id", "title", "description", "image", "time", "difficulty", "tags", "preparationSteps", "ingredients", "chef_id"],
+}
+
+def run_export(kind, path, fmt, batch_size):
+    collection, projection = EXPORT_COLLECTIONS[kind]
+    progress = Progress(kind)
+    with _open_output(path) as out:
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=CSV_COLUMNS[kind], extrasaction="ignore")
+            writer.writeheader()
+        for doc in collection.find({}, projection, batch_size=batch_size):
+            if writer is None:
+                out.write(dumps_bytes(doc).decode("utf-8") + "\n")
+            else:
+                row = {}
+                for column in CSV_COLUMNS[kind]:
+                    value = doc.get(column, "")
+                    if column in ("tags", "preparationSteps") and isinstance(value, list):
+                        value = "|".join(str(v) for v in value)
+                    elif isinstance(value, (list, dict)):
+                        value = dumps_bytes(value).decode("utf-8")
+                    row[column] = value
+                writer.writerow(row)
+            progress.written += 1
+            if progress.written % batch_size == 0:
+                progress.report()
+    progress.report(final=True)
+    return progress
+
+
+def _open_input(path):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, encoding="utf-8", newline="")
+
+def _open_output(path):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdout)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export of TasteKnowledge data")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("import", "export"):
+        command_parser = sub.add_parser(command)
+        command_parser.add_argument("kind", choices=sorted(IMPORTERS))
+        command_parser.add_argument("path", help="file path, - for stdin/stdout")
+        command_parser.add_argument("--format", choices=["ndjson", "csv"], default=None,
+                                    help="defaults to the file extension (ndjson otherwise)")
+        command_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        if command == "import":
+            command_parser.add_argument("--dry-run", action="store_true", help="validate without writing")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    if args.command == "import":
+        run_import(args.kind, args.path, fmt, args.batch_size, args.dry_run)
+    else:
+        run_export(args.kind, args.path, fmt, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from flask import request, current_app
+from pymongo import DESCENDING
+from db import ensure_indexes
+from serialization import msgpack, wants_msgpack
+
+# Cache-Control settings for public recipe data (seconds)
+PUBLIC_MAX_AGE = int(os.getenv("RECIPE_CACHE_MAX_AGE", "30"))
+SHARED_MAX_AGE = int(os.getenv("RECIPE_CACHE_S_MAXAGE", "60"))
+STALE_WHILE_REVALIDATE = int(os.getenv("RECIPE_CACHE_SWR", "300"))
+
+
+def doc_version(doc):
+    # version of a single document, legacy documents without revision fields
+    # keep a stable version until their first write
+    if not doc:
+        return "none"
+    updated_at = doc.get("updated_at")
+    return f"{doc.get('revision', 0)}@{updated_at.timestamp() if updated_at else 0}"
+
+def collection_version(collection):
+    # cheap version of a whole collection: the newest updated_at (served by the
+    # updated_at index) plus the document count to notice deletions
+    ensure_indexes()
+    latest = collection.find_one({}, {"updated_at": 1, "revision": 1}, sort=[("updated_at", DESCENDING)])
+    return f"{collection.estimated_document_count()}:{doc_version(latest)}"
+
+def make_etag(*parts):
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode("utf-8"), digest_size=12)
+    return digest.hexdigest()
+
+
+def cache_control_value(public):
+    if public:
+        return (
+            f"public, max-age={PUBLIC_MAX_AGE}, s-maxage={SHARED_MAX_AGE}, "
+            f"stale-while-revalidate={STALE_WHILE_REVALIDATE}"
+        )
+    # per-viewer data: the browser may keep it but must revalidate every time
+    return "private, no-cache"
+
+def _representation(etag):
+    # json and msgpack bodies of the same data need distinct validators
+    return etag + "-msgpack" if wants_msgpack() else etag
+
+def _apply_headers(response, etag, public):
+    response.set_etag(_representation(etag), weak=True)
+    response.headers["Cache-Control"] = cache_control_value(public)
+    if msgpack is not None:
+        response.vary.add("Accept")
+    if not public:
+        response.vary.add("Cookie")
+    return response
+
+def not_modified(etag, public=True):
+    # returns a 304 response when the client already holds this version
+    if request.if_none_match.contains_weak(_representation(etag)):
+        return _apply_headers(current_app.response_class(status=304), etag, public)
+    return None
+
+def cacheable(response, etag, public=True):
+    # attach validators to a freshly built response (only successful ones)
+    if isinstance(response, tuple):
+        body, status = response[0], response[1]
+        if status != 200:
+            return response
+        response = body
+    return _apply_headers(response, etag, public)
+
+
+class LRUCache:
+    # bounded, thread-safe in-process cache of (version, value) per key; an
+    # entry whose version differs from the requested one counts as a miss.
+    # Exposes invalidate(key) / clear() for invalidation.register_cache.
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, version, build):
+        # build() runs outside the lock, concurrent misses may both build
+        value = self.get(key, version)
+        if value is None:
+            value = build()
+            self.put(key, value, version)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,12 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, session
-from dotenv import load_dotenv
 import os
-from huggingface_hub import InferenceClient
-
-# Load environment variables
-dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-if os.path.exists(dotenv_path):
-    load_dotenv(dotenv_path=dotenv_path)
+import logging
+import threading
+from bson.objectid import ObjectId
+from db import recipes_collection, ingredients_collection
+from caching import LRUCache, doc_version
+from invalidation import register_cache, subscribe
+import retrieval
 
 chef_bot_bp = Blueprint(
     'chef_bot_bp',
@@ -14,23 +14,37 @@ chef_bot_bp = Blueprint(
     template_folder='../frontend/pages/html'
 )
 
-# Configuration for Hugging Face Inference API
+# Configuration for Hugging Face Inference API (.env is loaded by db.py)
 HF_API_KEY = os.getenv('HUGGINGFACE_API_KEY')
 MODEL = "meta-llama/Llama-3.2-3B-Instruct"
-client = InferenceClient(token=HF_API_KEY) if HF_API_KEY else None
+# created by the first chat or warm-up, importing huggingface_hub takes
+# longer than importing the rest of the app
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global client
+    if client is None and HF_API_KEY:
+        with _client_lock:
+            if client is None:
+                from huggingface_hub import InferenceClient
+                client = InferenceClient(token=HF_API_KEY)
+    return client
+
+logger = logging.getLogger("chefBot")
 
 DEFAULT_CONTEXT = "No specific recipe provided. Assist with general cooking advice."
 
-@chef_bot_bp.route('/set_recipe', methods=['POST'])
-def set_recipe():
-    # Formats the recipe JSON and stores it in the session context.
-    recipe = request.get_json()
-    if not recipe:
-        return jsonify({'status': 'error'}), 400
+# Recipe contexts built from the database, shared by every visitor and kept
+# per recipe version (revision), so each version is formatted only once
+CONTEXT_CACHE_SIZE = int(os.getenv("CHEFBOT_CONTEXT_CACHE_SIZE", "256"))
+context_cache = LRUCache(CONTEXT_CACHE_SIZE)
+_invalidation_registered = False
 
+def format_recipe_context(recipe):
     # Build a concise context string for the AI
     parts = [f"Recipe: {recipe.get('title', 'Unknown')}"]
-    
+
     ingredients = recipe.get('ingredients', [])
     if ingredients:
         parts.append("\nINGREDIENTS:")
@@ -40,18 +54,89 @@ def set_recipe():
             else:
                 parts.append(f"- {ing}")
 
-    steps = recipe.get('steps', [])
+    steps = recipe.get('preparationSteps') or recipe.get('steps', [])
     if steps:
         parts.append("\nSTEPS:")
         for i, step in enumerate(steps, 1):
             parts.append(f"{i}. {step}")
 
-    session['recipe_context'] = "\n".join(parts).strip()
+    return "\n".join(parts).strip()
+
+def _build_context(recipe):
+    # resolve ingredient names and units with one query
+    ingredient_ids = []
+    for ing in recipe.get('ingredients') or []:
+        iid = ing.get('ingredientId') if isinstance(ing, dict) else None
+        if iid:
+            ingredient_ids.append(iid)
+    docs = {}
+    if ingredient_ids:
+        docs = {str(d["_id"]): d for d in ingredients_collection.find({"_id": {"$in": ingredient_ids}}, {"ingredientName": 1, "name": 1, "unit": 1})}
+
+    ingredients = []
+    for ing in recipe.get('ingredients') or []:
+        doc = docs.get(str(ing.get('ingredientId'))) if isinstance(ing, dict) else None
+        if doc:
+            ingredients.append({
+                'name': doc.get('ingredientName', doc.get('name', 'Unknown Ingredient')),
+                'quantity': ing.get('quantity', ''),
+                'unit': doc.get('unit', ''),
+            })
+    return {
+        'text': format_recipe_context(dict(recipe, ingredients=ingredients)),
+        'ingredient_ids': [str(iid) for iid in ingredient_ids],
+    }
+
+def recipe_context(recipe_id):
+    # cached {text, ingredient_ids} of the current version of a recipe,
+    # None if it does not exist
+    global _invalidation_registered
+    if not _invalidation_registered:
+        _invalidation_registered = True
+        # entries are versioned already, this only frees memory early;
+        # ingredient renames are not part of the recipe version
+        register_cache(context_cache, ("recipes",))
+        subscribe(lambda event: context_cache.clear(), ("ingredients",))
+
+    recipe_obj = ObjectId(recipe_id)
+    version_doc = recipes_collection.find_one({"_id": recipe_obj}, {"revision": 1, "updated_at": 1})
+    if not version_doc:
+        return None
+    version = doc_version(version_doc)
+
+    def build():
+        recipe = recipes_collection.find_one({"_id": recipe_obj}, {"title": 1, "ingredients": 1, "preparationSteps": 1})
+        return _build_context(recipe or {})
+    return context_cache.get_or_build(recipe_obj, version, build)
+
+@chef_bot_bp.route('/set_recipe', methods=['POST'])
+def set_recipe():
+    # Stores the recipe id in the session, the context is built server side.
+    # Older clients post the whole recipe, its _id is used the same way.
+    payload = request.get_json(silent=True)
+    if not payload:
+        return jsonify({'status': 'error'}), 400
+
+    recipe_id = str(payload.get('recipe_id') or payload.get('_id') or '')
+    if not ObjectId.is_valid(recipe_id):
+        return jsonify({'status': 'error', 'error': 'Invalid recipe id'}), 400
+
+    try:
+        context = recipe_context(recipe_id)
+    except Exception as e:
+        logger.error("Error building recipe context for %s: %s", recipe_id, e)
+        return jsonify({'status': 'error'}), 500
+    if context is None:
+        return jsonify({'status': 'error', 'error': 'Recipe not found'}), 404
+
+    session['recipe_id'] = recipe_id
+    session.pop('recipe_context', None)
     return jsonify({'status': 'success'})
 
 @chef_bot_bp.route('/chat', methods=['POST'])
 def chat():
     # Handles the chat logic using Hugging Face Inference API.
+    client = get_client()
     if not client:
         return jsonify({'error': 'Bot not configured'}), 503
 
@@ -63,7 +148,28 @@ def chat():
     chat_history = session.get('chat_history', [])
     chat_history = chat_history[-6:]
     
-    recipe_context = session.get('recipe_context', DEFAULT_CONTEXT)
+    context = None
+    if session.get('recipe_id'):
+        try:
+            context = recipe_context(session['recipe_id'])
+        except Exception as e:
+            logger.error("Error loading recipe context: %s", e)
+    ingredient_ids = context['ingredient_ids'] if context else None
+    # sessions created before contexts moved server side
+    context = context['text'] if context else session.get('recipe_context') or DEFAULT_CONTEXT
+
+    # ingredient science relevant to the question, the recipe's own
+    # ingredients are preferred
+    knowledge = ""
+    try:
+        passages = retrieval.retrieve(user_message, boost_ids=ingredient_ids)
+    except Exception as e:
+        logger.error("Knowledge retrieval failed: %s", e)
+        passages = []
+    if passages:
+        knowledge = "Ingredient science (use it when relevant):\n" + "\n".join(
+            f"- {p['ingredient']}: {p['text']}" for p in passages
+        ) + "\n"
 
     # Construct the payload
     messages = [
@@ -71,7 +177,8 @@ def chat():
             "role": "system",
             "content": (
                 "You are Chef Bot Assistant 👨‍🍳. "
-                f"Reference this recipe:\n{recipe_context}\n"
+                f"Reference this recipe:\n{context}\n"
+                f"{knowledge}"
                 "Guidelines: Only answer cooking-related questions. Be friendly. "
                 "Use max 2 emojis. Respond in the user's language."
             )
@@ -94,5 +201,6 @@ def chat():
         session['chat_history'] = chat_history
         
         return jsonify({'response': bot_response, 'status': 'success'})
-    except Exception:
+    except Exception as e:
+        logger.error("Chef Bot completion failed: %s", e)
         return jsonify({'error': 'AI Communication Error'}), 500
\ No newline at end of file
@@ -0,0 +1,160 @@
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+from metrics import Counter, Histogram, REGISTRY, LATENCY_BUCKETS
+
+# Hashing configuration (algorithm and cost use werkzeug method syntax,
+# e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:1000000")
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# max number of hashing jobs waiting or running at the same time
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", HASH_WORKERS * 8))
+# seconds a request waits for a free slot or for the hash result
+HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+class CredentialServiceBusy(Exception):
+    # raised when the hashing pool is saturated or too slow to answer
+    pass
+
+
+# these run inside the worker processes, so they must stay module-level
+def _hash_job(password, method):
+    return generate_password_hash(password, method=method)
+
+def _verify_job(stored, password):
+    return check_password_hash(stored, password)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_SIZE)
+
+def _mp_context():
+    # workers are not forked from the app process: it runs threads (logging,
+    # invalidation, jobs) whose locks a forked child could inherit held
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _get_executor():
+    # create the pool lazily so importing this module never spawns processes
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=_mp_context())
+    return _executor
+
+def _discard_executor(broken):
+    # a worker died (OOM kill, crash): the pool refuses every job from now
+    # on, the next call creates a new one
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def _after_fork():
+    # the parent's pool is unusable in a forked child, it creates its own
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def _run(fn, *args):
+    # bound the amount of queued work: callers beyond the limit fail fast
+    # instead of piling up behind a login burst
+    if not _slots.acquire(timeout=HASH_TIMEOUT):
+        raise CredentialServiceBusy("password hashing queue is full")
+    executor = _get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_executor(executor)
+        raise CredentialServiceBusy("password hashing pool restarted")
+    except BaseException:
+        _slots.release()
+        raise
+    # a job that timed out keeps running in the pool: its slot is freed
+    # when it actually ends, not when the caller gives up
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise CredentialServiceBusy("password hashing timed out")
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise CredentialServiceBusy("password hashing pool restarted")
+
+
+def _method_of(stored):
+    # werkzeug hashes look like "<method>$<salt>$<hash>"
+    if not isinstance(stored, str) or stored.count("$") < 2:
+        return None
+    return stored.split("$", 1)[0]
+
+def is_hashed(stored):
+    return _method_of(stored) is not None
+
+_stored_method = None
+
+def _current_method():
+    # werkzeug stores the expanded method ("scrypt" is written as
+    # "scrypt:32768:8:1"), read it from a hash made with HASH_METHOD
+    global _stored_method
+    if _stored_method is None:
+        _stored_method = _method_of(generate_password_hash("", method=HASH_METHOD))
+    return _stored_method
+
+def needs_rehash(stored):
+    return _method_of(stored) != _current_method()
+
+def hash_password(password):
+    return _run(_hash_job, password, HASH_METHOD)
+
+def verify_password(stored, password):
+    # returns True when the password matches the stored value
+    if not stored or not password:
+        return False
+    if not is_hashed(stored):
+        # legacy plaintext password (development data), constant-time compare
+        return hmac.compare_digest(str(stored).encode(), password.encode())
+    try:
+        return _run(_verify_job, stored, password)
+    except ValueError:
+        # stored hash with an unknown method
+        return False
+
+
+# Login metrics, exported at /metrics
+logins_total = Counter("tk_logins_total", "Login attempts by outcome", ("outcome",))
+login_duration = Histogram(
+    "tk_login_duration_seconds", "Login latency, password check included",
+    ("outcome",), LATENCY_BUCKETS
+)
+password_rehashes_total = Counter(
+    "tk_password_rehashes_total", "Stored passwords upgraded at login", ("method",)
+)
+REGISTRY.extend([logins_total, login_duration, password_rehashes_total])
+
+def record_login(outcome, duration, rehashed=False):
+    # outcome is one of "success", "failure", "busy"
+    logins_total.inc(outcome)
+    login_duration.observe(duration, outcome)
+    if rehashed:
+        password_rehashes_total.inc(HASH_METHOD)
@@ -1,29 +1,165 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from bson.objectid import ObjectId
+import contextvars
+import functools
 import os
+import threading
 from dotenv import load_dotenv
 
-# Load environment variables from .env file in the backend directory
+# Load environment variables from .env file in the backend directory (before
+# importing modules that read their settings at import time)
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path=dotenv_path)
 
+from metrics import command_tracer
+
 # Retrive MONGODB_URI from environment variables
 mongo_uri = os.getenv("MONGODB_URI")
+DATABASE_NAME = "tasteknowledge"
+
+# The client is created on first use, not at import: importing the app needs
+# no database, and a process that forks (gunicorn --preload) gives every child
+# its own client, pymongo clients are not fork safe
+_client = None
+_client_lock = threading.Lock()
+# bumped whenever the client is replaced, the proxies below resolve again
+_generation = 0
+
+def configure(uri):
+    # point the module at another server (create_app config), before first use
+    global mongo_uri, _client, _generation
+    with _client_lock:
+        mongo_uri = uri
+        _client = None
+        _generation += 1
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Check if MONGODB_URI is set correctly
+                if not mongo_uri:
+                    raise ValueError("MONGODB_URI not set in environment variables")
+                # commands are traced per request, see metrics.py
+                _client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000, event_listeners=[command_tracer])
+    return _client
+
+def _after_fork():
+    global _client, _generation
+    _client = None
+    _generation += 1
+
+os.register_at_fork(after_in_child=_after_fork)
+
+# Read routing of the current request (see routing.py): (read preference or
+# None for the primary, causally consistent session or None). Not inherited by
+# other threads, background jobs always use the primary without a session.
+_route = contextvars.ContextVar("db_route", default=None)
+
+# collection methods that run in the session of the current request
+SESSION_OPERATIONS = frozenset((
+    "find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "bulk_write", "count_documents", "distinct", "aggregate",
+))
+
+def set_route(read_preference=None, session=None):
+    _route.set((read_preference, session) if read_preference is not None or session is not None else None)
+
+
+class LazyHandle:
+    # stands for the database (name None) or one of its collections until it
+    # is used, so modules keep importing recipes_collection & co at import time
+    __slots__ = ("_name", "_target", "_target_generation", "_routed")
 
-# Check if MONGODB_URI is set correctly
-if not mongo_uri:
-    raise ValueError("MONGODB_URI not set in environment variables")
+    def __init__(self, name=None):
+        self._name = name
+        self._target = None
+        self._target_generation = -1
+        # (read preference, copy of the target using it)
+        self._routed = None
 
-# Connect to MongoDB
-client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-db = client["tasteknowledge"]
+    def resolve(self):
+        if self._target_generation != _generation or self._target is None:
+            database = get_client()[DATABASE_NAME]
+            self._target = database if self._name is None else database[self._name]
+            self._target_generation = _generation
+            self._routed = None
+        route = _route.get()
+        if route is None or route[0] is None:
+            return self._target
+        # reads follow the request's read preference, writes always go to the primary
+        routed = self._routed
+        if routed is None or routed[0] != route[0]:
+            routed = self._routed = (route[0], self._target.with_options(read_preference=route[0]))
+        return routed[1]
+
+    def __getattr__(self, name):
+        attr = getattr(self.resolve(), name)
+        route = _route.get()
+        if route is not None and route[1] is not None and name in SESSION_OPERATIONS:
+            return functools.partial(attr, session=route[1])
+        return attr
+
+    def __getitem__(self, name):
+        # db["tombstones"] at import time stays lazy as well
+        if self._name is None:
+            return LazyHandle(name)
+        return self.resolve()[name]
+
+    def __repr__(self):
+        return f"LazyHandle({self._name or DATABASE_NAME})"
+
+db = LazyHandle()
 
 # Initialize all collections
-recipes_collection = db["recipes"]
-user_collection = db["users"]
-chef_collection = db["chefs"]
-ingredients_collection = db["ingredients"]
-comments_collection = db["comments"]
+recipes_collection = LazyHandle("recipes")
+user_collection = LazyHandle("users")
+chef_collection = LazyHandle("chefs")
+ingredients_collection = LazyHandle("ingredients")
+comments_collection = LazyHandle("comments")
 
 # Default avatar URL
-DEFAULT_AVATAR = "https://imgs.search.brave.com/GgV2avlvxYDeuhFu8D5KI3V8PNMBf6gEm59lDgvqhmg/rs:fit:860:0:0:0/g:ce/aHR0cHM6Ly9pLnBp/bmltZy5jb20vb3Jp/Z2luYWxzLzIzLzkx/LzllLzIzOTE5ZTlm/ZWRlYjIwZjljMDY3/OWYxYjI1NzllMzc0/LmpwZw"
\ No newline at end of file
+DEFAULT_AVATAR = "https://imgs.search.brave.com/GgV2avlvxYDeuhFu8D5KI3V8PNMBf6gEm59lDgvqhmg/rs:fit:860:0:0:0/g:ce/aHR0cHM6Ly9pLnBp/bmltZy5jb20vb3Jp/Z2luYWxzLzIzLzkx/LzllLzIzOTE5ZTlm/ZWRlYjIwZjljMDY3/OWYxYjI1NzllMzc0/LmpwZw"
+
+# Revision bookkeeping: every write to a document bumps its "revision" counter
+# and "updated_at" timestamp, so readers can derive cache validators from them.
+# updated_at always comes from the database clock ($currentDate): sync
+# checkpoints and invalidation polling compare it with the database time, an
+# app host running behind would stamp new documents below them.
+def new_revision_fields():
+    # fields to include in a freshly inserted document, written with
+    # insert_document() (or insert_update() in a bulk) for its updated_at
+    return {"revision": 1}
+
+def insert_update(doc):
+    # upsert update inserting doc, stamped like touch() does; the filter is {"_id": doc["_id"]}
+    fields = {key: value for key, value in doc.items() if key != "_id"}
+    return {"$setOnInsert": fields, "$currentDate": {"updated_at": True}}
+
+def insert_document(collection, doc):
+    # insert_one with updated_at from the database clock, returns the new _id
+    doc.setdefault("_id", ObjectId())
+    collection.update_one({"_id": doc["_id"]}, insert_update(doc), upsert=True)
+    return doc["_id"]
+
+def touch(update=None):
+    # add the revision bump to a mongodb update document
+    update = dict(update or {})
+    update["$currentDate"] = dict(update.get("$currentDate", {}), updated_at=True)
+    update["$inc"] = dict(update.get("$inc", {}), revision=1)
+    return update
+
+_indexes_ready = False
+
+def ensure_indexes():
+    # create the indexes used by the read paths (idempotent, runs once per process)
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    for collection in (recipes_collection, chef_collection, user_collection, ingredients_collection, comments_collection):
+        collection.create_index([("updated_at", DESCENDING)])
+    recipes_collection.create_index([("chef_id", ASCENDING)])
+    _indexes_ready = True
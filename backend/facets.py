@@ -0,0 +1,314 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+import numpy as np
+from bson.objectid import ObjectId
+from db import recipes_collection, ingredients_collection
+from invalidation import register_cache
+
+# Faceted recipe search for the explore page.
+# The filterable attributes of every recipe (tags, difficulty, time in
+# minutes, rating and nutrition totals computed from the ingredients) are
+# materialized into column arrays plus one boolean bitmap per tag, so a query
+# is a few vectorized AND/OR operations and the facet counts come from the
+# same masks. The index is rebuilt lazily after recipes or ingredients change
+# (see invalidation.py), at most every FACET_MIN_REBUILD_INTERVAL seconds.
+#   FACET_MIN_REBUILD_INTERVAL=1   seconds between rebuilds under write load
+#   FACET_INDEX_MAX_AGE=300        rebuild after this many seconds regardless
+
+MIN_REBUILD_INTERVAL = float(os.getenv("FACET_MIN_REBUILD_INTERVAL", "1"))
+INDEX_MAX_AGE = float(os.getenv("FACET_INDEX_MAX_AGE", "300"))
+MAX_PAGE_SIZE = 100
+# tags returned in the tag facet, most frequent first
+MAX_TAG_FACETS = 30
+
+# range facets: (label, low, high), low inclusive and high exclusive
+TIME_BUCKETS = (("15", 0, 16), ("30", 16, 31), ("60", 31, 61), ("60+", 61, math.inf))
+CALORIE_BUCKETS = (("<300", 0, 300), ("300-600", 300, 600), ("600-900", 600, 900), ("900+", 900, math.inf))
+# rating facet counts recipes rated at least the threshold
+RATING_THRESHOLDS = (4, 3, 2, 1)
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+SORTS = {
+    # name: (column, descending)
+    "rating": ("rating", True),
+    "newest": ("created", True),
+    "time": ("time", False),
+    "calories": ("calories", False),
+    "difficulty": ("difficulty", False),
+}
+CARD_FIELDS = {"title": 1, "image": 1, "time": 1, "difficulty": 1, "tags": 1, "rating": 1, "chef_id": 1, "ingredients": 1}
+
+logger = logging.getLogger("facets")
+
+
+# Materialized attributes
+_TIME_RE = re.compile(r"(\d+)\s*(h|hour|hr|m|min|minute)")
+
+def parse_minutes(value):
+    # same rules as explore.js ("30 min", "1 hour"); "> 60 min" sorts after 60
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return math.nan
+    text = value.lower().strip()
+    match = _TIME_RE.search(text)
+    if not match:
+        return math.nan
+    minutes = int(match.group(1)) * (60 if "h" in match.group(2) else 1)
+    return float(minutes + 1 if text.startswith(">") else minutes)
+
+def _number(value):
+    try:
+        if isinstance(value, str):
+            return float(value.replace(",", ".").strip())
+        return float(value)
+    except Exception:
+        return 0.0
+
+def recipe_nutrition(recipe, ingredients_by_id):
+    # totals as computed by enrich_recipe: values per 100g times the quantity
+    totals = dict.fromkeys(NUTRIENTS, 0.0)
+    for item in recipe.get("ingredients") or []:
+        ingredient = ingredients_by_id.get(str(item.get("ingredientId")))
+        if not ingredient:
+            continue
+        quantity = _number(item.get("quantity", 0))
+        for nutrient in NUTRIENTS:
+            totals[nutrient] += _number(ingredient.get(nutrient, 0)) * quantity / 100.0
+    return {nutrient: round(value) for nutrient, value in totals.items()}
+
+
+class FacetSnapshot:
+    # immutable column store over every recipe, rows are in _id order
+    def __init__(self, recipes, ingredients_by_id):
+        count = len(recipes)
+        self.size = count
+        self.cards = []
+        self.columns = {name: np.full(count, np.nan, dtype=np.float64) for name in ("difficulty", "time", "rating", "created") + NUTRIENTS}
+        self.titles = np.empty(count, dtype=object)
+        self.chef_ids = np.empty(count, dtype=object)
+        tag_rows = {}
+
+        for row, recipe in enumerate(recipes):
+            nutrition = recipe_nutrition(recipe, ingredients_by_id)
+            recipe.pop("ingredients", None)
+            self.cards.append(recipe)
+            self.columns["difficulty"][row] = _number(recipe.get("difficulty", 0))
+            self.columns["time"][row] = parse_minutes(recipe.get("time"))
+            self.columns["rating"][row] = _number(recipe.get("rating", 0))
+            self.columns["created"][row] = recipe["_id"].generation_time.timestamp() if isinstance(recipe["_id"], ObjectId) else 0
+            for nutrient in NUTRIENTS:
+                self.columns[nutrient][row] = nutrition[nutrient]
+            self.titles[row] = (recipe.get("title") or "").lower()
+            self.chef_ids[row] = str(recipe.get("chef_id") or "")
+            for tag in recipe.get("tags") or []:
+                if isinstance(tag, str) and tag.strip():
+                    tag_rows.setdefault(tag.strip().lower(), []).append(row)
+
+        self.tags = {}
+        for tag, rows in tag_rows.items():
+            bitmap = np.zeros(count, dtype=bool)
+            bitmap[rows] = True
+            self.tags[tag] = bitmap
+
+    def _range(self, column, low, high):
+        values = self.columns[column]
+        mask = np.ones(self.size, dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        if column == "time":
+            # recipes without a parsable time are never filtered out by time
+            mask |= np.isnan(values)
+        return mask
+
+    def _masks(self, query):
+        # one mask per active facet, combined with AND (values of a facet are OR-ed)
+        masks = {}
+        if query["q"]:
+            masks["q"] = np.fromiter((query["q"] in title for title in self.titles), dtype=bool, count=self.size)
+        if query["chef_id"]:
+            masks["chef"] = self.chef_ids == query["chef_id"]
+        if query["tags"]:
+            mask = np.zeros(self.size, dtype=bool)
+            for tag in query["tags"]:
+                if tag in self.tags:
+                    mask |= self.tags[tag]
+            masks["tags"] = mask
+        if query["difficulty"]:
+            masks["difficulty"] = np.isin(self.columns["difficulty"], query["difficulty"])
+        if query["min_time"] is not None or query["max_time"] is not None:
+            masks["time"] = self._range("time", query["min_time"], query["max_time"])
+        if query["min_rating"] is not None:
+            masks["rating"] = self._range("rating", query["min_rating"], None)
+        for nutrient in NUTRIENTS:
+            low, high = query[f"min_{nutrient}"], query[f"max_{nutrient}"]
+            if low is not None or high is not None:
+                masks[nutrient] = self._range(nutrient, low, high)
+        return masks
+
+    def _combine(self, masks, skip=None):
+        mask = np.ones(self.size, dtype=bool)
+        for name, facet_mask in masks.items():
+            if name != skip:
+                mask &= facet_mask
+        return mask
+
+    def _bucket_counts(self, column, base, buckets):
+        values = self.columns[column][base]
+        return {label: int(np.count_nonzero((values >= low) & (values < high))) for label, low, high in buckets}
+
+    def facets(self, masks):
+        # every facet is counted without its own filter, so the counts show
+        # what selecting another value of that facet would return
+        tag_base = self._combine(masks, skip="tags")
+        tag_counts = {tag: int(np.count_nonzero(bitmap & tag_base)) for tag, bitmap in self.tags.items()}
+        top_tags = sorted((item for item in tag_counts.items() if item[1]), key=lambda item: (-item[1], item[0]))[:MAX_TAG_FACETS]
+
+        difficulty_values = self.columns["difficulty"][self._combine(masks, skip="difficulty")]
+        rating_values = self.columns["rating"][self._combine(masks, skip="rating")]
+        return {
+            "tags": dict(top_tags),
+            "difficulty": {str(level): int(np.count_nonzero(difficulty_values == level)) for level in range(1, 6)},
+            "time": self._bucket_counts("time", self._combine(masks, skip="time"), TIME_BUCKETS),
+            "rating": {f"{threshold}+": int(np.count_nonzero(rating_values >= threshold)) for threshold in RATING_THRESHOLDS},
+            "calories": self._bucket_counts("calories", self._combine(masks, skip="calories"), CALORIE_BUCKETS),
+        }
+
+    def search(self, query):
+        masks = self._masks(query)
+        rows = np.flatnonzero(self._combine(masks))
+
+        column, descending = SORTS.get(query["sort"], (None, False))
+        if column:
+            values = self.columns[column][rows]
+            if descending:
+                values = -values
+            # stable, missing values last
+            missing = np.isnan(values)
+            order = np.lexsort((np.where(missing, 0, values), missing))
+            rows = rows[order]
+        elif query["sort"] == "title":
+            rows = rows[np.argsort(self.titles[rows], kind="stable")]
+
+        start = (query["page"] - 1) * query["page_size"]
+        page_rows = rows[start:start + query["page_size"]]
+        return {
+            "total": int(len(rows)),
+            "page": query["page"],
+            "page_size": query["page_size"],
+            "results": [self._card(row) for row in page_rows],
+            "facets": self.facets(masks),
+        }
+
+    def _card(self, row):
+        card = dict(self.cards[row])
+        card["calories"] = int(self.columns["calories"][row])
+        return card
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+        self._dirty = True
+        self._registered = False
+
+    # invalidation.register_cache interface
+    def invalidate(self, doc_id):
+        self._dirty = True
+
+    def clear(self):
+        self._dirty = True
+
+    def _stale(self):
+        age = time.monotonic() - self._built_at
+        return (self._dirty and age >= MIN_REBUILD_INTERVAL) or age >= INDEX_MAX_AGE
+
+    def snapshot(self):
+        if not self._registered:
+            self._registered = True
+            register_cache(self, ("recipes", "ingredients"))
+        if self._snapshot is None or self._stale():
+            # one thread rebuilds, the others keep serving the previous snapshot
+            if self._lock.acquire(blocking=self._snapshot is None):
+                try:
+                    if self._snapshot is None or self._stale():
+                        self.rebuild()
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def rebuild(self):
+        started = time.perf_counter()
+        # cleared first: changes made while loading mark the new snapshot dirty
+        self._dirty = False
+        ingredients_by_id = {
+            str(doc["_id"]): doc
+            for doc in ingredients_collection.find({}, {nutrient: 1 for nutrient in NUTRIENTS})
+        }
+        recipes = list(recipes_collection.find({}, CARD_FIELDS).sort("_id", 1))
+        self._snapshot = FacetSnapshot(recipes, ingredients_by_id)
+        self._built_at = time.monotonic()
+        logger.info(
+            "facet index rebuilt",
+            extra={"recipes": len(recipes), "tags": len(self._snapshot.tags), "build_ms": round((time.perf_counter() - started) * 1000, 1)}
+        )
+
+
+facet_index = FacetIndex()
+
+
+# Query parsing
+def _list_arg(args, name):
+    values = []
+    for raw in args.getlist(name):
+        values.extend(part.strip() for part in raw.split(",") if part.strip())
+    return values
+
+def _float_arg(args, name):
+    value = args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+def parse_query(args):
+    # raises ValueError with a message for the client
+    try:
+        page = max(int(args.get("page", 1)), 1)
+        page_size = min(max(int(args.get("page_size", 24)), 1), MAX_PAGE_SIZE)
+        difficulty = [int(v) for v in _list_arg(args, "difficulty")]
+    except ValueError:
+        raise ValueError("Invalid page, page_size or difficulty")
+    sort = args.get("sort", "rating")
+    if sort not in SORTS and sort != "title":
+        raise ValueError("Invalid sort")
+
+    query = {
+        "q": (args.get("q") or "").strip().lower(),
+        "chef_id": (args.get("chef_id") or "").strip(),
+        "tags": [tag.lower() for tag in _list_arg(args, "tags")],
+        "difficulty": difficulty,
+        "min_time": _float_arg(args, "min_time"),
+        "max_time": _float_arg(args, "max_time"),
+        "min_rating": _float_arg(args, "min_rating"),
+        "sort": sort,
+        "page": page,
+        "page_size": page_size,
+    }
+    for nutrient in NUTRIENTS:
+        query[f"min_{nutrient}"] = _float_arg(args, f"min_{nutrient}")
+        query[f"max_{nutrient}"] = _float_arg(args, f"max_{nutrient}")
+    return query
+
+def search(args):
+    return facet_index.snapshot().search(parse_query(args))
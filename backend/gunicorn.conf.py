@@ -0,0 +1,28 @@
+import os
+
+# Production server settings, run from the backend folder:
+#   pip install gunicorn
+#   gunicorn -c gunicorn.conf.py
+# The app is imported and warmed up once in the master (preload), the forked
+# workers share those pages and open their own MongoDB connection on start.
+#   WEB_CONCURRENCY=2   worker processes
+#   BIND=0.0.0.0:8000   listen address
+
+wsgi_app = "app:create_app()"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+preload_app = True
+
+
+def when_ready(server):
+    # master, before the workers are forked: imports only, no connections
+    from app import warm_up
+    warm_up(connect=False)
+
+def post_fork(server, worker):
+    # every worker connects before taking requests, /readyz reports the result
+    from app import warm_up
+    try:
+        warm_up(connect=True)
+    except Exception as e:
+        server.log.warning("worker %s warm-up failed, continuing lazily: %s", worker.pid, e)
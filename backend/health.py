@@ -0,0 +1,41 @@
+import os
+import time
+import pymongo
+from flask import jsonify
+from db import get_client
+import jobs
+
+# Probes for process managers and load balancers:
+#   /healthz  liveness: the process answers, MongoDB is not contacted
+#   /readyz   readiness: MongoDB answers a ping in time, 503 otherwise, so a
+#             worker only gets traffic once it can serve it
+#   READYZ_TIMEOUT=1   seconds allowed for the ping
+
+READY_TIMEOUT = float(os.getenv("READYZ_TIMEOUT", "1"))
+
+
+def ping_database(timeout=READY_TIMEOUT):
+    # round trip in milliseconds, raises when the server cannot be reached in time
+    started = time.perf_counter()
+    with pymongo.timeout(timeout):
+        get_client().admin.command("ping")
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def _no_store(response, status=200):
+    response.headers["Cache-Control"] = "no-store"
+    return response, status
+
+def init_health(app):
+    @app.route("/healthz")
+    def healthz():
+        return _no_store(jsonify({"status": "ok"}))
+
+    @app.route("/readyz")
+    def readyz():
+        checks = {"jobs": {"pending": jobs.queue.pending()}}
+        try:
+            checks["mongodb"] = {"ok": True, "ping_ms": ping_database()}
+        except Exception as e:
+            checks["mongodb"] = {"ok": False, "error": str(e)[:200]}
+            return _no_store(jsonify({"status": "unavailable", "checks": checks}), 503)
+        return _no_store(jsonify({"status": "ready", "checks": checks}))
@@ -0,0 +1,243 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import timezone
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from db import db
+from sync import server_time
+
+# Cache and index invalidation driven by MongoDB change streams.
+# Process-level caches register here and receive an event every time a
+# document of a watched collection changes, whoever changed it (another
+# worker process, an admin editing Mongo directly, a migration...).
+# Change streams need a replica set; on a standalone server the subscriber
+# falls back to polling updated_at (and the tombstones collection for deletes).
+#   INVALIDATION_MODE=auto|changestream|poll|off
+#   INVALIDATION_POLL_INTERVAL=2   seconds between polls in poll mode
+
+INVALIDATION_MODE = os.getenv("INVALIDATION_MODE", "auto")
+POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "2"))
+WATCHED_COLLECTIONS = ("recipes", "chefs", "users", "ingredients", "comments")
+
+# change stream errors meaning "not supported here" (standalone server)
+_UNSUPPORTED_CODES = {40573, 40324}
+# resume token no longer in the oplog
+_HISTORY_LOST_CODE = 286
+
+logger = logging.getLogger("invalidation")
+
+
+class InvalidationEvent:
+    __slots__ = ("collection", "operation", "doc_id")
+
+    def __init__(self, collection, operation, doc_id):
+        # operation is insert/update/replace/delete, or "reset" when every
+        # cached entry of the collection must be dropped (doc_id is None)
+        self.collection = collection
+        self.operation = operation
+        self.doc_id = doc_id
+
+    def __repr__(self):
+        return f"InvalidationEvent({self.collection}, {self.operation}, {self.doc_id})"
+
+
+_subscribers = []
+_subscribers_lock = threading.Lock()
+
+def subscribe(callback, collections=WATCHED_COLLECTIONS):
+    # callback(event) runs on the subscriber thread and must be quick
+    with _subscribers_lock:
+        _subscribers.append((frozenset(collections), callback))
+    start()
+    return callback
+
+def register_cache(cache, collections):
+    # cache objects expose invalidate(doc_id) and clear()
+    def _on_event(event):
+        if event.doc_id is None:
+            cache.clear()
+        else:
+            cache.invalidate(event.doc_id)
+    return subscribe(_on_event, collections)
+
+def publish(event):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for collections, callback in subscribers:
+        if event.collection in collections:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error("invalidation callback failed for %s: %s", event, e)
+
+def reset_all():
+    # drop everything, used when events may have been missed
+    for name in WATCHED_COLLECTIONS:
+        publish(InvalidationEvent(name, "reset", None))
+
+
+class Subscriber:
+    def __init__(self, mode=INVALIDATION_MODE, poll_interval=POLL_INTERVAL):
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.active_mode = None
+        self._resume_token = None
+        self._stop = threading.Event()
+        self._thread = None
+        # poll mode: newest updated_at seen per collection, and the documents
+        # already published at that time
+        self._watermarks = {}
+        self._seen = {}
+
+    def start(self):
+        if self.mode == "off" or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                if self.mode in ("auto", "changestream"):
+                    try:
+                        self.active_mode = "changestream"
+                        self._watch()
+                    except OperationFailure as e:
+                        if e.code not in _UNSUPPORTED_CODES or self.mode == "changestream":
+                            raise
+                        logger.info("change streams unavailable (%s), polling updated_at", e.code)
+                        self.mode = "poll"
+                if self.mode == "poll":
+                    self.active_mode = "poll"
+                    self._poll_forever()
+                backoff = 1
+            except OperationFailure as e:
+                if e.code == _HISTORY_LOST_CODE:
+                    # events were missed: start from now and drop every cache
+                    self._resume_token = None
+                    reset_all()
+                else:
+                    logger.error("invalidation subscriber error: %s", e)
+            except PyMongoError as e:
+                logger.warning("invalidation subscriber disconnected: %s", e)
+                # we may have missed events while disconnected
+                reset_all()
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    # change stream mode
+    def _watch(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete", "drop", "rename", "invalidate"]},
+        }}]
+        with db.watch(pipeline, resume_after=self._resume_token, max_await_time_ms=1000) as stream:
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self._resume_token = stream.resume_token
+                operation = change["operationType"]
+                collection = change.get("ns", {}).get("coll")
+                if operation in ("drop", "rename", "invalidate"):
+                    if collection:
+                        publish(InvalidationEvent(collection, "reset", None))
+                    else:
+                        reset_all()
+                    continue
+                publish(InvalidationEvent(collection, operation, change["documentKey"]["_id"]))
+
+    # polling fallback
+    def _poll_forever(self):
+        # updated_at is written with $currentDate, so start from the database clock
+        now = server_time()
+        for name in WATCHED_COLLECTIONS + ("tombstones",):
+            self._watermarks.setdefault(name, now)
+        while not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.poll_interval)
+
+    def _changed(self, source, field, projection=None):
+        # documents written since the last poll. $gte: a write in the same
+        # millisecond as the watermark may become visible after the previous
+        # poll, the ones already published at the watermark are skipped
+        since = self._watermarks[source]
+        seen = self._seen.get(source, set())
+        for doc in db[source].find({field: {"$gte": since}}, projection).sort(field, ASCENDING):
+            at = _aware(doc[field])
+            key = (doc["_id"], doc.get("revision"))
+            if at <= since and key in seen:
+                continue
+            if at > since:
+                since, seen = at, set()
+            seen.add(key)
+            yield doc
+        self._watermarks[source] = since
+        self._seen[source] = seen
+
+    def poll_once(self):
+        for name in WATCHED_COLLECTIONS:
+            for doc in self._changed(name, "updated_at", {"updated_at": 1, "revision": 1}):
+                publish(InvalidationEvent(name, "update", doc["_id"]))
+
+        # deletions are only visible through tombstones (see sync.py)
+        for tombstone in self._changed("tombstones", "deleted_at"):
+            publish(InvalidationEvent(tombstone["collection"], "delete", tombstone["doc_id"]))
+
+
+def _aware(dt):
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+subscriber = Subscriber()
+
+def start():
+    # started lazily by the first subscription
+    subscriber.start()
+
+def _after_fork():
+    # the subscriber thread does not survive fork, restart it in the child
+    # when caches subscribed before (e.g. warmed up in a preloading master)
+    global _subscribers_lock
+    _subscribers_lock = threading.Lock()
+    subscriber._thread = None
+    subscriber._stop = threading.Event()
+    if _subscribers:
+        subscriber.start()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def stop():
+    subscriber.stop()
+
+
+def main():
+    # print invalidation events, e.g. against a local replica set:
+    #   mongod --replSet rs0 --dbpath /tmp/rs0 && mongosh --eval "rs.initiate()"
+    #   MONGODB_URI=mongodb://localhost:27017/?replicaSet=rs0 python invalidation.py watch
+    parser = argparse.ArgumentParser(description="Watch cache invalidation events")
+    parser.add_argument("command", choices=["watch"])
+    parser.add_argument("--mode", default=INVALIDATION_MODE, choices=["auto", "changestream", "poll"])
+    args = parser.parse_args()
+
+    subscriber.mode = args.mode
+    subscribe(lambda event: print(f"{subscriber.active_mode}: {event}", flush=True))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop()
+
+
+if __name__ == "__main__":
+    main()
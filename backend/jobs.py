@@ -0,0 +1,165 @@
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from metrics import Counter, REGISTRY
+
+# In-process background job queue for derived data (ratings, counters, ...).
+# Writes enqueue a job and return immediately, worker threads run it later.
+# Handlers must be idempotent: a job may run more than once (retries) and
+# identical pending jobs are coalesced into one.
+#   JOB_WORKERS=2        worker threads
+#   JOB_MAX_RETRIES=5    attempts after the first failure
+#   JOB_RETRY_DELAY=0.5  first retry delay in seconds (doubles every attempt)
+#   JOBS_EAGER=0         1 runs jobs inline in the caller (deterministic tests)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "0.5"))
+JOBS_EAGER = os.getenv("JOBS_EAGER", "0") == "1"
+# seconds to wait for pending jobs when the process exits
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))
+
+logger = logging.getLogger("jobs")
+
+jobs_total = Counter("tk_jobs_total", "Background jobs by outcome", ("job", "outcome"))
+REGISTRY.append(jobs_total)
+
+_handlers = {}
+
+def handler(name):
+    # register an idempotent job handler under a name
+    def decorator(fn):
+        _handlers[name] = fn
+        return fn
+    return decorator
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._reset()
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        # heap of (run_at, sequence, key, name, args, attempt)
+        self._heap = []
+        self._sequence = itertools.count()
+        # keys of jobs waiting to run, used to coalesce duplicates
+        self._pending = set()
+        self._running = 0
+        self._threads = []
+        self._stopping = False
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, name, *args, key=None, delay=0.0, _attempt=0):
+        if name not in _handlers:
+            raise KeyError(f"unknown job {name}")
+        key = key if key is not None else (name,) + tuple(str(a) for a in args)
+        with self._cond:
+            if _attempt == 0 and key in self._pending:
+                jobs_total.inc(name, "coalesced")
+                return False
+            self._pending.add(key)
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), key, name, args, _attempt))
+            self._start()
+            self._cond.notify()
+        return True
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._stopping and not self._heap:
+                    return None
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        job = heapq.heappop(self._heap)
+                        # from now on an identical job must run again
+                        self._pending.discard(job[2])
+                        self._running += 1
+                        return job
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            _, _, key, name, args, attempt = job
+            try:
+                _handlers[name](*args)
+                jobs_total.inc(name, "success")
+            except Exception as e:
+                if attempt < JOB_MAX_RETRIES:
+                    jobs_total.inc(name, "retry")
+                    logger.warning("job %s%s failed (attempt %d): %s", name, args, attempt + 1, e)
+                    self.enqueue(name, *args, key=key, delay=JOB_RETRY_DELAY * (2 ** attempt), _attempt=attempt + 1)
+                else:
+                    jobs_total.inc(name, "failed")
+                    logger.exception("job %s%s gave up after %d attempts", name, args, attempt + 1)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def drain(self, timeout=None):
+        # block until every queued job (retries included) has finished,
+        # returns False if the timeout expired first
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap) + self._running
+
+    def shutdown(self, timeout=JOB_SHUTDOWN_TIMEOUT):
+        self.drain(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+
+queue = JobQueue()
+atexit.register(queue.shutdown)
+# worker threads do not survive fork: a forked child (gunicorn --preload)
+# starts with an empty queue and its own threads on the first enqueue
+os.register_at_fork(after_in_child=queue._reset)
+
+def enqueue(name, *args, key=None, delay=0.0):
+    # schedule a derived-data update, runs inline when JOBS_EAGER=1; with a
+    # delay, changes arriving meanwhile are coalesced into the same run
+    if JOBS_EAGER:
+        # a failing job must not fail the write that enqueued it, as with the
+        # worker threads (without their retries)
+        if name not in _handlers:
+            raise KeyError(f"unknown job {name}")
+        try:
+            _handlers[name](*args)
+            jobs_total.inc(name, "success")
+        except Exception:
+            jobs_total.inc(name, "failed")
+            logger.exception("job %s%s failed", name, args)
+        return True
+    return queue.enqueue(name, *args, key=key, delay=delay)
+
+def drain(timeout=None):
+    return queue.drain(timeout)
@@ -0,0 +1,162 @@
+import argparse
+import math
+import os
+import time
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from db import db, recipes_collection, comments_collection, user_collection, chef_collection
+from jobs import handler
+
+# Materialized leaderboards for the home page.
+# Every recipe with activity has one row in the leaderboard collection with
+#   trend      time-decayed popularity (comments and favorites), stored as
+#              log2(sum of weight * 2^(age / half-life)) relative to the epoch,
+#              so older rows never need rescoring: a newer event simply
+#              produces a larger value
+#   top_score  bayesian average rating (few ratings are pulled towards the prior)
+#   favorites  number of users who saved the recipe
+# Rows are recomputed from the recipe's comments and favorites by an
+# idempotent background job after every comment or favorite change, and each
+# ranking is read straight from a descending index.
+#   TRENDING_HALF_LIFE_HOURS=72   an event loses half its weight after this time
+#   TOP_RATING_PRIOR=3            prior mean rating
+#   TOP_RATING_PRIOR_WEIGHT=5     how many ratings the prior counts for
+
+leaderboard_collection = db["leaderboard"]
+HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "72"))
+RATING_PRIOR = float(os.getenv("TOP_RATING_PRIOR", "3"))
+RATING_PRIOR_WEIGHT = float(os.getenv("TOP_RATING_PRIOR_WEIGHT", "5"))
+
+COMMENT_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+MAX_PAGE_SIZE = 50
+# deepest page served, keeps skip() bounded
+MAX_PAGE = 20
+
+RANKINGS = {
+    # name: (field, minimum value to be listed)
+    "trending": ("trend", None),
+    "rating": ("top_score", 0),
+    "favorites": ("favorites", 1),
+}
+
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+_indexes_ready = False
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    for field, _ in RANKINGS.values():
+        leaderboard_collection.create_index([(field, DESCENDING), ("_id", ASCENDING)])
+    # inputs of the per-recipe recompute
+    comments_collection.create_index([("recipe_id", ASCENDING)])
+    for collection in (user_collection, chef_collection):
+        collection.create_index([("favorites.recipeId", ASCENDING)])
+    _indexes_ready = True
+
+
+def _half_lives(when):
+    # age of an event in half-lives since the epoch
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return (when - _EPOCH).total_seconds() / 3600.0 / HALF_LIFE_HOURS
+
+def decayed_log_score(events):
+    # events: [(weight, datetime)], returns log2(sum(weight * 2^half_lives))
+    # computed with the log-sum-exp trick so it never overflows
+    terms = [math.log2(weight) + _half_lives(when) for weight, when in events if weight > 0]
+    if not terms:
+        return None
+    top = max(terms)
+    return top + math.log2(sum(2 ** (term - top) for term in terms))
+
+def bayesian_rating(rating_sum, rating_count):
+    return (RATING_PRIOR * RATING_PRIOR_WEIGHT + rating_sum) / (RATING_PRIOR_WEIGHT + rating_count)
+
+
+@handler("refresh_recipe_scores")
+def refresh_recipe_scores(recipe_id):
+    # recompute one leaderboard row from scratch (idempotent)
+    _ensure_indexes()
+    recipe_obj = ObjectId(recipe_id)
+    if not recipes_collection.count_documents({"_id": recipe_obj}, limit=1):
+        leaderboard_collection.delete_one({"_id": recipe_obj})
+        return
+
+    events = []
+    rating_sum = rating_count = 0
+    for comment in comments_collection.find({"recipe_id": recipe_obj}, {"rate": 1}):
+        rate = comment.get("rate")
+        events.append((COMMENT_WEIGHT + (rate or 0) / 5.0, comment["_id"].generation_time))
+        if rate is not None:
+            rating_sum += float(rate)
+            rating_count += 1
+
+    favorites = 0
+    for collection in (user_collection, chef_collection):
+        for doc in collection.find({"favorites.recipeId": recipe_obj}, {"favorites.$": 1}):
+            favorites += 1
+            # favorites saved before added_at existed count as old as the recipe
+            added_at = doc["favorites"][0].get("added_at") or recipe_obj.generation_time
+            events.append((FAVORITE_WEIGHT, added_at))
+
+    trend = decayed_log_score(events)
+    leaderboard_collection.replace_one(
+        {"_id": recipe_obj},
+        {
+            "trend": trend,
+            "top_score": round(bayesian_rating(rating_sum, rating_count), 4) if rating_count else None,
+            "rating_count": rating_count,
+            "favorites": favorites,
+            "refreshed_at": datetime.now(timezone.utc),
+        },
+        upsert=True
+    )
+
+
+def ranking(name, page=1, page_size=20):
+    # returns ([(recipe id, row), ...], has_more) read from the ranking index
+    _ensure_indexes()
+    field, minimum = RANKINGS[name]
+    query = {field: {"$ne": None}} if minimum is None else {field: {"$gte": minimum}}
+    cursor = leaderboard_collection.find(query).sort([(field, DESCENDING), ("_id", ASCENDING)])
+    rows = list(cursor.skip((page - 1) * page_size).limit(page_size + 1))
+    return [(row["_id"], row) for row in rows[:page_size]], len(rows) > page_size
+
+def parse_page(args):
+    # raises ValueError with a message for the client
+    try:
+        page = int(args.get("page", 1))
+        page_size = int(args.get("page_size", 20))
+    except ValueError:
+        raise ValueError("Invalid page or page_size")
+    if page < 1 or page > MAX_PAGE:
+        raise ValueError(f"page must be between 1 and {MAX_PAGE}")
+    return page, min(max(page_size, 1), MAX_PAGE_SIZE)
+
+
+def rebuild(batch_log=500):
+    # backfill every recipe (run once after deploying, or after a bulk import)
+    _ensure_indexes()
+    started = time.perf_counter()
+    count = 0
+    for recipe in recipes_collection.find({}, {"_id": 1}):
+        refresh_recipe_scores(str(recipe["_id"]))
+        count += 1
+        if count % batch_log == 0:
+            print(f"{count} recipes scored")
+    print(f"{count} recipes scored in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe leaderboards")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    rebuild()
+
+
+if __name__ == "__main__":
+    main()
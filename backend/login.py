@@ -1,6 +1,7 @@
 from flask import Blueprint, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import check_password_hash
+import time
 from db import user_collection, chef_collection, DEFAULT_AVATAR
+from credentials import verify_password, needs_rehash, hash_password, record_login, CredentialServiceBusy
 
 login_bp = Blueprint("login_bp", __name__)
 
@@ -15,20 +16,38 @@ def login():
         flash("Please fill in all fields", "error")
         return redirect(url_for("login_bp.login"))
 
+    started = time.perf_counter()
+
     # Select collection based on user role (taken from db.py)
     collection = user_collection if role == "user" else chef_collection
     user = collection.find_one({"email": email})
 
-    # Verify password (hashed + fallback plaintext for development)
+    # Verify password in the hashing pool (legacy plaintext is still accepted)
     password_ok = False
-    if user:
+    rehashed = False
+    try:
+        if user:
+            password_ok = verify_password(user.get("password"), password)
+    except CredentialServiceBusy:
+        record_login("busy", time.perf_counter() - started)
+        return jsonify({
+            "success": False,
+            "message": "Server busy, please try again"
+        }), 503
+
+    # upgrade legacy/plaintext or outdated hashes to the current parameters;
+    # when the pool is busy the login still succeeds, the next one upgrades it
+    if password_ok and needs_rehash(user.get("password")):
         try:
-            password_ok = check_password_hash(user["password"], password)
-        except Exception:
-            password_ok = False
+            collection.update_one(
+                {"_id": user["_id"]},
+                {"$set": {"password": hash_password(password)}}
+            )
+            rehashed = True
+        except CredentialServiceBusy:
+            pass
 
-        if not password_ok and user.get("password") == password:
-            password_ok = True
+    record_login("success" if password_ok else "failure", time.perf_counter() - started, rehashed)
 
     if user and password_ok:
         # Create session
@@ -50,7 +69,7 @@ def login():
         session["role"] = role
 
         # set destination to Home or ChefProfile based on role
-        dest = url_for("home") if role == "user" else url_for("chefProfile")
+        dest = url_for("main_bp.home") if role == "user" else url_for("main_bp.chefProfile")
         # return a JSON response so the frontend can handle the redirection manually
         return jsonify({
             "success": True,
@@ -62,4 +81,4 @@ def login():
         return jsonify({
             "success": False,
             "message": "Invalid email or password"
-        }), 401
\ No newline at end of file
+        }), 401
@@ -0,0 +1,213 @@
+import hmac
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from flask import Response, abort, g, request
+from pymongo import monitoring
+
+# Request-level latency instrumentation and MongoDB command tracing.
+# Metrics are kept per process and exposed in the Prometheus text format
+# at /metrics; with several workers scrape each one (or aggregate upstream).
+
+# bearer token required to read /metrics; without one it is only served by
+# the debug server (it exposes per-endpoint traffic and login outcomes)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# add a Server-Timing header to every response (useful in browser devtools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels tuple -> [bucket counts..., sum, count]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.snapshot().items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "tk_http_request_duration_seconds", "Flask request latency",
+    ("endpoint", "method", "status"), LATENCY_BUCKETS
+)
+mongo_commands_per_request = Histogram(
+    "tk_mongo_commands_per_request", "MongoDB round trips issued by one request",
+    ("endpoint",), COUNT_BUCKETS
+)
+mongo_time_per_request = Histogram(
+    "tk_mongo_time_per_request_seconds", "Total MongoDB time spent by one request",
+    ("endpoint",), LATENCY_BUCKETS
+)
+mongo_command_duration = Histogram(
+    "tk_mongo_command_duration_seconds", "MongoDB command latency",
+    ("endpoint", "command"), LATENCY_BUCKETS
+)
+mongo_command_failures = Counter(
+    "tk_mongo_command_failures_total", "Failed MongoDB commands",
+    ("endpoint", "command")
+)
+
+# registry rendered at /metrics, other modules can append their own metrics
+REGISTRY = [request_duration, mongo_commands_per_request, mongo_time_per_request, mongo_command_duration, mongo_command_failures]
+
+
+# pymongo runs command listeners on the thread that issued the command, so a
+# thread-local tells which request (endpoint) the command belongs to
+_current = threading.local()
+
+def _current_endpoint():
+    return getattr(_current, "endpoint", None) or "background"
+
+def current_request_id():
+    # id of the request served by this thread (None outside requests)
+    return getattr(_current, "request_id", None)
+
+access_logger = logging.getLogger("access")
+
+class CommandTracer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def _record(self, event, failed):
+        endpoint = _current_endpoint()
+        duration = event.duration_micros / 1e6
+        mongo_command_duration.observe(duration, endpoint, event.command_name)
+        if failed:
+            mongo_command_failures.inc(endpoint, event.command_name)
+        stats = getattr(_current, "stats", None)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += duration
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+command_tracer = CommandTracer()
+
+
+def init_metrics(app):
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        # reuse the id set by a proxy so logs can be correlated end to end
+        incoming = request.headers.get("X-Request-Id", "")
+        g.request_id = incoming[:64] if incoming else uuid.uuid4().hex[:16]
+        _current.request_id = g.request_id
+        _current.endpoint = request.endpoint or "unknown"
+        # [mongo command count, mongo seconds]
+        _current.stats = [0, 0.0]
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        endpoint = request.endpoint or "unknown"
+        commands, mongo_seconds = getattr(_current, "stats", None) or (0, 0.0)
+
+        if endpoint != "metrics":
+            request_duration.observe(duration, endpoint, request.method, response.status_code)
+            mongo_commands_per_request.observe(commands, endpoint)
+            mongo_time_per_request.observe(mongo_seconds, endpoint)
+
+        response.headers["X-Request-Id"] = g.get("request_id", "")
+        access_logger.info(
+            "%s %s %s", request.method, request.path, response.status_code,
+            extra={
+                "endpoint": endpoint,
+                "duration_ms": round(duration * 1000, 2),
+                "mongo_commands": commands,
+                "mongo_ms": round(mongo_seconds * 1000, 2),
+            }
+        )
+
+        if SERVER_TIMING or app.debug:
+            response.headers["Server-Timing"] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={mongo_seconds * 1000:.1f};desc="{commands} mongo commands"'
+            )
+        return response
+
+    @app.teardown_request
+    def _reset(exc):
+        _current.request_id = None
+        _current.endpoint = None
+        _current.stats = None
+
+    @app.route("/metrics")
+    def metrics():
+        if not METRICS_TOKEN:
+            if not app.debug:
+                abort(404)
+        elif not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            abort(401)
+        lines = []
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
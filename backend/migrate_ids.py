@@ -0,0 +1,214 @@
+import argparse
+import sys
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from db import db, recipes_collection, chef_collection, user_collection, touch
+from bulk import BulkWriter, Progress, DEFAULT_BATCH_SIZE
+
+# Rewrites id references to one canonical form, ObjectId everywhere:
+#   users, chefs  followedChefs                [chef id]
+#   users, chefs  favorites                    [{recipeId, added_at}]
+#   chefs         recipeList                   [recipe id]
+#   recipes       commentsList                 [comment id]
+#   recipes       chef_id, ingredients.ingredientId
+# Older documents hold strings, {"chefId": ...} / {"recipeId": ...} dicts or
+# bare ids. References that are not valid ids are dropped and duplicates keep
+# their first occurrence.
+#
+# Documents are read in _id order and rewritten with unordered bulk_write
+# batches. The last _id of every finished batch is saved in the migrations
+# collection, so an interrupted run resumes where it stopped (--restart
+# starts over). Each update only applies if the document still holds the
+# values that were read; a document changed in the meantime is reported by
+# verify and fixed by the next run.
+# The read paths expect the canonical form, run and verify before deploying:
+#   python migrate_ids.py run [--batch-size 1000] [--dry-run] [--restart]
+#   python migrate_ids.py verify
+
+MIGRATION_ID = "normalize_ids"
+migrations_collection = db["migrations"]
+
+
+# Canonical forms
+def to_objectid(value):
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value.strip()):
+        return ObjectId(value.strip())
+    return None
+
+def id_list(values, key=None):
+    # [ObjectId], items may be ids, id strings or {key: id} dicts
+    result, seen = [], set()
+    for item in values if isinstance(values, list) else []:
+        oid = to_objectid(item.get(key) if key and isinstance(item, dict) else item)
+        if oid is not None and oid not in seen:
+            seen.add(oid)
+            result.append(oid)
+    return result
+
+def favorite_list(values):
+    # [{recipeId, added_at}], added_at only when one of the duplicates recorded it
+    result, seen = [], {}
+    for item in values if isinstance(values, list) else []:
+        oid = to_objectid(item.get("recipeId") if isinstance(item, dict) else item)
+        if oid is None:
+            continue
+        favorite = seen.get(oid)
+        if favorite is None:
+            favorite = seen[oid] = {"recipeId": oid}
+            result.append(favorite)
+        if isinstance(item, dict) and item.get("added_at") and "added_at" not in favorite:
+            favorite["added_at"] = item["added_at"]
+    return result
+
+def ingredient_lines(values):
+    # ingredient ids that cannot be converted are kept for verify to report
+    lines = []
+    for item in values if isinstance(values, list) else []:
+        if isinstance(item, dict) and item.get("ingredientId") is not None:
+            oid = to_objectid(item["ingredientId"])
+            if oid is not None:
+                item = dict(item, ingredientId=oid)
+        lines.append(item)
+    return lines
+
+
+def _normalize_person(doc):
+    fields = {}
+    if "followedChefs" in doc:
+        fields["followedChefs"] = id_list(doc["followedChefs"], "chefId")
+    if "favorites" in doc:
+        fields["favorites"] = favorite_list(doc["favorites"])
+    return fields
+
+def _normalize_chef(doc):
+    fields = _normalize_person(doc)
+    if "recipeList" in doc:
+        fields["recipeList"] = id_list(doc["recipeList"], "recipeId")
+    return fields
+
+def _normalize_recipe(doc):
+    fields = {}
+    if "commentsList" in doc:
+        fields["commentsList"] = id_list(doc["commentsList"])
+    if doc.get("chef_id") is not None and to_objectid(doc["chef_id"]) is not None:
+        fields["chef_id"] = to_objectid(doc["chef_id"])
+    if "ingredients" in doc:
+        fields["ingredients"] = ingredient_lines(doc["ingredients"])
+    return fields
+
+def _invalid_recipe_refs(doc):
+    # references verify cannot fix by rerunning
+    problems = []
+    if doc.get("chef_id") is not None and not isinstance(doc["chef_id"], ObjectId):
+        problems.append("chef_id")
+    for item in doc.get("ingredients") or []:
+        if isinstance(item, dict) and item.get("ingredientId") is not None and not isinstance(item["ingredientId"], ObjectId):
+            problems.append("ingredients.ingredientId")
+            break
+    return problems
+
+# (name, collection, fields read, normalizer)
+TARGETS = (
+    ("users", user_collection, ("followedChefs", "favorites"), _normalize_person),
+    ("chefs", chef_collection, ("followedChefs", "favorites", "recipeList"), _normalize_chef),
+    ("recipes", recipes_collection, ("commentsList", "chef_id", "ingredients"), _normalize_recipe),
+)
+
+def changes_for(doc, normalize):
+    return {field: value for field, value in normalize(doc).items() if value != doc.get(field)}
+
+
+# Run
+def _batches(collection, fields, start_after, batch_size):
+    # separate range queries instead of one long cursor, nothing times out
+    projection = dict.fromkeys(fields, 1)
+    last = start_after
+    while True:
+        query = {"_id": {"$gt": last}} if last is not None else {}
+        batch = list(collection.find(query, projection).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]["_id"]
+
+def run(batch_size=DEFAULT_BATCH_SIZE, dry_run=False, restart=False):
+    state = migrations_collection.find_one({"_id": MIGRATION_ID}) or {}
+    positions = {} if restart else state.get("positions", {})
+    if not dry_run:
+        migrations_collection.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"positions": positions, "started_at": datetime.now(timezone.utc)}, "$unset": {"finished_at": ""}},
+            upsert=True
+        )
+
+    for name, collection, fields, normalize in TARGETS:
+        progress = Progress(name)
+        writer = BulkWriter(collection, progress, batch_size, dry_run)
+        if positions.get(name) is not None:
+            print(f"{name}: resuming after {positions[name]}", file=sys.stderr)
+        for batch in _batches(collection, fields, positions.get(name), batch_size):
+            for doc in batch:
+                changes = changes_for(doc, normalize)
+                if changes:
+                    # only applies to the version that was read
+                    current = {field: doc[field] for field in changes if field in doc}
+                    writer.add(UpdateOne({"_id": doc["_id"], **current}, touch({"$set": changes})))
+            writer.flush()
+            positions[name] = batch[-1]["_id"]
+            if not dry_run:
+                migrations_collection.update_one({"_id": MIGRATION_ID}, {"$set": {f"positions.{name}": positions[name]}})
+        progress.report(final=True)
+
+    if not dry_run:
+        # a finished run is not resumed, the next one scans everything again
+        migrations_collection.update_one({"_id": MIGRATION_ID}, {"$set": {"finished_at": datetime.now(timezone.utc), "positions": {}}})
+
+
+# Verification
+def verify(batch_size=DEFAULT_BATCH_SIZE, samples=5):
+    # full scan, returns the number of documents still not canonical
+    remaining = 0
+    for name, collection, fields, normalize in TARGETS:
+        counts, examples = {}, []
+        for batch in _batches(collection, fields, None, batch_size):
+            for doc in batch:
+                problems = list(changes_for(doc, normalize))
+                if name == "recipes":
+                    problems += [p for p in _invalid_recipe_refs(doc) if p not in problems]
+                for field in problems:
+                    counts[field] = counts.get(field, 0) + 1
+                if problems:
+                    remaining += 1
+                    if len(examples) < samples:
+                        examples.append(str(doc["_id"]))
+        status = ", ".join(f"{field}: {count}" for field, count in sorted(counts.items())) or "ok"
+        print(f"{name}: {status}" + (f" (e.g. {', '.join(examples)})" if examples else ""))
+
+    if remaining == 0:
+        migrations_collection.update_one({"_id": MIGRATION_ID}, {"$set": {"verified_at": datetime.now(timezone.utc)}}, upsert=True)
+    return remaining
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize stored id references to ObjectId")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="rewrite documents, resumes an interrupted run")
+    run_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    run_parser.add_argument("--dry-run", action="store_true", help="count the documents to rewrite")
+    run_parser.add_argument("--restart", action="store_true", help="ignore the position of an interrupted run")
+    sub.add_parser("verify", help="report documents that are not canonical yet")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.batch_size, args.dry_run, args.restart)
+    else:
+        remaining = verify()
+        print("all references are canonical" if remaining == 0 else f"{remaining} documents to fix, run again")
+        sys.exit(1 if remaining else 0)
+
+
+if __name__ == "__main__":
+    main()
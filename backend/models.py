@@ -0,0 +1,284 @@
+import os
+from db import recipes_collection, chef_collection, ingredients_collection, DEFAULT_AVATAR
+from caching import LRUCache, doc_version, collection_version
+from invalidation import subscribe
+import snapshot
+
+# Compact domain model for recipes and the views the API returns.
+# Documents are read into slotted objects and every endpoint renders one of
+# two explicit views instead of patching the raw pymongo dicts:
+#   card    list views (recipeCard.js): title, image, time, difficulty, tags,
+#           rating and author
+#   detail  recipe page and offline sync: card plus description, steps,
+#           ingredients with their catalog data and nutrition totals
+# Rendered views are memoized per recipe, view and version (recipe revision,
+# author revision and, for detail, the ingredient catalog version), so an
+# unchanged recipe is built once. Views are shared between requests: copy
+# them before adding keys. Authors, ingredients and card fields are read from
+# the shared catalog snapshot (snapshot.py) when it is current.
+#   RECIPE_VIEW_CACHE_SIZE=4096   rendered views kept in memory
+
+VIEW_CACHE_SIZE = int(os.getenv("RECIPE_VIEW_CACHE_SIZE", "4096"))
+NUTRIENTS = ("protein", "carbs", "fats", "calories")
+
+CARD_FIELDS = ("_id", "title", "description", "image", "time", "difficulty", "tags", "rating", "chef_id", "user_name", "user_avatar")
+# stored fields each view reads, plus the version fields
+VIEW_PROJECTIONS = {
+    "card": {"title": 1, "description": 1, "image": 1, "time": 1, "difficulty": 1, "tags": 1, "rating": 1, "chef_id": 1, "revision": 1, "updated_at": 1},
+    "detail": {"commentsList": 0, "ratings": 0},
+}
+VERSION_PROJECTION = {"chef_id": 1, "revision": 1, "updated_at": 1}
+AUTHOR_PROJECTION = {"user_name": 1, "user_avatar": 1, "revision": 1, "updated_at": 1}
+
+
+def _number(value):
+    try:
+        if isinstance(value, str):
+            return float(value.replace(",", ".").strip())
+        return float(value)
+    except Exception:
+        return 0.0
+
+
+class Ingredient:
+    # catalog ingredient, nutrients are per 100g
+    __slots__ = ("id", "name", "unit", "protein", "carbs", "fats", "calories", "scientific_description")
+
+    def __init__(self, id, name, unit="", protein=0, carbs=0, fats=0, calories=0, scientific_description=""):
+        self.id = id
+        self.name = name
+        self.unit = unit
+        self.protein = protein
+        self.carbs = carbs
+        self.fats = fats
+        self.calories = calories
+        self.scientific_description = scientific_description
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(
+            doc["_id"], doc.get("ingredientName", doc.get("name", "Unknown Ingredient")), doc.get("unit", ""),
+            doc.get("protein", 0), doc.get("carbs", 0), doc.get("fats", 0), doc.get("calories", 0),
+            doc.get("scientificDescription", "")
+        )
+
+UNKNOWN_INGREDIENT = Ingredient(None, "Unknown Ingredient")
+
+
+class RecipeIngredient:
+    # one line of a recipe: a catalog ingredient and a quantity in grams
+    __slots__ = ("ingredient_id", "quantity", "ingredient")
+
+    def __init__(self, ingredient_id, quantity, ingredient=UNKNOWN_INGREDIENT):
+        self.ingredient_id = ingredient_id
+        self.quantity = quantity
+        self.ingredient = ingredient
+
+    def amount(self, nutrient):
+        return _number(getattr(self.ingredient, nutrient)) * _number(self.quantity) / 100.0
+
+    def to_dict(self):
+        ingredient = self.ingredient
+        return {
+            "ingredientId": self.ingredient_id,
+            "quantity": self.quantity,
+            "name": ingredient.name,
+            "unit": ingredient.unit,
+            "protein": ingredient.protein,
+            "carbs": ingredient.carbs,
+            "fats": ingredient.fats,
+            "calories": ingredient.calories,
+            "scientificDescription": ingredient.scientific_description,
+        }
+
+
+class Chef:
+    __slots__ = ("id", "user_name", "nickname", "user_avatar", "bio", "info", "followers", "recipe_ids", "version")
+
+    def __init__(self, id, user_name="Unknown Chef", nickname="", user_avatar="", bio="", info="", followers=0, recipe_ids=(), version=None):
+        self.id = id
+        self.user_name = user_name
+        self.nickname = nickname
+        self.user_avatar = user_avatar or DEFAULT_AVATAR
+        self.bio = bio
+        self.info = info
+        self.followers = followers
+        self.recipe_ids = recipe_ids
+        self.version = version
+
+    @classmethod
+    def from_doc(cls, doc):
+        # recipeList holds recipe ObjectIds (see migrate_ids.py)
+        recipe_ids = list(doc.get("recipeList") or [])
+        return cls(
+            doc["_id"], doc.get("user_name", "Unknown Chef"), doc.get("nickname", ""), doc.get("user_avatar", ""),
+            doc.get("bio", ""), doc.get("info", ""), doc.get("followers", 0), recipe_ids, doc_version(doc)
+        )
+
+    def profile(self):
+        return {
+            "_id": self.id,
+            "user_name": self.user_name,
+            "nickname": self.nickname,
+            "user_avatar": self.user_avatar,
+            "bio": self.bio,
+            "info": self.info,
+            "followers": self.followers,
+            "recipes_count": len(self.recipe_ids),
+        }
+
+UNKNOWN_CHEF = Chef(None)
+
+
+class Recipe:
+    __slots__ = ("id", "title", "description", "image", "time", "difficulty", "tags", "rating", "chef_id", "chef", "ingredients", "steps", "updated_at")
+
+    def __init__(self, id, title="", description="", image="", time="", difficulty=None, tags=(), rating=0,
+                 chef_id=None, chef=UNKNOWN_CHEF, ingredients=(), steps=(), updated_at=None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.image = image
+        self.time = time
+        self.difficulty = difficulty
+        self.tags = tags
+        self.rating = rating
+        self.chef_id = chef_id
+        self.chef = chef
+        self.ingredients = ingredients
+        self.steps = steps
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_doc(cls, doc, chefs_by_id=None, ingredients_by_id=None):
+        # chefs_by_id / ingredients_by_id are keyed by str(_id)
+        chefs_by_id = chefs_by_id or {}
+        ingredients_by_id = ingredients_by_id or {}
+        ingredients = []
+        for item in doc.get("ingredients") or []:
+            if isinstance(item, dict):
+                iid = item.get("ingredientId")
+                ingredients.append(RecipeIngredient(iid, item.get("quantity", ""), ingredients_by_id.get(str(iid), UNKNOWN_INGREDIENT)))
+        return cls(
+            doc["_id"], doc.get("title", ""), doc.get("description", ""), doc.get("image", ""), doc.get("time", ""),
+            doc.get("difficulty"), doc.get("tags") or [], doc.get("rating", 0), doc.get("chef_id"),
+            chefs_by_id.get(str(doc.get("chef_id")), UNKNOWN_CHEF), ingredients,
+            doc.get("preparationSteps") or [], doc.get("updated_at")
+        )
+
+    def nutrition(self):
+        # totals for the whole recipe, rounded to integers
+        return {nutrient: int(round(sum(line.amount(nutrient) for line in self.ingredients))) for nutrient in NUTRIENTS}
+
+    def card(self):
+        return {
+            "_id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "image": self.image,
+            "time": self.time,
+            "difficulty": self.difficulty,
+            "tags": self.tags,
+            "rating": self.rating,
+            "chef_id": self.chef_id,
+            "user_name": self.chef.user_name,
+            "user_avatar": self.chef.user_avatar,
+        }
+
+    def detail(self):
+        data = self.card()
+        data["preparationSteps"] = self.steps
+        data["ingredients"] = [line.to_dict() for line in self.ingredients]
+        data["updated_at"] = self.updated_at
+        data.update(self.nutrition())
+        return data
+
+
+# Rendering with memoization
+view_cache = LRUCache(VIEW_CACHE_SIZE)
+_invalidation_registered = False
+
+def _on_recipe_change(event):
+    # entries are versioned already, this only frees memory early
+    if event.doc_id is None:
+        view_cache.clear()
+    else:
+        for view in VIEW_PROJECTIONS:
+            view_cache.invalidate((event.doc_id, view))
+
+def _authors(docs):
+    chef_ids = {doc["chef_id"] for doc in docs if doc.get("chef_id")}
+    if not chef_ids:
+        return {}
+    chefs = {
+        key: Chef(row["_id"], row["user_name"], user_avatar=row["user_avatar"], version=row["version"])
+        for key, row in snapshot.chefs(chef_ids).items()
+    }
+    missing = [chef_id for chef_id in chef_ids if str(chef_id) not in chefs]
+    if missing:
+        chefs.update((str(chef["_id"]), Chef.from_doc(chef)) for chef in chef_collection.find({"_id": {"$in": missing}}, AUTHOR_PROJECTION))
+    return chefs
+
+def view_versions(docs, view, chefs=None):
+    # (authors by id, version of every document's view); chefs: authors
+    # resolved by an earlier call, so the views rendered with them match the
+    # versions computed before (the snapshot may have been reloaded meanwhile)
+    global _invalidation_registered
+    if not _invalidation_registered:
+        _invalidation_registered = True
+        subscribe(_on_recipe_change, ("recipes",))
+    if chefs is None:
+        chefs = _authors(docs)
+    catalog = collection_version(ingredients_collection) if view == "detail" else None
+    versions = []
+    for doc in docs:
+        chef = chefs.get(str(doc.get("chef_id")))
+        versions.append((doc_version(doc), chef.version if chef else None, catalog))
+    return chefs, versions
+
+def _catalog(docs, version):
+    ids = set()
+    for doc in docs:
+        for item in (doc or {}).get("ingredients") or []:
+            iid = item.get("ingredientId") if isinstance(item, dict) else None
+            if iid:
+                ids.add(iid)
+    if not ids:
+        return {}
+    rows = snapshot.ingredients(ids, version)
+    if rows is None:
+        rows = {str(doc["_id"]): doc for doc in ingredients_collection.find({"_id": {"$in": list(ids)}})}
+    return {key: Ingredient.from_doc(doc) for key, doc in rows.items()}
+
+def _render(docs, view, chefs, versions, views):
+    # fills the entries of views with a document in docs (None elsewhere), one
+    # ingredient lookup for all of them
+    ingredients = _catalog(docs, versions[0][2]) if view == "detail" and versions else {}
+    for i, doc in enumerate(docs):
+        if views[i] is None and doc is not None:
+            views[i] = getattr(Recipe.from_doc(doc, chefs, ingredients), view)()
+            view_cache.put((doc["_id"], view), views[i], versions[i])
+    return views
+
+def render_recipes(docs, view="card", chefs=None):
+    # docs must hold the fields in VIEW_PROJECTIONS[view], chefs: see view_versions
+    chefs, versions = view_versions(docs, view, chefs)
+    views = [view_cache.get((doc["_id"], view), version) for doc, version in zip(docs, versions)]
+    missing = [doc if cached is None else None for doc, cached in zip(docs, views)]
+    return _render(missing, view, chefs, versions, views)
+
+def load_recipes(query, view="card"):
+    # reads only the versions first, full documents are fetched for the
+    # recipes whose view is not cached yet (cards from the snapshot if current)
+    stubs = list(recipes_collection.find(query, VERSION_PROJECTION))
+    chefs, versions = view_versions(stubs, view)
+    views = [view_cache.get((stub["_id"], view), version) for stub, version in zip(stubs, versions)]
+    missing = {stub["_id"]: version[0] for stub, version, cached in zip(stubs, versions, views) if cached is None}
+    if missing:
+        docs = snapshot.recipe_cards(missing) if view == "card" else {}
+        missing_ids = [recipe_id for recipe_id in missing if recipe_id not in docs]
+        if missing_ids:
+            docs.update((doc["_id"], doc) for doc in recipes_collection.find({"_id": {"$in": missing_ids}}, VIEW_PROJECTIONS[view]))
+        _render([docs.get(stub["_id"]) if cached is None else None for stub, cached in zip(stubs, views)], view, chefs, versions, views)
+    # recipes deleted between the two reads are dropped
+    return [v for v in views if v is not None]
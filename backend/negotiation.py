@@ -0,0 +1,117 @@
+import os
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # brotli is listed in requirements.txt, without it br is not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is listed in requirements.txt, without it zstd is not offered
+    zstandard = None
+
+# Response compression negotiated with Accept-Encoding (the representation,
+# json or msgpack, is picked by the json provider, see serialization.py).
+# Buffered bodies below COMPRESS_MIN_SIZE bytes are sent as they are, streamed
+# bodies are compressed chunk by chunk and flushed to the client every
+# COMPRESS_STREAM_FLUSH bytes of input (0: after every chunk).
+# COMPRESS_ENCODINGS is the server preference when the client accepts
+# several with the same quality.
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_STREAM_FLUSH = int(os.getenv("COMPRESS_STREAM_FLUSH", "16384"))
+COMPRESS_ENCODINGS = [e.strip() for e in os.getenv("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+COMPRESSIBLE_MIMETYPES = frozenset((
+    "application/json", "application/msgpack", "text/html", "text/plain",
+))
+
+# levels for dynamic responses: most of the size gain for little cpu
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+# every compressor is (compress(chunk), flush() -> bytes so far, finish())
+def _gzip():
+    z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return z.compress, lambda: z.flush(zlib.Z_SYNC_FLUSH), z.flush
+
+def _brotli():
+    c = brotli.Compressor(quality=BROTLI_QUALITY)
+    return c.process, c.flush, c.finish
+
+def _zstd():
+    c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+
+COMPRESSORS = {"gzip": _gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _brotli
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _zstd
+
+
+def choose_encoding(accept_encodings, encodings=None):
+    # best encoding the client accepts, None for identity
+    offered = [e for e in (encodings or COMPRESS_ENCODINGS) if e in COMPRESSORS]
+    return accept_encodings.best_match(offered) if offered else None
+
+def compress(body, encoding):
+    compress_chunk, _, finish = COMPRESSORS[encoding]()
+    return compress_chunk(body) + finish()
+
+def compress_stream(chunks, encoding, flush_every=None):
+    compress_chunk, flush, finish = COMPRESSORS[encoding]()
+    flush_every = COMPRESS_STREAM_FLUSH if flush_every is None else flush_every
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compress_chunk(chunk)
+        pending += len(chunk)
+        # flushing costs some ratio, small chunks are flushed together
+        if pending >= flush_every:
+            data += flush()
+            pending = 0
+        if data:
+            yield data
+    yield finish()
+
+
+def _compressible(response):
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or request.method == "HEAD":
+        return False
+    # files (send_file), precompressed assets, partial and empty responses
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    return "no-transform" not in response.headers.get("Cache-Control", "")
+
+def init_negotiation(app):
+    @app.after_request
+    def _compress(response):
+        if response.status_code == 304:
+            # same Vary as the full response would have
+            response.vary.add("Accept-Encoding")
+        if not _compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < COMPRESS_MIN_SIZE:
+                return response
+            response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        # etags are weak (caching.py): the decoded body is unchanged
+        return response
@@ -0,0 +1,200 @@
+import argparse
+import cProfile
+import glob
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from flask import g, request
+
+logger = logging.getLogger("profiling")
+
+# On-demand profiling of Flask views and blueprints.
+# A request is profiled when:
+#   - it carries the header "X-Profile: <PROFILE_TOKEN>" (or ?__profile=<token>), or
+#   - it falls in the sampled percentage PROFILE_SAMPLE_RATE (0.0 - 1.0)
+# Each profiled request writes a cProfile dump (.prof) and a collapsed-stack
+# file (.folded, flamegraph.pl / speedscope compatible) to PROFILE_DIR.
+# Aggregate the dumps with:  python profiling.py report [--endpoint main_bp.api_recipes]
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles"))
+# keep at most this many dumps, the oldest are removed first
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "500"))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_ARG = "__profile"
+
+
+def _requested_by_client():
+    if not PROFILE_TOKEN:
+        # explicit profiling is disabled without a token
+        return False
+    supplied = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG) or ""
+    return hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+def _sampled():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def should_profile():
+    return _requested_by_client() or _sampled()
+
+
+def _folded_stacks(profiler):
+    # turn cProfile caller data into collapsed stacks ("a;b;c <microseconds>").
+    # cProfile keeps one level of callers only, so every stack is caller;callee
+    # rooted at the functions that have no profiled caller.
+    stats = pstats.Stats(profiler)
+    lines = Counter()
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        name = _func_label(func)
+        if not callers:
+            lines[name] += int(tottime * 1e6)
+            continue
+        for caller, caller_stats in callers.items():
+            # caller_stats[2] is the time spent in func when called from caller
+            lines[f"{_func_label(caller)};{name}"] += int(caller_stats[2] * 1e6)
+    return "\n".join(f"{stack} {us}" for stack, us in lines.most_common() if us > 0) + "\n"
+
+def _func_label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+def _prune():
+    files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.prof")), key=os.path.getmtime)
+    for path in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+        for stale in (path, path[:-len(".prof")] + ".folded"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def _dump(profiler, endpoint, duration):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_endpoint = re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint or "unknown")
+    base = os.path.join(
+        PROFILE_DIR,
+        f"{int(time.time())}-{safe_endpoint}-{int(duration * 1000)}ms-{uuid.uuid4().hex[:8]}"
+    )
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        f.write(_folded_stacks(profiler))
+    _prune()
+    return base
+
+
+def init_profiling(app):
+    # hooks wrap every view, blueprints included (chef_bot_bp, login_bp, register_bp)
+    @app.before_request
+    def _start_profiler():
+        if should_profile():
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler is already running (only one at a time on Python 3.12+)
+                return
+            g.profiler = profiler
+            g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def _stop_profiler(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        duration = time.perf_counter() - g.pop("profile_started")
+        try:
+            base = _dump(profiler, request.endpoint, duration)
+            response.headers["X-Profile-Id"] = os.path.basename(base)
+        except OSError as e:
+            logger.error("Error writing profile: %s", e)
+        return response
+
+    @app.teardown_request
+    def _discard_profiler(exc):
+        # the view raised before after_request ran
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+
+
+# CLI: aggregate the dumps written by the hooks
+def _select_dumps(directory, endpoint):
+    pattern = f"*-{endpoint}-*.prof" if endpoint else "*.prof"
+    return sorted(glob.glob(os.path.join(directory, pattern)))
+
+def report(directory, endpoint=None, sort="cumulative", limit=30, folded_out=None):
+    dumps = _select_dumps(directory, endpoint)
+    if not dumps:
+        print("No profiles found")
+        return
+
+    stats = pstats.Stats(dumps[0], stream=io.StringIO())
+    for path in dumps[1:]:
+        stats.add(path)
+    out = io.StringIO()
+    stats.stream = out
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    print(f"{len(dumps)} profiles aggregated")
+    print(out.getvalue())
+
+    if folded_out:
+        # merge the collapsed stacks into one flame-graph input file
+        merged = Counter()
+        for path in dumps:
+            folded = path[:-len(".prof")] + ".folded"
+            if not os.path.exists(folded):
+                continue
+            with open(folded, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, value = line.rstrip("\n").rpartition(" ")
+                    if stack:
+                        merged[stack] += int(value)
+        with open(folded_out, "w", encoding="utf-8") as f:
+            for stack, value in merged.most_common():
+                f.write(f"{stack} {value}\n")
+        print(f"Collapsed stacks written to {folded_out}")
+
+def endpoints_summary(directory):
+    # number of dumps and mean duration per endpoint, parsed from the file names
+    durations = {}
+    for path in _select_dumps(directory, None):
+        match = re.match(r"\d+-(.+)-(\d+)ms-[0-9a-f]+\.prof$", os.path.basename(path))
+        if match:
+            durations.setdefault(match.group(1), []).append(int(match.group(2)))
+    for endpoint, values in sorted(durations.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{endpoint:40s} {len(values):5d} profiles  mean {sum(values) / len(values):8.1f} ms  max {max(values):6d} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate request profiles")
+    parser.add_argument("--dir", default=PROFILE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = sub.add_parser("report", help="merge cProfile dumps and print the hottest functions")
+    report_parser.add_argument("--endpoint", help="only profiles of this Flask endpoint")
+    report_parser.add_argument("--sort", default="cumulative", help="pstats sort key (cumulative, tottime, calls)")
+    report_parser.add_argument("--limit", type=int, default=30)
+    report_parser.add_argument("--folded", help="also write merged collapsed stacks to this file")
+
+    sub.add_parser("endpoints", help="list profiled endpoints with their durations")
+
+    args = parser.parse_args()
+    if args.command == "report":
+        report(args.dir, args.endpoint, args.sort, args.limit, args.folded)
+    else:
+        endpoints_summary(args.dir)
+
+
+if __name__ == "__main__":
+    main()
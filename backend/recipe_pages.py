@@ -0,0 +1,108 @@
+import logging
+import os
+from bson.objectid import ObjectId
+from flask import render_template, session
+from db import recipes_collection, chef_collection, user_collection, comments_collection, DEFAULT_AVATAR
+from caching import LRUCache, cache_control_value
+from invalidation import register_cache
+from models import render_recipes, view_versions
+from validation import safe_objectid
+
+logger = logging.getLogger("recipe_pages")
+
+# Server-rendered recipe pages: /recipe/<id> is sent with the recipe, its
+# comments and the viewer's session and favorite state already in the HTML,
+# plus the same data as embedded JSON the page script starts from, so the
+# page paints without waiting for /api/session, /api/recipes/<id> and
+# /api/user/favorites. Pages for anonymous viewers are cached per recipe
+# revision. With RECIPE_PRERENDER=0 the static page is served as before.
+RECIPE_PRERENDER = os.getenv("RECIPE_PRERENDER", "1") == "1"
+RECIPE_PAGE_CACHE_SIZE = int(os.getenv("RECIPE_PAGE_CACHE_SIZE", "1024"))
+
+page_cache = LRUCache(RECIPE_PAGE_CACHE_SIZE)
+_invalidation_registered = False
+
+
+def recipe_version(recipe):
+    # (version, authors): what the detail view depends on, the recipe (adding
+    # or removing a comment touches it), its chef as it will be rendered and
+    # the ingredient catalog. Pass the authors to recipe_detail so the body
+    # matches the version even if the chef row comes from the snapshot.
+    chefs, versions = view_versions([recipe], "detail")
+    return versions[0], chefs
+
+def recipe_detail(recipe, chefs=None):
+    # the detail view is shared, comments are added to a copy
+    detail = dict(render_recipes([recipe], "detail", chefs)[0])
+    comment_ids = recipe.get("commentsList") or []
+    detail["comments"] = []
+    if comment_ids:
+        comments = list(comments_collection.find(
+            {"_id": {"$in": comment_ids}},
+            sort=[("created_at", -1)]
+        ))
+        for comment in comments:
+            comment.pop("created_at", None)
+        detail["comments"] = comments
+    return detail
+
+def session_info():
+    # (/api/session payload, viewer document or None)
+    if "user_id" not in session:
+        return {"logged_in": False}, None
+
+    user_id = session.get("user_id")
+    role = session.get("role")
+    collection = user_collection if role == "user" else chef_collection
+    user = collection.find_one({"_id": ObjectId(user_id)})
+
+    return {
+        "logged_in": True,
+        "user_id": user_id,
+        "user_name": (user.get("nickname") or user.get("user_name") or user.get("email", "")) if user else session.get("user_name", "User"),
+        "user_avatar": (user.get("user_avatar") if user else session.get("user_avatar")) or DEFAULT_AVATAR,
+        "role": role,
+        "followed_chefs_count": len(user.get("followedChefs", [])) if user and isinstance(user.get("followedChefs"), list) else 0
+    }, user
+
+def _is_favorited(user, recipe_obj):
+    # favorites are {recipeId: ObjectId, added_at} (see migrate_ids.py)
+    return any(fav.get("recipeId") == recipe_obj for fav in (user or {}).get("favorites") or [])
+
+def _render(recipe_id, detail, viewer, favorited):
+    initial = {"recipe": detail, "session": viewer, "is_favorited": favorited}
+    return render_template("recipePage.html", recipe_id=recipe_id, initial=initial)
+
+def _static_page(recipe_id):
+    # the page script fetches everything from the API
+    return render_template("recipePage.html", recipe_id=recipe_id, initial=None)
+
+def recipe_page(recipe_id):
+    global _invalidation_registered
+    recipe_obj = safe_objectid(recipe_id)
+    if not RECIPE_PRERENDER or not recipe_obj:
+        return _static_page(recipe_id)
+    if not _invalidation_registered:
+        _invalidation_registered = True
+        # entries are versioned already, this only frees memory early
+        register_cache(page_cache, ("recipes",))
+
+    try:
+        recipe = recipes_collection.find_one({"_id": recipe_obj})
+        if not recipe:
+            return _static_page(recipe_id)
+        version, chefs = recipe_version(recipe)
+        if "user_id" not in session:
+            html = page_cache.get_or_build(
+                recipe_obj, version,
+                lambda: _render(recipe_id, recipe_detail(recipe, chefs), {"logged_in": False}, False)
+            )
+        else:
+            viewer, user = session_info()
+            html = _render(recipe_id, recipe_detail(recipe, chefs), viewer, _is_favorited(user, recipe_obj))
+    except Exception as e:
+        logger.error("Error prerendering recipe %s: %s", recipe_id, e)
+        return _static_page(recipe_id)
+
+    # the html carries the viewer's session: no shared caches
+    return html, 200, {"Cache-Control": cache_control_value(public=False), "Vary": "Cookie"}
@@ -0,0 +1,260 @@
+import argparse
+import logging
+import os
+import time
+import numpy as np
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DeleteMany, UpdateOne
+from db import db, recipes_collection, touch
+from jobs import handler
+from sync import server_time
+
+# "Recipes like this": every recipe is a sparse vector of its ingredient ids
+# and tags, and its top-K most similar recipes are precomputed into the
+# recipe_similarities collection, so /api/recipes/<id>/similar is one lookup.
+# A full rebuild is a vectorized sparse matrix product (python
+# recommendations.py build); creating or deleting a recipe updates the table
+# incrementally through background jobs.
+#   SIMILAR_TOP_K=20          neighbours kept per recipe
+#   SIMILAR_METRIC=cosine     cosine or jaccard
+#   SIMILAR_TAG_WEIGHT=0.5    weight of a shared tag (a shared ingredient is 1)
+#   SIMILAR_MIN_SCORE=0.05    neighbours below this score are not stored
+
+similarities_collection = db["recipe_similarities"]
+TOP_K = int(os.getenv("SIMILAR_TOP_K", "20"))
+METRIC = os.getenv("SIMILAR_METRIC", "cosine")
+TAG_WEIGHT = float(os.getenv("SIMILAR_TAG_WEIGHT", "0.5"))
+MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", "0.05"))
+# rows multiplied at once during a rebuild, bounds memory on large catalogs
+BLOCK_SIZE = 2048
+
+FEATURE_PROJECTION = {"ingredients.ingredientId": 1, "tags": 1}
+# features compare tags case-insensitively, so does the candidate lookup
+TAG_COLLATION = {"locale": "en", "strength": 2}
+
+logger = logging.getLogger("recommendations")
+
+_indexes_ready = False
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    # used to drop a deleted recipe from every list that contains it
+    similarities_collection.create_index([("neighbours.recipe_id", ASCENDING)])
+    # candidate lookups of the incremental updates
+    recipes_collection.create_index([("ingredients.ingredientId", ASCENDING)])
+    recipes_collection.create_index([("tags", ASCENDING)], collation=TAG_COLLATION, name="tags_ci")
+    _indexes_ready = True
+
+
+# Feature vectors
+def recipe_features(recipe):
+    # {feature: weight}; ingredient ids are stored as ObjectId or str
+    features = {}
+    for ing in recipe.get("ingredients") or []:
+        ing_id = ing.get("ingredientId") if isinstance(ing, dict) else None
+        if ing_id:
+            features[f"i:{ing_id}"] = 1.0
+    for tag in recipe.get("tags") or []:
+        if isinstance(tag, str) and tag.strip():
+            features[f"t:{tag.strip().lower()}"] = TAG_WEIGHT
+    return features
+
+def similarity(a, b, metric=METRIC):
+    # same scores as the vectorized rebuild, for incremental updates
+    shared = a.keys() & b.keys()
+    if not shared:
+        return 0.0
+    if metric == "jaccard":
+        overlap = sum(a[f] for f in shared)
+        return overlap / (sum(a.values()) + sum(b.values()) - overlap)
+    dot = sum(a[f] * b[f] for f in shared)
+    return dot / (sum(w * w for w in a.values()) ** 0.5 * sum(w * w for w in b.values()) ** 0.5)
+
+
+def build_matrix(recipes):
+    # returns (recipe ids, csr matrix recipes x features with the feature weights);
+    # scipy is imported by the full rebuild only, it is slow to import
+    from scipy import sparse
+    ids = []
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, recipe in enumerate(recipes):
+        ids.append(recipe["_id"])
+        for feature, weight in recipe_features(recipe).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(feature, len(vocabulary)))
+            values.append(weight)
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (rows, cols)),
+        shape=(len(ids), max(len(vocabulary), 1))
+    )
+    return ids, matrix
+
+def top_k_neighbours(matrix, k=TOP_K, metric=METRIC, min_score=MIN_SCORE, block_size=BLOCK_SIZE):
+    # yields (row, [(neighbour row, score), ...]) best first, row blocks at a time
+    from scipy import sparse
+    if metric == "jaccard":
+        binary = matrix.copy()
+        binary.data[:] = 1.0
+        left, right = matrix, binary.T.tocsc()
+        sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    else:
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        left = sparse.diags(1.0 / norms) @ matrix
+        left = left.tocsr()
+        right = left.T.tocsc()
+
+    for start in range(0, matrix.shape[0], block_size):
+        scores = (left[start:start + block_size] @ right).tocsr()
+        for offset in range(scores.shape[0]):
+            row = start + offset
+            lo, hi = scores.indptr[offset], scores.indptr[offset + 1]
+            cols = scores.indices[lo:hi]
+            vals = scores.data[lo:hi].astype(np.float64)
+            if metric == "jaccard":
+                # shared weight / (weight a + weight b - shared weight)
+                vals = vals / (sizes[row] + sizes[cols] - vals)
+            keep = (cols != row) & (vals >= min_score)
+            cols, vals = cols[keep], vals[keep]
+            if len(vals) > k:
+                best = np.argpartition(-vals, k - 1)[:k]
+                cols, vals = cols[best], vals[best]
+            order = np.lexsort((cols, -vals))
+            yield row, [(int(cols[i]), float(vals[i])) for i in order]
+
+
+def _entry(recipe_id, score):
+    return {"recipe_id": recipe_id, "score": round(score, 4)}
+
+
+# Batch rebuild
+def rebuild(k=TOP_K, metric=METRIC, batch_size=1000):
+    _ensure_indexes()
+    started = time.perf_counter()
+    # every row written by this rebuild is tagged with its generation
+    generation = ObjectId()
+    started_at = server_time()
+    ids, matrix = build_matrix(recipes_collection.find({}, FEATURE_PROJECTION))
+    built = time.perf_counter()
+
+    ops = []
+    for row, neighbours in top_k_neighbours(matrix, k, metric):
+        ops.append(UpdateOne(
+            {"_id": ids[row]},
+            touch({"$set": {
+                "neighbours": [_entry(ids[col], score) for col, score in neighbours], "metric": metric,
+                "generation": generation,
+            }}),
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            similarities_collection.bulk_write(ops, ordered=False)
+            ops = []
+    # drop rows of recipes deleted since the previous rebuild: rows of other
+    # generations, except those written by the background jobs meanwhile
+    # (recipes created after the catalog was read)
+    ops.append(DeleteMany({"generation": {"$ne": generation}, "updated_at": {"$lt": started_at}}))
+    similarities_collection.bulk_write(ops, ordered=False)
+
+    logger.info(
+        "similarity table rebuilt", extra={
+            "recipes": len(ids), "features": matrix.shape[1], "metric": metric,
+            "matrix_ms": round((built - started) * 1000, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    )
+    return len(ids)
+
+
+# Incremental updates (background jobs)
+@handler("update_recipe_similarity")
+def update_recipe_similarity(recipe_id):
+    # score a new recipe against the recipes sharing at least one feature,
+    # store its own list and insert it into the lists it now belongs to
+    _ensure_indexes()
+    recipe_obj = ObjectId(recipe_id)
+    recipe = recipes_collection.find_one({"_id": recipe_obj}, FEATURE_PROJECTION)
+    if not recipe:
+        return
+    features = recipe_features(recipe)
+    ingredient_ids = []
+    for ing in recipe.get("ingredients") or []:
+        ing_id = ing.get("ingredientId") if isinstance(ing, dict) else None
+        if ing_id:
+            ingredient_ids.append(ing_id)
+    # the tags as recipe_features normalizes them, matched with a
+    # case-insensitive collation ("Vegan" finds "vegan")
+    tags = list({tag.strip().lower() for tag in recipe.get("tags") or [] if isinstance(tag, str) and tag.strip()})
+    candidates = {}
+    if ingredient_ids:
+        for doc in recipes_collection.find({"_id": {"$ne": recipe_obj}, "ingredients.ingredientId": {"$in": ingredient_ids}}, FEATURE_PROJECTION):
+            candidates[doc["_id"]] = doc
+    if tags:
+        for doc in recipes_collection.find({"_id": {"$ne": recipe_obj}, "tags": {"$in": tags}}, FEATURE_PROJECTION, collation=TAG_COLLATION):
+            candidates[doc["_id"]] = doc
+
+    scored = []
+    for candidate in candidates.values():
+        score = similarity(features, recipe_features(candidate))
+        if score >= MIN_SCORE:
+            scored.append((score, candidate["_id"]))
+    scored.sort(key=lambda item: (-item[0], str(item[1])))
+
+    similarities_collection.update_one(
+        {"_id": recipe_obj},
+        touch({"$set": {"neighbours": [_entry(rid, score) for score, rid in scored[:TOP_K]], "metric": METRIC}}),
+        upsert=True
+    )
+    # the filter makes a repeated run a no-op; $sort/$slice keep every list at top-K
+    ops = [
+        UpdateOne(
+            {"_id": rid, "neighbours.recipe_id": {"$ne": recipe_obj}},
+            touch({"$push": {"neighbours": {"$each": [_entry(recipe_obj, score)], "$sort": {"score": -1}, "$slice": TOP_K}}})
+        )
+        for score, rid in scored
+    ]
+    if ops:
+        similarities_collection.bulk_write(ops, ordered=False)
+
+@handler("fill_recipe_similarity")
+def fill_recipe_similarity(recipe_id):
+    # enqueued by GET /similar for a recipe without a row: views arriving
+    # while a run is in progress queue it again, those runs stop here
+    if similarities_collection.find_one({"_id": ObjectId(recipe_id)}, {"_id": 1}) is None:
+        update_recipe_similarity(recipe_id)
+
+@handler("remove_recipe_similarity")
+def remove_recipe_similarity(recipe_id):
+    # lists shrink below K until the next rebuild refills them
+    _ensure_indexes()
+    recipe_obj = ObjectId(recipe_id)
+    similarities_collection.delete_one({"_id": recipe_obj})
+    similarities_collection.update_many(
+        {"neighbours.recipe_id": recipe_obj},
+        touch({"$pull": {"neighbours": {"recipe_id": recipe_obj}}})
+    )
+
+
+# Serving
+def similar_recipes(recipe_id):
+    # precomputed neighbours of a recipe, None when the table has no row yet
+    return similarities_collection.find_one({"_id": recipe_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe similarity table")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--metric", choices=["cosine", "jaccard"], default=METRIC)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = rebuild(args.top_k, args.metric)
+    print(f"{count} recipes indexed in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, redirect, url_for
-from werkzeug.security import generate_password_hash
-from db import user_collection, chef_collection, DEFAULT_AVATAR
+from db import user_collection, chef_collection, DEFAULT_AVATAR, new_revision_fields, insert_document
+from credentials import hash_password, CredentialServiceBusy
 
 register_bp = Blueprint("register_bp", __name__)
 
@@ -16,9 +16,6 @@ def register():
     if not nickname or not email or not password or not role:
         return "Missing fields", 400
 
-    # Hash password for secure storage
-    hashed_pw = generate_password_hash(password)
-
     # Select appropriate collection based on user role
     collection = user_collection if role == "user" else chef_collection
 
@@ -26,12 +23,19 @@ def register():
     if collection.find_one({"email": email}):
         return "Email already registered", 400
 
+    # Hash password for secure storage (runs in the hashing pool)
+    try:
+        hashed_pw = hash_password(password)
+    except CredentialServiceBusy:
+        return "Server busy, please try again", 503
+
     # Create new user/chef document
-    collection.insert_one({
+    insert_document(collection, {
         "nickname": nickname,
         "email": email,
         "password": hashed_pw,
         "user_avatar": DEFAULT_AVATAR,
+        **new_revision_fields(),
     })
 
     # Redirect to login after successful registration
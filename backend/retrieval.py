@@ -0,0 +1,324 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+import numpy as np
+from db import ingredients_collection
+from caching import collection_version
+from invalidation import subscribe
+from jobs import handler, enqueue
+
+try:
+    import fcntl
+except ImportError:
+    # windows: concurrent builds are not serialized, the last one published wins
+    fcntl = None
+
+# Retrieval over the ingredients' scientificDescription, used to ground the
+# Chef Bot answers. Descriptions are split into passages of a few sentences
+# and scored with BM25: the weight of every (term, passage) pair is computed
+# at build time into an inverted index of flat numpy arrays on disk. The
+# arrays are memory mapped, so worker processes share the same pages and a
+# query only sums the postings of its terms. The index is rebuilt by a
+# background job after ingredients change, or with python retrieval.py build;
+# with several workers the builds are serialized by a file lock and skipped
+# once the published index is current.
+#   RETRIEVAL_INDEX_DIR=backend/retrieval_index   index location
+#   RETRIEVAL_REBUILD_DELAY=5      seconds a rebuild waits to coalesce changes
+#   RETRIEVAL_TOP_K=3              passages added to a chat prompt
+#   RETRIEVAL_RECIPE_BOOST=1.5     score factor for ingredients of the open recipe
+#   RETRIEVAL_MIN_SCORE=1.0        passages scoring below are not returned
+
+INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "retrieval_index"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RECIPE_BOOST = float(os.getenv("RETRIEVAL_RECIPE_BOOST", "1.5"))
+MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "1.0"))
+REBUILD_DELAY = float(os.getenv("RETRIEVAL_REBUILD_DELAY", "5"))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# passages are cut at sentence boundaries once they reach this many words
+PASSAGE_WORDS = 60
+# seconds between checks for a newer index on disk
+RELOAD_CHECK_INTERVAL = 5.0
+
+logger = logging.getLogger("retrieval")
+
+_WORD_RE = re.compile(r"[a-z0-9àèéìòù]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from has have how i if in into is it its
+me my of on or so than that the their them then there these they this to was what when where which
+while who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    # lowercase words without stopwords, plural "s" stripped
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+def split_passages(text, max_words=PASSAGE_WORDS):
+    passages, current, words = [], [], 0
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        if not sentence:
+            continue
+        current.append(sentence)
+        words += len(sentence.split())
+        if words >= max_words:
+            passages.append(" ".join(current))
+            current, words = [], 0
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+# Build
+def _write_index(path, ingredients, passages, passage_ingredient, token_lists, catalog_version=None):
+    vocabulary = {}
+    term_ids, passage_ids, freqs = [], [], []
+    lengths = np.zeros(len(passages), dtype=np.float64)
+    for passage, tokens in enumerate(token_lists):
+        lengths[passage] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            passage_ids.append(passage)
+            freqs.append(tf)
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    passage_ids = np.asarray(passage_ids, dtype=np.int32)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    count = max(len(passages), 1)
+    df = np.bincount(term_ids, minlength=len(vocabulary))
+    idf = np.log1p((count - df + 0.5) / (df + 0.5))
+    avgdl = max(lengths.mean(), 1.0) if len(passages) else 1.0
+    norm = K1 * (1 - B + B * lengths[passage_ids] / avgdl)
+    weights = idf[term_ids] * freqs * (K1 + 1) / (freqs + norm)
+
+    # postings grouped by term, passages ascending inside a term
+    order = np.argsort(term_ids, kind="stable")
+    ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(df, out=ptr[1:])
+
+    encoded = [passage.encode("utf-8") for passage in passages]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+
+    os.makedirs(path)
+    np.save(os.path.join(path, "postings_ptr.npy"), ptr)
+    np.save(os.path.join(path, "postings_passage.npy"), passage_ids[order])
+    np.save(os.path.join(path, "postings_weight.npy"), weights[order].astype(np.float32))
+    np.save(os.path.join(path, "passage_ingredient.npy"), np.asarray(passage_ingredient, dtype=np.int32))
+    np.save(os.path.join(path, "passage_offsets.npy"), offsets)
+    with open(os.path.join(path, "passages.txt"), "wb") as f:
+        for data in encoded:
+            f.write(data)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "vocabulary": vocabulary, "ingredients": ingredients,
+            "catalog_version": catalog_version, "built_at": time.time(),
+        }, f)
+
+def build(docs=None, index_dir=INDEX_DIR):
+    # docs: ingredient documents, read from the database by default
+    started = time.perf_counter()
+    catalog_version = None
+    if docs is None:
+        # read first: changes made during the build trigger another one
+        catalog_version = collection_version(ingredients_collection)
+        docs = ingredients_collection.find(
+            {"scientificDescription": {"$nin": [None, ""]}},
+            {"ingredientName": 1, "name": 1, "scientificDescription": 1}
+        )
+    ingredients, passages, passage_ingredient, token_lists = [], [], [], []
+    for doc in docs:
+        description = doc.get("scientificDescription")
+        if not isinstance(description, str) or not description.strip():
+            continue
+        name = doc.get("ingredientName") or doc.get("name") or ""
+        ingredients.append([str(doc["_id"]), name])
+        name_tokens = tokenize(name)
+        for passage in split_passages(description):
+            passages.append(passage)
+            passage_ingredient.append(len(ingredients) - 1)
+            # the name is indexed with every passage, descriptions rarely repeat it
+            token_lists.append(name_tokens + tokenize(passage))
+
+    # every build goes to a new directory and CURRENT is switched atomically,
+    # processes still mapping the previous files keep reading them
+    os.makedirs(index_dir, exist_ok=True)
+    pointer = os.path.join(index_dir, "CURRENT")
+    try:
+        with open(pointer) as f:
+            previous = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    version = f"v{time.time_ns()}"
+    _write_index(os.path.join(index_dir, version), ingredients, passages, passage_ingredient, token_lists, catalog_version)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    # the previous version is kept for readers that just read the old pointer
+    for name in os.listdir(index_dir):
+        if name.startswith("v") and name not in (version, previous):
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+    logger.info(
+        "retrieval index built", extra={
+            "ingredients": len(ingredients), "passages": len(passages),
+            "build_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    )
+    return len(passages)
+
+
+# Serving
+class RetrievalIndex:
+    # read-only view of one index version, arrays are memory mapped
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.vocabulary = meta["vocabulary"]
+        self.ingredients = meta["ingredients"]
+        self._ingredient_rows = {ingredient_id: row for row, (ingredient_id, _) in enumerate(self.ingredients)}
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.ptr = load("postings_ptr.npy")
+        self.postings_passage = load("postings_passage.npy")
+        self.postings_weight = load("postings_weight.npy")
+        self.passage_ingredient = load("passage_ingredient.npy")
+        self.offsets = load("passage_offsets.npy")
+        self.size = len(self.passage_ingredient)
+        self._text = b""
+        if self.offsets[-1]:
+            with open(os.path.join(path, "passages.txt"), "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def passage(self, row):
+        return self._text[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+
+    def search(self, query, k=TOP_K, boost_ids=None, boost=RECIPE_BOOST, min_score=MIN_SCORE):
+        # returns [{ingredient_id, ingredient, text, score}] best first
+        terms = [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary]
+        if not terms or not self.size:
+            return []
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in terms:
+            lo, hi = self.ptr[term], self.ptr[term + 1]
+            scores[self.postings_passage[lo:hi]] += self.postings_weight[lo:hi]
+        if boost_ids:
+            rows = [self._ingredient_rows[i] for i in map(str, boost_ids) if i in self._ingredient_rows]
+            if rows:
+                scores[np.isin(self.passage_ingredient, rows)] *= boost
+
+        candidates = np.flatnonzero((scores > 0) & (scores >= min_score))
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        results = []
+        for row in candidates:
+            ingredient_id, name = self.ingredients[self.passage_ingredient[row]]
+            results.append({"ingredient_id": ingredient_id, "ingredient": name, "text": self.passage(row), "score": round(float(scores[row]), 3)})
+        return results
+
+
+_lock = threading.Lock()
+_index = None
+_version = None
+_checked_at = 0.0
+_subscribed = False
+_build_requested = False
+
+def request_build():
+    enqueue("rebuild_retrieval_index", delay=REBUILD_DELAY)
+
+def current_index(index_dir=INDEX_DIR):
+    # the newest index on disk, None until one has been built
+    global _index, _version, _checked_at, _subscribed, _build_requested
+    if not _subscribed:
+        _subscribed = True
+        subscribe(lambda event: request_build(), ("ingredients",))
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+    with _lock:
+        _checked_at = now
+        try:
+            with open(os.path.join(index_dir, "CURRENT")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            if not _build_requested:
+                _build_requested = True
+                request_build()
+            return _index
+        if version != _version:
+            try:
+                _index = RetrievalIndex(os.path.join(index_dir, version))
+                _version = version
+            except (OSError, ValueError) as e:
+                # replaced again meanwhile or unreadable, retried at the next check
+                logger.warning("retrieval index %s not loaded: %s", version, e)
+        return _index
+
+def retrieve(query, k=TOP_K, boost_ids=None):
+    index = current_index()
+    if index is None:
+        return []
+    return index.search(query, k, boost_ids)
+
+
+def _published_version(index_dir):
+    try:
+        with open(os.path.join(index_dir, "CURRENT")) as f:
+            path = os.path.join(index_dir, f.read().strip(), "meta.json")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("catalog_version")
+    except (OSError, ValueError):
+        return None
+
+@handler("rebuild_retrieval_index")
+def rebuild_retrieval_index(index_dir=INDEX_DIR, force=False):
+    # every worker enqueues a build for the same change: wait for a running
+    # build, then skip when the published index is already current
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "build.lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if not force and _published_version(index_dir) == collection_version(ingredients_collection):
+            return None
+        return build(index_dir=index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingredient knowledge retrieval index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="index every scientificDescription")
+    query_parser = sub.add_parser("query", help="print the passages retrieved for a question")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        count = rebuild_retrieval_index(force=True)
+        print(f"{count} passages indexed in {time.perf_counter() - started:.2f}s")
+    else:
+        index = RetrievalIndex(os.path.join(INDEX_DIR, open(os.path.join(INDEX_DIR, "CURRENT")).read().strip()))
+        for result in index.search(args.text, args.k, min_score=0):
+            print(f"{result['score']:7.3f}  {result['ingredient']}: {result['text']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import logging
+import os
+import sys
+import time
+import bson
+from bson.objectid import ObjectId
+from bson.timestamp import Timestamp
+from flask import current_app, g, request, session
+from pymongo.read_preferences import Secondary, SecondaryPreferred
+from db import get_client, set_route, DATABASE_NAME
+
+logger = logging.getLogger("routing")
+
+# Read/write routing for replica set deployments. The endpoints listed in
+# MONGODB_SECONDARY_ENDPOINTS read from secondaries (secondaryPreferred, at
+# most MONGODB_MAX_STALENESS seconds behind the primary); every other
+# endpoint and all writes use the primary. Every request runs in a causally
+# consistent session that starts from the cluster time of the viewer's last
+# write, kept in the Flask session cookie, so a user reads their own new
+# comment or recipe even from a secondary: it waits until it has caught up.
+# Off by default (MONGODB_READ_ROUTING=1 to enable); create_app(config) can
+# override both settings. Check a deployment with:  python routing.py check
+READ_ROUTING = os.getenv("MONGODB_READ_ROUTING", "0") == "1"
+# the server rejects values below 90 seconds
+MAX_STALENESS = max(int(os.getenv("MONGODB_MAX_STALENESS", "90")), 90)
+DEFAULT_SECONDARY_ENDPOINTS = (
+    "main_bp.api_recipes",
+    "main_bp.api_recipe_detail",
+    "main_bp.api_recipes_trending",
+    "main_bp.api_recipes_top",
+    "main_bp.api_similar_recipes",
+    "main_bp.api_search",
+    "main_bp.api_explore",
+    "main_bp.api_chef_profile",
+    "main_bp.recipe_page",
+)
+SECONDARY_ENDPOINTS = frozenset(
+    name.strip()
+    for name in os.getenv("MONGODB_SECONDARY_ENDPOINTS", ",".join(DEFAULT_SECONDARY_ENDPOINTS)).split(",")
+    if name.strip()
+)
+
+SESSION_KEY = "causal_time"
+WRITE_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+
+secondary_reads = SecondaryPreferred(max_staleness=MAX_STALENESS)
+
+
+# Causal time carried between requests (and processes)
+def dump_causal_time(causal):
+    # cluster and operation time of a session, None before its first operation
+    if causal.cluster_time is None or causal.operation_time is None:
+        return None
+    return {
+        "cluster": bson.encode(causal.cluster_time),
+        "operation": [causal.operation_time.time, causal.operation_time.inc],
+    }
+
+def restore_causal_time(causal, saved):
+    # later reads in the session wait for everything up to saved
+    causal.advance_cluster_time(bson.decode(saved["cluster"]))
+    causal.advance_operation_time(Timestamp(*saved["operation"]))
+
+
+def init_routing(app):
+    app.config.setdefault("MONGODB_READ_ROUTING", READ_ROUTING)
+    app.config.setdefault("MONGODB_SECONDARY_ENDPOINTS", SECONDARY_ENDPOINTS)
+
+    @app.before_request
+    def _start_route():
+        # blueprint routes only: static files, probes and /metrics need no session
+        if not current_app.config["MONGODB_READ_ROUTING"] or request.blueprint is None:
+            return
+        causal = get_client().start_session(causal_consistency=True)
+        saved = session.get(SESSION_KEY)
+        if saved:
+            try:
+                restore_causal_time(causal, saved)
+            except Exception as e:
+                # cookie from another deployment or an older format
+                logger.warning("Ignoring saved causal time: %s", e)
+        g.db_session = causal
+        secondary = request.endpoint in current_app.config["MONGODB_SECONDARY_ENDPOINTS"]
+        set_route(secondary_reads if secondary else None, causal)
+
+    @app.after_request
+    def _save_causal_time(response):
+        # after a write the viewer's next requests read at least this far
+        causal = g.get("db_session")
+        if causal is not None and request.method in WRITE_METHODS:
+            saved = dump_causal_time(causal)
+            if saved and saved != session.get(SESSION_KEY):
+                session[SESSION_KEY] = saved
+        return response
+
+    @app.teardown_request
+    def _end_route(exc):
+        causal = g.pop("db_session", None)
+        if causal is not None:
+            set_route()
+            causal.end_session()
+
+
+# CLI: verify routing against a replica set, e.g. three local mongod:
+#   mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0   (27018, 27019 alike)
+#   mongosh --eval 'rs.initiate({_id: "rs0", members: [{_id: 0, host: "localhost:27017"}, ...]})'
+#   MONGODB_URI="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" python routing.py check
+def check(rounds=20):
+    client = get_client()
+    client.admin.command("ping")
+    primary, secondaries = client.primary, sorted(client.secondaries)
+    print(f"primary {primary}, secondaries {secondaries or 'none'}")
+    if not secondaries:
+        print("No secondary: routed reads use the primary")
+        return False
+
+    collection = client[DATABASE_NAME]["routing_check"]
+    from_secondary = collection.with_options(read_preference=Secondary(max_staleness=MAX_STALENESS))
+    stale = waited = 0
+    try:
+        for _ in range(rounds):
+            marker = ObjectId()
+            # write request: the causal time ends up in the session cookie
+            with client.start_session(causal_consistency=True) as writer:
+                collection.insert_one({"_id": marker}, session=writer)
+                saved = dump_causal_time(writer)
+
+            # plain read right after the write, may miss it
+            if from_secondary.find_one({"_id": marker}) is None:
+                stale += 1
+
+            # next request of the same viewer, routed to a secondary
+            with client.start_session(causal_consistency=True) as reader:
+                restore_causal_time(reader, saved)
+                started = time.perf_counter()
+                cursor = from_secondary.find({"_id": marker}, session=reader).limit(1)
+                found = next(cursor, None)
+                waited += time.perf_counter() - started
+                if found is None:
+                    print(f"FAIL: {cursor.address} did not return the write {marker}")
+                    return False
+    finally:
+        collection.drop()
+
+    print(f"{rounds} writes read back from secondaries in causal sessions, mean wait {waited / rounds * 1000:.1f} ms")
+    print(f"{stale}/{rounds} plain secondary reads right after the write missed it")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read routing against a replica set")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_parser = sub.add_parser("check", help="write, then read the write back from a secondary")
+    check_parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    if not check(args.rounds):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
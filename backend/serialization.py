@@ -0,0 +1,112 @@
+import datetime
+import decimal
+import uuid
+from flask import has_request_context, request
+from flask.json.provider import JSONProvider
+from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
+
+try:
+    import orjson
+except ImportError:
+    # orjson is listed in requirements.txt, fall back to the stdlib if missing
+    orjson = None
+    import json
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack is listed in requirements.txt, without it every client gets json
+    msgpack = None
+
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+
+# converts the mongodb types orjson does not know natively
+def _default(o):
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, Decimal128):
+        return float(o.to_decimal())
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if isinstance(o, bytes):
+        return o.decode("utf-8", errors="replace")
+    if orjson is None:
+        # stdlib fallback: handle the types orjson would serialize natively
+        if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, uuid.UUID):
+            return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, indent=False):
+    # mongodb documents to json bytes, also used outside requests (bulk export)
+    if orjson is None:
+        return json.dumps(
+            obj, default=_default, ensure_ascii=False,
+            indent=2 if indent else None,
+            separators=None if indent else (",", ":"),
+        ).encode("utf-8")
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=_default, option=option)
+
+def loads(data):
+    # json bytes or str to python objects (ObjectIds come back as strings)
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+def _msgpack_default(o):
+    # same values as in the json output: dates as iso strings, ids as strings
+    if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    return _default(o)
+
+def dumps_msgpack(obj):
+    return msgpack.packb(obj, default=_msgpack_default)
+
+def wants_msgpack():
+    # opt-in: the Accept header must prefer msgpack, */* alone gets json
+    if msgpack is None or not has_request_context():
+        return False
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+# json provider that serializes mongodb documents in a single pass (ObjectId,
+# datetime and Decimal128 included), so routes can return raw documents
+class FastJSONProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps_bytes(self, obj, indent=False):
+        return dumps_bytes(obj, indent)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, indent=bool(kwargs.get("indent"))).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # skip the bytes -> str -> bytes round trip of the default provider;
+        # clients sending "Accept: application/msgpack" get msgpack instead
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            response = self._app.response_class(dumps_msgpack(obj), mimetype=MSGPACK_MIMETYPES[0])
+        else:
+            body = self.dumps_bytes(obj, indent=self._app.debug)
+            response = self._app.response_class(body + b"\n", mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add("Accept")
+        return response
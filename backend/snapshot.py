@@ -0,0 +1,445 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+from bson.objectid import ObjectId
+from db import recipes_collection, chef_collection, ingredients_collection
+from caching import doc_version, collection_version
+from invalidation import subscribe, INVALIDATION_MODE
+from jobs import handler, enqueue
+from serialization import dumps_bytes, loads
+
+try:
+    import fcntl
+except ImportError:
+    # windows: concurrent builds are not serialized, the last one published wins
+    fcntl = None
+
+# Read-mostly catalog shared by the worker processes: ingredients with their
+# nutrition, chef names and avatars and the recipe card fields are written to
+# one binary file that every worker memory maps, so the pages are loaded once
+# per machine and a cold worker renders cards without fetching documents.
+# Layout: magic, header length, JSON header (versions, array offsets), then
+# flat numpy arrays. Ids are sorted 12 byte ObjectIds looked up with
+# np.searchsorted, strings are a data blob plus offsets. Every build writes a
+# new file and switches CURRENT atomically, readers pick it up within a few
+# seconds and keep mapping the previous file meanwhile.
+# The file lags behind the database, so readers only trust:
+#   recipes      rows whose stored version matches the version just read
+#   ingredients  the whole table, when the catalog version matches
+#   chefs        rows without an invalidation event since the build started
+# Changes enqueue a rebuild after a short delay; with several workers the
+# builds are serialized by a file lock and skipped once the file is current.
+#   CATALOG_SNAPSHOT_DIR=backend/catalog_snapshot   snapshot location
+#   CATALOG_SNAPSHOT_DELAY=5     seconds a rebuild waits to coalesce changes
+
+SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "catalog_snapshot"))
+BUILD_DELAY = float(os.getenv("CATALOG_SNAPSHOT_DELAY", "5"))
+
+MAGIC = b"TKSNAP01"
+# seconds between checks for a newer snapshot on disk
+RELOAD_CHECK_INTERVAL = 5.0
+NUTRIENTS = ("protein", "carbs", "fats", "calories")
+# stored recipe fields kept for the card view (models.Recipe.card)
+CARD_COLUMNS = ("title", "description", "image", "time", "difficulty", "tags", "rating")
+SOURCES = (("ingredients", ingredients_collection), ("chefs", chef_collection), ("recipes", recipes_collection))
+
+logger = logging.getLogger("snapshot")
+
+
+# Build
+def _number(value):
+    try:
+        if isinstance(value, str):
+            return float(value.replace(",", ".").strip())
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _ids(docs):
+    return np.array([doc["_id"].binary for doc in docs], dtype="S12")
+
+def _strings(values):
+    # (offsets, utf-8 data), value i is data[offsets[i]:offsets[i + 1]]
+    encoded = [b"" if value is None else value if isinstance(value, bytes) else str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def _add_strings(arrays, name, values):
+    arrays[name + ".offsets"], arrays[name + ".data"] = _strings(values)
+
+def _write(path, meta, arrays):
+    # array offsets in the header are relative to the end of the header,
+    # every array starts on an 8 byte boundary
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [offset, array.dtype.str, list(array.shape)]
+        offset += -(-array.nbytes // 8) * 8
+    header = json.dumps(dict(meta, arrays=layout)).encode("utf-8")
+    header += b" " * (-len(header) % 8)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for array in arrays.values():
+            data = np.ascontiguousarray(array).tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+
+def _read(collection, projection):
+    return [doc for doc in collection.find({}, projection) if isinstance(doc["_id"], ObjectId)]
+
+def build(sources=None, snapshot_dir=SNAPSHOT_DIR):
+    # sources: {"ingredients", "chefs", "recipes": documents, "versions": {name: version}},
+    # read from the database by default; returns the path of the new file
+    started_at = time.time()
+    started = time.perf_counter()
+    if sources is None:
+        # versions first: a write racing the reads makes the file look older
+        # than it is, never newer
+        sources = {"versions": {name: collection_version(collection) for name, collection in SOURCES}}
+        sources["ingredients"] = _read(ingredients_collection, dict.fromkeys(("ingredientName", "name", "unit", "scientificDescription") + NUTRIENTS, 1))
+        sources["chefs"] = _read(chef_collection, {"user_name": 1, "user_avatar": 1, "revision": 1, "updated_at": 1})
+        sources["recipes"] = _read(recipes_collection, dict.fromkeys(CARD_COLUMNS + ("chef_id", "revision", "updated_at"), 1))
+    by_id = lambda doc: doc["_id"].binary
+    ingredients = sorted(sources["ingredients"], key=by_id)
+    chefs = sorted(sources["chefs"], key=by_id)
+    recipes = sorted(sources["recipes"], key=by_id)
+
+    arrays = {"ingredients.id": _ids(ingredients)}
+    names = [doc.get("ingredientName", doc.get("name", "Unknown Ingredient")) for doc in ingredients]
+    _add_strings(arrays, "ingredients.name", names)
+    _add_strings(arrays, "ingredients.unit", [doc.get("unit", "") for doc in ingredients])
+    _add_strings(arrays, "ingredients.description", [doc.get("scientificDescription", "") for doc in ingredients])
+    # lowercase names, newline terminated so a match never spans two names
+    _add_strings(arrays, "ingredients.search", [f"{name or ''}".lower() + "\n" for name in names])
+    arrays["ingredients.nutrients"] = np.array(
+        [[_number(doc.get(nutrient, 0)) for nutrient in NUTRIENTS] for doc in ingredients], dtype=np.float64
+    ).reshape(-1, len(NUTRIENTS))
+
+    arrays["chefs.id"] = _ids(chefs)
+    _add_strings(arrays, "chefs.user_name", [doc.get("user_name", "Unknown Chef") for doc in chefs])
+    _add_strings(arrays, "chefs.user_avatar", [doc.get("user_avatar", "") for doc in chefs])
+    _add_strings(arrays, "chefs.version", [doc_version(doc) for doc in chefs])
+
+    arrays["recipes.id"] = _ids(recipes)
+    arrays["recipes.chef_id"] = np.array(
+        [doc["chef_id"].binary if isinstance(doc.get("chef_id"), ObjectId) else b"" for doc in recipes], dtype="S12"
+    )
+    _add_strings(arrays, "recipes.version", [doc_version(doc) for doc in recipes])
+    _add_strings(arrays, "recipes.card", [dumps_bytes({field: doc[field] for field in CARD_COLUMNS if field in doc}) for doc in recipes])
+
+    # every build goes to a new file and CURRENT is switched atomically,
+    # processes still mapping the previous file keep reading it
+    os.makedirs(snapshot_dir, exist_ok=True)
+    pointer = os.path.join(snapshot_dir, "CURRENT")
+    try:
+        with open(pointer) as f:
+            previous = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    name = f"catalog-{time.time_ns()}.snap"
+    counts = {"ingredients": len(ingredients), "chefs": len(chefs), "recipes": len(recipes)}
+    meta = {"versions": sources["versions"], "started_at": started_at, "built_at": time.time(), "counts": counts}
+    _write(os.path.join(snapshot_dir, name), meta, arrays)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(name)
+    os.replace(pointer + ".tmp", pointer)
+    # the previous file is kept for readers that just read the old pointer
+    for old in os.listdir(snapshot_dir):
+        if old.startswith("catalog-") and old not in (name, previous):
+            try:
+                os.remove(os.path.join(snapshot_dir, old))
+            except OSError:
+                pass
+
+    path = os.path.join(snapshot_dir, name)
+    logger.info(
+        "catalog snapshot built", extra=dict(
+            counts, bytes=os.path.getsize(path),
+            build_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+    )
+    return path
+
+
+# Serving
+class _Strings:
+    __slots__ = ("offsets", "data")
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+def _plain(value):
+    # nutrients are stored as floats, whole numbers come back as ints
+    return int(value) if value.is_integer() else value
+
+def _find(ids, keys):
+    # {key: row} for the ObjectIds present in a sorted id array
+    keys = [key for key in keys if isinstance(key, ObjectId)]
+    if not len(ids) or not keys:
+        return {}
+    wanted = np.array([key.binary for key in keys], dtype="S12")
+    rows = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+    found = ids[rows] == wanted
+    return {key: int(row) for key, row, ok in zip(keys, rows, found) if ok}
+
+class Snapshot:
+    # read-only view of one snapshot file, the arrays point into the mapping
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        (length,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        start = len(MAGIC) + 8
+        meta = json.loads(self._map[start:start + length])
+        self.path = path
+        self.versions = meta["versions"]
+        self.started_at = meta["started_at"]
+        self.built_at = meta["built_at"]
+        self.counts = meta["counts"]
+
+        base = start + length
+        arrays = {}
+        for name, (offset, dtype, shape) in meta["arrays"].items():
+            count = int(np.prod(shape))
+            if count:
+                arrays[name] = np.frombuffer(self._map, dtype=dtype, count=count, offset=base + offset).reshape(shape)
+            else:
+                arrays[name] = np.empty(shape, dtype=dtype)
+        column = lambda name: _Strings(arrays[name + ".offsets"], arrays[name + ".data"])
+
+        self.ingredient_ids = arrays["ingredients.id"]
+        self.ingredient_names = column("ingredients.name")
+        self.ingredient_units = column("ingredients.unit")
+        self.ingredient_descriptions = column("ingredients.description")
+        self.ingredient_nutrients = arrays["ingredients.nutrients"]
+        self.chef_ids = arrays["chefs.id"]
+        self.chef_names = column("chefs.user_name")
+        self.chef_avatars = column("chefs.user_avatar")
+        self.chef_versions = column("chefs.version")
+        self.recipe_ids = arrays["recipes.id"]
+        self.recipe_chef_ids = arrays["recipes.chef_id"]
+        self.recipe_versions = column("recipes.version")
+        self.recipe_cards = column("recipes.card")
+        # the search blob is scanned in place with mmap.find
+        self._search_offsets = arrays["ingredients.search.offsets"]
+        self._search_start = base + meta["arrays"]["ingredients.search.data"][0]
+        self._search_end = self._search_start + int(self._search_offsets[-1])
+
+    def ingredients(self, ids):
+        # {str(id): ingredient document} for models.Ingredient.from_doc
+        docs = {}
+        for oid, row in _find(self.ingredient_ids, ids).items():
+            doc = {
+                "_id": oid, "ingredientName": self.ingredient_names[row], "unit": self.ingredient_units[row],
+                "scientificDescription": self.ingredient_descriptions[row],
+            }
+            doc.update(zip(NUTRIENTS, map(_plain, self.ingredient_nutrients[row].tolist())))
+            docs[str(oid)] = doc
+        return docs
+
+    def chefs(self, ids):
+        # {str(id): {_id, user_name, user_avatar, version}}
+        return {
+            str(oid): {"_id": oid, "user_name": self.chef_names[row], "user_avatar": self.chef_avatars[row], "version": self.chef_versions[row]}
+            for oid, row in _find(self.chef_ids, ids).items()
+        }
+
+    def recipes(self, versions):
+        # versions: {recipe id: doc_version}, returns {id: card document} for
+        # the recipes stored at exactly that version
+        docs = {}
+        for oid, row in _find(self.recipe_ids, versions).items():
+            if self.recipe_versions[row] != versions[oid]:
+                continue
+            doc = loads(self.recipe_cards[row])
+            chef_id = self.recipe_chef_ids[row:row + 1].tobytes()
+            doc.update(_id=oid, chef_id=ObjectId(chef_id) if chef_id.strip(b"\0") else None)
+            docs[oid] = doc
+        return docs
+
+    def search_ingredients(self, text, limit=10):
+        # case insensitive substring match on the names, in _id order
+        needle = text.lower().encode("utf-8")
+        results, position = [], self._search_start
+        while needle and len(results) < limit:
+            found = self._map.find(needle, position, self._search_end)
+            if found < 0:
+                break
+            row = int(np.searchsorted(self._search_offsets, found - self._search_start, side="right")) - 1
+            oid = ObjectId(self.ingredient_ids[row:row + 1].tobytes())
+            results.append({"_id": oid, "name": self.ingredient_names[row], "unit": self.ingredient_units[row]})
+            position = self._search_start + int(self._search_offsets[row + 1])
+        return results
+
+
+_lock = threading.Lock()
+_snapshot = None
+_version = None
+_checked_at = 0.0
+_subscribed = False
+_build_requested = False
+# invalidation events newer than the loaded snapshot: per collection the
+# changed ids (time received) and the time of the last reset
+_changed = {}
+_reset = {}
+
+def request_build():
+    enqueue("build_catalog_snapshot", delay=BUILD_DELAY)
+
+def _on_change(event):
+    now = time.time()
+    with _lock:
+        if event.doc_id is None:
+            _reset[event.collection] = now
+        else:
+            _changed.setdefault(event.collection, {})[event.doc_id] = now
+    request_build()
+
+def _load(path):
+    # called with _lock held
+    global _snapshot
+    snapshot = Snapshot(path)
+    if _snapshot is None:
+        # changes made before this process subscribed produced no event
+        now = time.time()
+        for name, collection in SOURCES:
+            if collection_version(collection) != snapshot.versions.get(name):
+                _reset[name] = now
+    # events received after the build started may be missing from the file
+    for name in list(_changed):
+        _changed[name] = {doc_id: at for doc_id, at in _changed[name].items() if at >= snapshot.started_at}
+    for name in [name for name, at in _reset.items() if at < snapshot.started_at]:
+        del _reset[name]
+    if _reset:
+        request_build()
+    _snapshot = snapshot
+
+def current(snapshot_dir=SNAPSHOT_DIR):
+    # the newest snapshot on disk, None until one has been built or when
+    # changes are not followed (INVALIDATION_MODE=off)
+    global _version, _checked_at, _subscribed, _build_requested
+    if INVALIDATION_MODE == "off":
+        return None
+    if not _subscribed:
+        _subscribed = True
+        subscribe(_on_change, ("ingredients", "chefs", "recipes"))
+    now = time.monotonic()
+    if now - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _snapshot
+    with _lock:
+        _checked_at = now
+        try:
+            with open(os.path.join(snapshot_dir, "CURRENT")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            if not _build_requested:
+                _build_requested = True
+                request_build()
+            return _snapshot
+        if version != _version:
+            try:
+                _load(os.path.join(snapshot_dir, version))
+                _version = version
+            except (OSError, ValueError) as e:
+                # replaced again meanwhile or unreadable, retried at the next check
+                logger.warning("catalog snapshot %s not loaded: %s", version, e)
+        return _snapshot
+
+def _unchanged(name, ids):
+    with _lock:
+        if name in _reset:
+            return []
+        changed = _changed.get(name, {})
+        return [doc_id for doc_id in ids if doc_id not in changed]
+
+
+# Lookups, each returns what the snapshot can answer and the caller reads the
+# rest from MongoDB
+def chefs(ids):
+    # {str(id): {_id, user_name, user_avatar, version}}
+    snapshot = current()
+    if snapshot is None:
+        return {}
+    return snapshot.chefs(_unchanged("chefs", ids))
+
+def ingredients(ids, version):
+    # {str(id): document}, None unless the snapshot holds this catalog version
+    snapshot = current()
+    if snapshot is None or snapshot.versions.get("ingredients") != version:
+        return None
+    return snapshot.ingredients(ids)
+
+def recipe_cards(versions):
+    # {id: card document} for the recipes whose version matches
+    snapshot = current()
+    if snapshot is None:
+        return {}
+    return snapshot.recipes(versions)
+
+def search_ingredients(text, limit=10):
+    # autocomplete results, None while ingredients changed since the build
+    snapshot = current()
+    if snapshot is None:
+        return None
+    with _lock:
+        if "ingredients" in _reset or _changed.get("ingredients"):
+            return None
+    return snapshot.search_ingredients(text, limit)
+
+
+def _published_versions(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, "CURRENT")) as f:
+            return Snapshot(os.path.join(snapshot_dir, f.read().strip())).versions
+    except (OSError, ValueError):
+        return None
+
+@handler("build_catalog_snapshot")
+def build_catalog_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    # every worker enqueues a build for the same change: wait for a running
+    # build, then skip when the published file is already current
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, "build.lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        versions = {name: collection_version(collection) for name, collection in SOURCES}
+        if _published_versions(snapshot_dir) == versions:
+            return
+        build(snapshot_dir=snapshot_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory mapped catalog snapshot shared by the workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="write a new snapshot and publish it")
+    sub.add_parser("info", help="print what the current snapshot holds")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        path = build()
+        print(f"{os.path.getsize(path) / 1024:.0f} KB written to {path} in {time.perf_counter() - started:.2f}s")
+    else:
+        with open(os.path.join(SNAPSHOT_DIR, "CURRENT")) as f:
+            snapshot = Snapshot(os.path.join(SNAPSHOT_DIR, f.read().strip()))
+        print(snapshot.path)
+        print(f"built {time.time() - snapshot.built_at:.0f}s ago, {os.path.getsize(snapshot.path) / 1024:.0f} KB")
+        for name, count in snapshot.counts.items():
+            print(f"  {name}: {count} rows, version {snapshot.versions.get(name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime, timedelta, timezone
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from db import db
+
+# Deleted documents leave a tombstone so offline clients can drop them too.
+# Tombstones expire after a retention window: a client whose checkpoint is
+# older than that must start again from a full sync.
+tombstones_collection = db["tombstones"]
+TOMBSTONE_TTL_DAYS = int(os.getenv("SYNC_TOMBSTONE_TTL_DAYS", "30"))
+# max documents returned per collection in one sync page
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# a caught-up checkpoint is moved back by this many ms: a write stamped just
+# before the query started may only become visible after it ran
+SYNC_SAFETY_WINDOW_MS = int(os.getenv("SYNC_SAFETY_WINDOW_MS", "2000"))
+
+_indexes_ready = False
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    tombstones_collection.create_index(
+        [("deleted_at", ASCENDING)],
+        expireAfterSeconds=TOMBSTONE_TTL_DAYS * 86400
+    )
+    tombstones_collection.create_index([("collection", ASCENDING), ("deleted_at", ASCENDING)])
+    _indexes_ready = True
+
+
+def record_tombstone(collection_name, doc_id):
+    # call after deleting a synced document
+    _ensure_indexes()
+    tombstones_collection.update_one(
+        {"collection": collection_name, "doc_id": doc_id},
+        {"$currentDate": {"deleted_at": True}},
+        upsert=True
+    )
+
+def server_time():
+    # use the database clock for checkpoints, updated_at is set with $currentDate
+    return db.command("hello")["localTime"].replace(tzinfo=timezone.utc)
+
+def to_checkpoint(dt):
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def from_checkpoint(value):
+    # checkpoints are epoch milliseconds, returns None for a full sync
+    if value in (None, ""):
+        return None
+    return datetime.fromtimestamp(int(value) / 1000.0, tz=timezone.utc)
+
+def checkpoint_expired(since, now):
+    # tombstones older than the retention window are gone, a delta would miss deletions
+    return since is not None and now - since > timedelta(days=TOMBSTONE_TTL_DAYS)
+
+
+# A sync position per collection: (epoch ms, last _id or None, full).
+#   full=False: documents with updated_at >= ms, or after (ms, last _id) when
+#               a page ended there, so pages advance even when more than a
+#               page of documents share one millisecond (bulk writes)
+#   full=True:  full sync paged by _id (legacy documents may lack updated_at),
+#               ms is its start, the delta resumes from there afterwards
+# The client checkpoint is one position per collection joined by ".", or a
+# single ms value when every collection is caught up (the old format).
+def encode_checkpoint(positions):
+    if len(set(positions)) == 1 and positions[0][1] is None and not positions[0][2]:
+        return str(positions[0][0])
+    parts = []
+    for ms, last_id, full in positions:
+        part = ("f" if full else "") + str(ms)
+        parts.append(f"{part}-{last_id}" if last_id is not None else part)
+    return ".".join(parts)
+
+# datetime.max in epoch ms: later checkpoints cannot be converted
+MAX_CHECKPOINT_MS = 253402300799999
+
+def _checkpoint_ms(text):
+    ms = int(text)
+    if not 0 <= ms <= MAX_CHECKPOINT_MS:
+        raise ValueError("checkpoint out of range")
+    return ms
+
+def decode_checkpoint(value, count):
+    # None for a full sync from scratch, raises ValueError when malformed
+    if value in (None, ""):
+        return None
+    if "." not in value:
+        return [(_checkpoint_ms(value), None, False)] * count
+    parts = value.split(".")
+    if len(parts) != count:
+        raise ValueError("checkpoint does not match the synced collections")
+    positions = []
+    for part in parts:
+        full = part.startswith("f")
+        ms, _, last_id = part[1 if full else 0:].partition("-")
+        if last_id and not ObjectId.is_valid(last_id):
+            raise ValueError("invalid id in checkpoint")
+        positions.append((_checkpoint_ms(ms), ObjectId(last_id) if last_id else None, full))
+    return positions
+
+def changed_since(collection, position, now_ms, projection=None, limit=SYNC_PAGE_SIZE):
+    # returns (documents, next position, truncated); documents written at
+    # exactly a caught-up position are sent again, clients apply them idempotently
+    _ensure_indexes()
+    ms, last_id, full = position
+    if full:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        order = [("_id", ASCENDING)]
+    else:
+        since = from_checkpoint(ms)
+        if last_id is None:
+            query = {"updated_at": {"$gte": since}}
+        else:
+            query = {"$or": [{"updated_at": {"$gt": since}}, {"updated_at": since, "_id": {"$gt": last_id}}]}
+        order = [("updated_at", ASCENDING), ("_id", ASCENDING)]
+    docs = list(collection.find(query, projection).sort(order).limit(limit + 1))
+    truncated = len(docs) > limit
+    docs = docs[:limit]
+    if truncated:
+        last = docs[-1]
+        position = (ms, last["_id"], True) if full else (to_checkpoint(last["updated_at"]), last["_id"], False)
+    else:
+        # caught up: a finished full sync continues from its start, the
+        # documents of the safety window are sent again next time
+        position = ((ms if full else now_ms) - SYNC_SAFETY_WINDOW_MS, None, False)
+    return docs, position, truncated
+
+def deleted_since(collection_name, since):
+    if since is None:
+        # a full sync replaces the client store, no tombstones needed
+        return []
+    _ensure_indexes()
+    cursor = tombstones_collection.find(
+        {"collection": collection_name, "deleted_at": {"$gte": since}},
+        {"doc_id": 1}
+    )
+    return [t["doc_id"] for t in cursor]
@@ -0,0 +1,59 @@
+from bson.objectid import ObjectId
+from db import new_revision_fields
+
+# Validation rules shared by the API (api_create_recipe) and the bulk importer
+
+class ValidationError(Exception):
+    pass
+
+def safe_objectid(id_val):
+    try:
+        return ObjectId(id_val) if isinstance(id_val, str) else id_val
+    except:
+        return None
+
+def validate_recipe(data):
+    # raises ValidationError with the message returned to the client,
+    # returns the normalized difficulty
+    if not data.get('title'):
+        raise ValidationError('Title is required')
+    if not data.get('image'):
+        raise ValidationError('Cover image is required')
+    if not data.get('ingredients') or len(data['ingredients']) == 0:
+        raise ValidationError('At least one ingredient is required')
+    if not data.get('preparationSteps') or len(data['preparationSteps']) == 0:
+        raise ValidationError('At least one preparation step is required')
+
+    # validate difficulty is between 1 and 5
+    try:
+        difficulty_val = int(data.get('difficulty', 3))
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid difficulty value')
+    if difficulty_val < 1 or difficulty_val > 5:
+        raise ValidationError('Difficulty must be between 1 and 5')
+    return difficulty_val
+
+def build_recipe_doc(data, chef_id, difficulty_val):
+    # build the recipe document stored in mongodb from a validated payload
+    recipe_doc = {
+        'title': data.get('title', ''),
+        'description': data.get('description', ''),
+        'image': data.get('image', ''),
+        'time': data.get('time', ''),
+        'difficulty': difficulty_val,
+        'tags': data.get('tags', []),
+        'ingredients': [],
+        'preparationSteps': data.get('preparationSteps', []),
+        'chef_id': ObjectId(chef_id),
+        'ratings': [],
+        **new_revision_fields()
+    }
+
+    # convert ingredient-id to objectid
+    for ing in data.get('ingredients', []):
+        ing_id = safe_objectid(ing.get('ingredient-id'))
+        recipe_doc['ingredients'].append({
+            'quantity': ing.get('quantity', ''),
+            'ingredientId': ing_id
+        })
+    return recipe_doc
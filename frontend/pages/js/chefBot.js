@@ -129,7 +129,7 @@ const ChefBot = (function () {
         const resp = await fetch("/set_recipe", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify(currentRecipe),
+            body: JSON.stringify({ recipe_id: currentRecipe._id }),
         });
 
         if (!resp.ok) throw new Error("HTTP " + resp.status);
@@ -161,7 +161,11 @@ document.addEventListener("DOMContentLoaded", async () => {
         }
     } else {
         try {
-            const res = await fetch("/api/session");
+            // session and own chef data (with recipe cards) in one parallel round trip
+            const [res, batchRes] = await Promise.all([
+                fetch("/api/session"),
+                fetch("/api/batch?chefs=me&chef_recipes=true&recipe_fields=title,image,rating,time,difficulty,user_name,user_avatar")
+            ]);
             if (!res.ok) return (window.location.href = "/login");
 
             const session = await res.json();
@@ -186,10 +190,13 @@ document.addEventListener("DOMContentLoaded", async () => {
             const recipesGrid = document.querySelector(".recipes-grid");
             if (session.user_id) {
                 try {
-                    // fetch the chef data with include_recipes=true using the session user_id
-                    const chefRes = await fetch(`/api/chefs/${session.user_id}?include_recipes=true`);
-                    if (chefRes.ok) {
-                        chefDataForInfo = await chefRes.json();
+                    // chef data resolved by /api/batch for the session user
+                    const batch = batchRes.ok ? await batchRes.json() : null;
+                    if (batch && batch.chefs && batch.chefs.me) {
+                        chefDataForInfo = batch.chefs.me;
+                        chefDataForInfo.recipes = (chefDataForInfo.recipes || [])
+                            .map((recipeId) => batch.recipes[recipeId])
+                            .filter(Boolean);
 
                         // store for later use in info tab population
                         chefDataToUse = chefDataForInfo;
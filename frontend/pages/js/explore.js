@@ -10,9 +10,6 @@ let tempFilters = {
     category: activeFilters.category
 };
 
-// Current search results (raw data from API)
-let currentSearchResults = [];
-
 // User role for recipe card visibility
 let userRole = null;
 
@@ -86,80 +83,76 @@ function syncModalUI() {
     });
 }
 
-// Parse time string to number ("30 min" to 30, "1 hour" to 60)
-function parseTimeToMinutes(timeStr) {
-    if (!timeStr || typeof timeStr !== 'string') return null;
-    
-    const timeStr_lower = timeStr.toLowerCase().trim();
-    
-    // Try to extract number and unit
-    const match = timeStr_lower.match(/(\d+)\s*(h|hour|hr|m|min|minute)/);
-    if (!match) return null;
-    
-    const value = parseInt(match[1]);
-    const unit = match[2];
-    
-    if (unit.includes('h')) {
-        return value * 60; // Convert hours to minutes
-    } else {
-        return value; // Already in minutes
+// Recipes per page requested from /api/explore
+const PAGE_SIZE = 48;
+
+// Current search state (query text and last page loaded)
+let currentQuery = '';
+let currentPage = 1;
+
+// Build /api/explore query string from the search text and active filters
+function buildExploreParams(page) {
+    const params = new URLSearchParams();
+    if (currentQuery) params.set('q', currentQuery);
+    // hidden filter for logged-in chefs
+    if (activeFilters.chefId !== null) params.set('chef_id', activeFilters.chefId);
+    // slider max value (61) means no time limit
+    if (activeFilters.maxTime !== null && activeFilters.maxTime <= 60) {
+        params.set('max_time', activeFilters.maxTime);
     }
+    if (activeFilters.category !== 'All') params.set('tags', activeFilters.category.toLowerCase());
+    params.set('page', page);
+    params.set('page_size', PAGE_SIZE);
+    return params;
 }
 
-// Apply filters to currentSearchResults and render
-function applyFilters() {
-    console.log('Applying filters:', activeFilters);
-    
+// True when there is something to search for
+function hasActiveSearch() {
+    return currentQuery !== '' ||
+        activeFilters.category !== 'All' ||
+        (activeFilters.maxTime !== null && activeFilters.maxTime <= 60);
+}
+
+// Show how many recipes each category pill would return
+function updateCategoryCounts(facets) {
+    const tagCounts = (facets && facets.tags) || {};
+    let total = 0;
+    Object.values(tagCounts).forEach(count => { total += count; });
+
+    document.querySelectorAll('.pill-item').forEach(pillItem => {
+        const category = pillItem.querySelector('.category-label')?.textContent.trim();
+        if (!category) return;
+        let badge = pillItem.querySelector('.category-count');
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'category-count';
+            pillItem.appendChild(badge);
+        }
+        const count = category === 'All' ? null : (tagCounts[category.toLowerCase()] || 0);
+        badge.textContent = count === null ? '' : count;
+    });
+}
+
+// Render a page of results, appending when loading more
+function renderResults(data, append) {
     const grid = document.getElementById('recipes-grid');
     if (!grid) {
         console.error('Grid not found');
         return;
     }
-    
-    // Start with current search results
-    let filteredRecipes = [...currentSearchResults];
-    
-    // Filter by chef_id (hidden filter for logged-in chefs)
-    if (activeFilters.chefId !== null) {
-        filteredRecipes = filteredRecipes.filter(recipe => {
-        return recipe.chef_id === activeFilters.chefId;
-        });
-        console.log(`After chef filter: ${filteredRecipes.length} recipes`);
-    }
-    
-    // Filter by maxTime
-    if (activeFilters.maxTime !== null) {
-        filteredRecipes = filteredRecipes.filter(recipe => {
-        const recipeTime = parseTimeToMinutes(recipe.time || recipe.cooking_time || recipe.duration || '');
-        if (recipeTime === null) return true; // Include if we can't parse
-        return recipeTime <= activeFilters.maxTime;
-        });
-        console.log(`After time filter: ${filteredRecipes.length} recipes`);
-    }
-    
-    // Filter by category
-    if (activeFilters.category !== 'All') {
-        filteredRecipes = filteredRecipes.filter(recipe => {
-        const tags = recipe.tags || [];
-        return tags.some(tag => 
-            tag.toLowerCase() === activeFilters.category.toLowerCase()
-        );
-        });
-        console.log(`After category filter: ${filteredRecipes.length} recipes`);
-    }
-    
-    // Clear grid
-    grid.innerHTML = '';
-    
+
+    if (!append) grid.innerHTML = '';
+    grid.querySelector('.load-more-btn')?.remove();
+
     // Show message if no results
-    if (filteredRecipes.length === 0) {
+    if (data.total === 0) {
         grid.innerHTML = '<div class="no-results" style="grid-column: 1/-1; text-align: center; padding: 40px; color: #999;">Nessun risultato con questi filtri</div>';
         return;
     }
-    
-    // Render filtered recipes using RecipeCard module
+
+    // Render recipes using RecipeCard module
     const frag = document.createDocumentFragment();
-    filteredRecipes.forEach(recipe => {
+    data.results.forEach(recipe => {
         try {
         const card = RecipeCard.createCardElement(recipe, userRole);
         frag.appendChild(card);
@@ -168,8 +161,40 @@ function applyFilters() {
         }
     });
     grid.appendChild(frag);
-    
-    console.log(`Rendered ${filteredRecipes.length} recipes`);
+
+    // More pages available
+    if (data.page * data.page_size < data.total) {
+        const moreBtn = document.createElement('button');
+        moreBtn.className = 'load-more-btn';
+        moreBtn.textContent = 'Load more';
+        moreBtn.addEventListener('click', () => applyFilters(currentPage + 1));
+        grid.appendChild(moreBtn);
+    }
+
+    console.log(`Rendered page ${data.page} (${data.total} recipes in total)`);
+}
+
+// Query /api/explore with the search text and active filters and render.
+// Filtering, sorting and facet counts are computed server side.
+async function applyFilters(page = 1) {
+    console.log('Applying filters:', activeFilters);
+
+    if (!hasActiveSearch()) {
+        const grid = document.getElementById('recipes-grid');
+        if (grid) grid.innerHTML = '';
+        return;
+    }
+
+    try {
+        const res = await fetch(`/api/explore?${buildExploreParams(page).toString()}`);
+        if (!res.ok) return;
+        const data = await res.json();
+        currentPage = data.page;
+        renderResults(data, page > 1);
+        updateCategoryCounts(data.facets);
+    } catch (e) {
+        console.error('Explore error', e);
+    }
 }
 
 // Update slider label with formatted time
@@ -285,50 +310,15 @@ function debounce(fn, wait) {
     };
 }
 
-// Setup search input listener to fetch /api/search and render into recipes-grid
+// Setup search input listener to query /api/explore and render into recipes-grid
 window.addEventListener('DOMContentLoaded', () => {
     const input = document.querySelector('.search-input');
-    const grid = document.getElementById('recipes-grid');
-    if (!input || !grid) return;
-
-    // small helper to prevent XSS when injecting the search term
-    function escapeHtml(unsafe) {
-        return String(unsafe)
-        .replace(/&/g, '&amp;')
-        .replace(/</g, '&lt;')
-        .replace(/>/g, '&gt;')
-        .replace(/"/g, '&quot;')
-        .replace(/'/g, '&#039;');
-    }
+    if (!input) return;
 
     const doSearch = async () => {
-        const q = input.value.trim();
-        // clear grid immediately
-        grid.innerHTML = '';
-        if (!q) return; // API returns [] for empty query
-
-        try {
-            const res = await fetch(`/api/search?q=${encodeURIComponent(q)}`);
-            if (!res.ok) return;
-            const data = await res.json();
-            if (!Array.isArray(data)) return;
-
-            // Save results to global variable
-            currentSearchResults = data;
-            console.log(`Search returned ${data.length} results`);
-
-            // If no results, show a friendly message
-            if (data.length === 0) {
-                const escaped = escapeHtml(q);
-                grid.innerHTML = `<div class="no-results">No results for "${escaped}"</div>`;
-                return;
-            }
-
-            // Apply filters to render the data
-            applyFilters();
-        } catch (e) {
-        console.error('Search error', e);
-        }
+        currentQuery = input.value.trim();
+        // filters and facet counts are applied by /api/explore
+        await applyFilters();
     };
 
     const debouncedSearch = debounce(doSearch, 300);
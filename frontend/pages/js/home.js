@@ -69,7 +69,9 @@ async function loadRecipes(apiUrl = '/api/recipes') {
             throw new Error(`HTTP ${response.status}`);
         }
         
-        allRecipes = (await response.json()) || [];
+        // leaderboard endpoints return a page object
+        const data = await response.json();
+        allRecipes = (Array.isArray(data) ? data : data && data.results) || [];
         
         renderRecipes(allRecipes);
     } catch (error) {
@@ -139,6 +141,15 @@ document.addEventListener('DOMContentLoaded', async () => {
         });
     }
 
+    // leaderboard tabs (trending, top rated)
+    tabArray.filter(btn => btn.dataset.api).forEach(btn => {
+        btn.addEventListener('click', () => {
+            tabArray.forEach(b => b.classList.remove('active'));
+            btn.classList.add('active');
+            loadRecipes(btn.dataset.api);
+        });
+    });
+
     // scroll controls for category pills
     const scrollLeftBtn = document.getElementById('scrollLeft');
     const scrollRightBtn = document.getElementById('scrollRight');
@@ -62,6 +62,18 @@ function updateCommentFormVisibility() {
     }
 }
 
+// Recipe, session and bookmark state inlined by the server, null on the static page
+function readInitialData() {
+    const el = document.getElementById('initial-data');
+    if (!el) return null;
+    try {
+        return JSON.parse(el.textContent);
+    } catch (error) {
+        console.error('Error reading initial data:', error);
+        return null;
+    }
+}
+
 // Load recipe data from API and populate page
 async function loadRecipe() {
     const recipeId = getRecipeIdFromUrl();
@@ -69,6 +81,16 @@ async function loadRecipe() {
         return;
     }
 
+    // Prerendered page: rebuild from the inlined data (attaches the handlers), no round trips
+    const initial = readInitialData();
+    if (initial && initial.recipe) {
+        sessionData = initial.session || sessionData;
+        updateCommentFormVisibility();
+        populateRecipePage(initial.recipe);
+        updateBookmarkButtonAppearance(Boolean(initial.is_favorited));
+        return;
+    }
+
     // Load session data first
     await loadSessionData();
 
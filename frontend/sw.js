@@ -1,8 +1,12 @@
-const CACHE_NAME = 'tk-cache-v1';
-const DATA_CACHE_NAME = 'tk-data-v1';
+// Precache manifest generated by `python assets.py build` (hashed JS/CSS)
+try {
+  importScripts('/dist/precache-manifest.js');
+} catch (error) {
+  console.warn('SW: no precache manifest, using the default list');
+}
 
 // Critical resources to download on first load
-const urlsToCache = [
+const DEFAULT_URLS_TO_CACHE = [
   '/',
   '/manifest.json',
   
@@ -24,7 +28,14 @@ const urlsToCache = [
   '/assets/logo2.svg',
 ];
 
-const EXCLUDE_FROM_SWR = ['/api/session', '/login', '/register'];
+const PRECACHE = self.__PRECACHE_MANIFEST || { version: 'v1', urls: DEFAULT_URLS_TO_CACHE };
+// The cache name follows the build version, so a deploy only replaces the app shell when assets changed
+const CACHE_NAME = 'tk-cache-' + PRECACHE.version;
+const DATA_CACHE_NAME = 'tk-data-v1';
+const urlsToCache = PRECACHE.urls;
+
+// /api/batch may resolve "me" from the session, never serve it stale
+const EXCLUDE_FROM_SWR = ['/api/session', '/api/sync', '/api/batch', '/login', '/register'];
 
 // Download essentials on first load
 self.addEventListener('install', event => {
@@ -52,7 +63,9 @@ self.addEventListener('activate', event => {
           }
         })
       );
-    })
+    }).then(() => syncCatalog().catch(error => {
+      console.warn('SW: catalog sync failed', error);
+    }))
   );
 });
 
@@ -61,11 +74,133 @@ self.addEventListener('message', event => {
   if (event.data && event.data.type === 'SKIP_WAITING') {
     self.skipWaiting();
   }
+  if (event.data && event.data.type === 'SYNC') {
+    event.waitUntil(syncCatalog().catch(error => {
+      console.warn('SW: catalog sync failed', error);
+    }));
+  }
+});
+
+// Periodic background sync (where supported)
+self.addEventListener('periodicsync', event => {
+  if (event.tag === 'tk-catalog-sync') {
+    event.waitUntil(syncCatalog());
+  }
 });
 
 
+// OFFLINE CATALOG: IndexedDB store kept up to date with /api/sync deltas
+const SYNC_DB_NAME = 'tk-catalog';
+const SYNC_DB_VERSION = 1;
+const SYNC_STORES = ['recipes', 'chefs', 'ingredients'];
+
+function openCatalogDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(SYNC_DB_NAME, SYNC_DB_VERSION);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            SYNC_STORES.forEach(name => {
+                if (!db.objectStoreNames.contains(name)) {
+                    db.createObjectStore(name, { keyPath: '_id' });
+                }
+            });
+            if (!db.objectStoreNames.contains('meta')) {
+                db.createObjectStore('meta');
+            }
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function idbRequest(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Apply one delta page in a single transaction
+function applyDelta(db, delta) {
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(SYNC_STORES.concat('meta'), 'readwrite');
+        SYNC_STORES.forEach(name => {
+            const store = tx.objectStore(name);
+            const changes = delta[name] || { updated: [], deleted: [] };
+            // the first page of a full sync replaces the whole store
+            if (delta.full) store.clear();
+            changes.updated.forEach(doc => store.put(doc));
+            changes.deleted.forEach(id => store.delete(id));
+        });
+        tx.objectStore('meta').put(delta.checkpoint, 'checkpoint');
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+let syncInProgress = null;
+
+// Pull deltas since the stored checkpoint until the server has nothing more
+async function syncCatalog() {
+    if (syncInProgress) return syncInProgress;
+    syncInProgress = (async () => {
+        const db = await openCatalogDb();
+        try {
+            let hasMore = true;
+            while (hasMore) {
+                const checkpoint = await idbRequest(
+                    db.transaction('meta').objectStore('meta').get('checkpoint')
+                );
+                // opaque position per collection, the server pages through bulk writes
+                const url = checkpoint ? `/api/sync?since=${encodeURIComponent(checkpoint)}` : '/api/sync';
+                const response = await fetch(url, { cache: 'no-store' });
+                if (!response.ok) throw new Error('HTTP ' + response.status);
+                const delta = await response.json();
+                await applyDelta(db, delta);
+                hasMore = delta.has_more;
+            }
+        } finally {
+            db.close();
+        }
+    })();
+    try {
+        return await syncInProgress;
+    } finally {
+        syncInProgress = null;
+    }
+}
+
+// Build an API response from the offline catalog (used when offline and uncached)
+async function catalogResponse(pathname) {
+    const db = await openCatalogDb();
+    try {
+        const store = db.transaction('recipes').objectStore('recipes');
+        let body = null;
+        if (pathname === '/api/recipes') {
+            body = await idbRequest(store.getAll());
+        } else {
+            const match = pathname.match(/^\/api\/recipes\/([0-9a-f]{24})$/);
+            if (match) body = await idbRequest(store.get(match[1]));
+        }
+        if (!body) return null;
+        return new Response(JSON.stringify(body), {
+            headers: { 'Content-Type': 'application/json' }
+        });
+    } finally {
+        db.close();
+    }
+}
+
+
 // ROUTING: Apply caching strategy by URL
 
+// Copy request headers adding a conditional header
+function withHeader(headers, name, value) {
+    const copy = new Headers(headers);
+    copy.set(name, value);
+    return copy;
+}
+
 // STRATEGY 2: STALE WHILE REVALIDATE (SWR)
 async function staleWhileRevalidate(request) {
     try {
@@ -73,8 +208,13 @@ async function staleWhileRevalidate(request) {
         const cachedResponse = await cache.match(request);
         
         if (cachedResponse) {
-            // Fetch and update in background
-            fetch(request).then(response => {
+            // Revalidate in background: send the cached ETag so an unchanged
+            // resource comes back as an empty 304 instead of the full body
+            const etag = cachedResponse.headers.get('ETag');
+            const revalidateRequest = etag
+                ? new Request(request, { headers: withHeader(request.headers, 'If-None-Match', etag) })
+                : request;
+            fetch(revalidateRequest).then(response => {
                 if (response && response.status === 200 && response.type === 'basic') {
                     cache.put(request, response.clone());
                 }
@@ -92,6 +232,9 @@ async function staleWhileRevalidate(request) {
         return response;
     } catch (error) {
         console.warn('SW: error in staleWhileRevalidate for', request.url, error);
+        // Offline and not cached: fall back to the synced catalog
+        const offline = await catalogResponse(new URL(request.url).pathname).catch(() => null);
+        if (offline) return offline;
         throw error;
     }
 }